@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,11 +42,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 请求延迟与SQL统计(见courses/metrics.py)，放在最前面以覆盖其余中间件
+    "courses.middleware.MetricsMiddleware",
+    "courses.middleware.ReplicaStickinessMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # 管理员按需请求性能分析(见courses/profiling.py)，需在认证中间件之后
+    "courses.middleware.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -56,8 +62,18 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # 显式使用缓存模板加载器：模板只编译一次，之后复用编译结果
+            # (DEBUG下Django的自动重载会在模板文件变化时清空缓存)
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "django.template.loaders.filesystem.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                ),
+            ],
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
@@ -77,7 +93,157 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # 写锁被占用时最多等待的秒数(SQLite busy timeout)，配合选课服务的退避重试
+            "timeout": 20,
+        },
+    }
+}
+
+# SQLite生产模式(环境变量COURSES_SQLITE_PRODUCTION=1开启，可用bench_sqlite命令对比开启前后)
+# - 每个连接执行PRAGMA：WAL日志(读写互不阻塞)、busy_timeout、synchronous=NORMAL
+#   (WAL下仍保证一致性，只在断电时可能丢失最后几个事务)、内存映射与页缓存
+# - 持久连接(CONN_MAX_AGE)，省去每个请求打开数据库文件与执行PRAGMA的开销
+# - 写事务使用BEGIN IMMEDIATE：事务开始即取得写锁，避免读事务升级为写事务时
+#   立即返回"database is locked"(此时busy_timeout不生效)
+# - 只读别名readonly以mode=ro打开同一文件，供只读页面使用(见courses/routers.py)
+COURSES_SQLITE_PRODUCTION = os.environ.get("COURSES_SQLITE_PRODUCTION") == "1"
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA busy_timeout=20000;"
+    "PRAGMA cache_size=-65536;"
+    "PRAGMA mmap_size=268435456;"
+    "PRAGMA temp_store=MEMORY;"
+)
+
+if COURSES_SQLITE_PRODUCTION:
+    DATABASES["default"].update({
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+    })
+    DATABASES["default"]["OPTIONS"].update({
+        "init_command": SQLITE_PRAGMAS,
+        "transaction_mode": "IMMEDIATE",
+    })
+    DATABASES["readonly"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "uri": True,
+            "timeout": 20,
+            # 只读连接不能修改journal_mode，其余PRAGMA照常生效
+            "init_command": "PRAGMA query_only=1;PRAGMA cache_size=-65536;PRAGMA mmap_size=268435456;",
+        },
+        # 测试时指向default的测试库
+        "TEST": {"MIRROR": "default"},
     }
+
+# 只读副本(环境变量COURSES_REPLICA_DBS为逗号分隔的SQLite文件路径，依次配置为replica1、replica2…)
+# 课程与选课记录的读查询分流到副本，写入走主库；刚写入的客户端在
+# COURSES_REPLICA_STICKY_SECONDS秒内读主库(见courses/routers.py)。
+# 本地用两个SQLite文件模拟主从时，用sync_replica命令把主库复制到副本
+COURSES_REPLICA_ALIASES = []
+for index, path in enumerate(filter(None, os.environ.get("COURSES_REPLICA_DBS", "").split(",")), 1):
+    alias = f"replica{index}"
+    DATABASES[alias] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": path.strip(),
+        "OPTIONS": {"timeout": 20},
+        "TEST": {"MIRROR": "default"},
+    }
+    COURSES_REPLICA_ALIASES.append(alias)
+# 读己之写窗口，应大于副本的复制延迟
+COURSES_REPLICA_STICKY_SECONDS = 10
+
+DATABASE_ROUTERS = []
+if COURSES_REPLICA_ALIASES:
+    DATABASE_ROUTERS.append("courses.routers.ReplicaRouter")
+if COURSES_SQLITE_PRODUCTION:
+    DATABASE_ROUTERS.append("courses.routers.ReadOnlyRouter")
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# 课程目录与选课状态缓存(见courses/cache.py)。本地开发使用进程内缓存；
+# 多进程部署时应改为Redis/Memcached等共享后端，并在后端配置内存上限与淘汰策略
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "courses",
+        "TIMEOUT": 300,
+        "OPTIONS": {
+            # 条目数上限，超过后按LRU淘汰1/CULL_FREQUENCY的条目，内存占用有界
+            "MAX_ENTRIES": 20000,
+            "CULL_FREQUENCY": 4,
+        },
+    }
+}
+
+# courses应用使用的缓存别名
+COURSES_CACHE_ALIAS = "default"
+
+# 选课、退课与购物车接口的滑动窗口限流(见courses/ratelimit.py)，计数器保存在上面的缓存中；
+# 进程内缓存下每个工作进程各有一份限额，多进程部署须改用共享缓存(check --deploy会给出警告)
+# - user: 每名学生任意period秒内最多limit次
+# - global: 所有学生合计任意period秒内最多limit次，限制高峰期数据库的写入量
+# lease为每个工作进程一次从缓存租用的令牌数；设为None关闭限流
+COURSES_RATE_LIMITS = {
+    "user": {"limit": 10, "period": 10, "lease": 2},
+    "global": {"limit": 200, "period": 1, "lease": 10},
+}
+
+# 首页、课程列表、我的课程是否使用原生异步视图(courses/async_views.py)
+# 仅在ASGI部署下有收益；WSGI下异步视图需要额外的线程切换，应保持关闭
+COURSES_ASYNC_VIEWS = False
+
+# 超过该耗时(秒)的请求连同其SQL写入courses.slow日志
+COURSES_SLOW_REQUEST_SECONDS = 1.0
+
+# /metrics/接口的访问令牌(Authorization: Bearer <token>)，供Prometheus抓取使用；
+# 未携带正确令牌时只有已登录的管理员可以访问
+COURSES_METRICS_TOKEN = os.environ.get("COURSES_METRICS_TOKEN", "")
+# 显式关闭/metrics/的访问控制(仅在该接口只对内网暴露时开启)
+COURSES_METRICS_PUBLIC = os.environ.get("COURSES_METRICS_PUBLIC") == "1"
+
+
+# 是否启用按需请求性能分析(X-Profile: 1 或 ?_profile=1，仅管理员)；关闭时中间件不加载
+# 默认关闭，需要时设置环境变量COURSES_PROFILING=1开启
+COURSES_PROFILING = os.environ.get("COURSES_PROFILING") == "1"
+# 性能分析结果(pstats与文本报告)的保存目录
+COURSES_PROFILE_DIR = BASE_DIR / "profiles"
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.2/topics/logging/
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "verbose": {
+            "format": "{asctime} {levelname} {name} {message}",
+            "style": "{",
+        },
+    },
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+            "formatter": "verbose",
+        },
+    },
+    "loggers": {
+        # 慢请求日志(含SQL)
+        "courses.slow": {
+            "handlers": ["console"],
+            "level": "WARNING",
+            "propagate": False,
+        },
+    },
 }
 
 
@@ -1,5 +1,214 @@
-from django.contrib import admin
-from .models import Course, Enrollment
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 
-admin.site.register(Course)
-admin.site.register(Enrollment)
\ No newline at end of file
+from . import bulk
+from .models import Completion, Course, CourseSlot, Enrollment, WaitlistEntry
+from .prerequisites import PrerequisiteCycleError, validate_prerequisites
+from .services import EnrollStatus, promote_waitlist
+
+# 未筛选的列表超过该行数时，分页使用表行数估计值而不是COUNT(*)
+ESTIMATE_THRESHOLD = 100_000
+
+
+def estimated_row_count(model, using):
+    """
+    读取表行数估计值，不扫描整张表
+    - PostgreSQL: 统计信息中的reltuples
+    - SQLite: 最大rowid(主键索引上的一次查找；删除过的行会使估计值偏大)
+    其他数据库返回None
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'SELECT MAX(_rowid_) FROM {connection.ops.quote_name(table)}')
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    大表分页器
+    没有筛选条件且估计行数超过ESTIMATE_THRESHOLD时，总数使用估计值；
+    有筛选条件(搜索、过滤)或表较小时仍执行精确的COUNT
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """大表的公共配置：估计总数分页，不额外查询未筛选时的总行数"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class CourseActionForm(ActionForm):
+    capacity = forms.IntegerField(required=False, min_value=0, label="新容量")
+
+
+class EnrollmentActionForm(ActionForm):
+    target_course = forms.IntegerField(required=False, min_value=1, label="目标课程ID")
+
+
+def _action_value(modeladmin, request, field):
+    """读取动作表单中附加字段的值，缺失或不合法时提示错误并返回None"""
+    form = modeladmin.action_form(request.POST)
+    form.fields['action'].choices = modeladmin.get_action_choices(request)
+    value = form.cleaned_data.get(field) if form.is_valid() else None
+    if value is None:
+        modeladmin.message_user(
+            request, f"请先填写“{form.fields[field].label}”", level=messages.ERROR
+        )
+    return value
+
+
+class CourseForm(forms.ModelForm):
+    class Meta:
+        model = Course
+        fields = '__all__'
+
+    def clean_prerequisites(self):
+        """先修课程不能直接或间接要求先修本课程"""
+        prerequisites = self.cleaned_data['prerequisites']
+        try:
+            validate_prerequisites(self.instance.pk, [course.pk for course in prerequisites])
+        except PrerequisiteCycleError as exc:
+            raise forms.ValidationError(exc.messages)
+        return prerequisites
+
+
+class CourseSlotInline(admin.TabularInline):
+    model = CourseSlot
+    extra = 1
+
+
+@admin.register(Course)
+class CourseAdmin(LargeTableAdmin):
+    form = CourseForm
+    list_display = ('name', 'teacher', 'capacity', 'enrolled_count', 'waiting_count', 'updated_at')
+    search_fields = ('name', 'teacher')
+    ordering = ('name', 'id')
+    readonly_fields = ('enrolled_count', 'created_at', 'updated_at')
+    autocomplete_fields = ('prerequisites',)
+    inlines = (CourseSlotInline,)
+    action_form = CourseActionForm
+    actions = ('change_capacity',)
+
+    def get_queryset(self, request):
+        """
+        候补人数以相关子查询标注：只对当前页的课程在(course, position)索引上计数，
+        不对整张候补表做GROUP BY；已选人数直接读取冗余字段
+        """
+        waiting = (
+            WaitlistEntry.objects.filter(course=OuterRef('pk'))
+            .order_by()
+            .values('course')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return super().get_queryset(request).annotate(waiting=Coalesce(Subquery(waiting), Value(0)))
+
+    @admin.display(description="候补人数", ordering='waiting')
+    def waiting_count(self, obj):
+        return obj.waiting
+
+    @admin.action(description="修改所选课程的容量")
+    def change_capacity(self, request, queryset):
+        capacity = _action_value(self, request, 'capacity')
+        if capacity is None:
+            return
+        updated, skipped = bulk.set_capacity(queryset, capacity)
+        self.message_user(request, f"已将 {updated} 门课程的容量改为 {capacity}")
+        if skipped:
+            self.message_user(
+                request, f"{skipped} 门课程的已选人数超过 {capacity}，未修改", level=messages.WARNING
+            )
+
+    def save_model(self, request, obj, form, change):
+        """
+        保存课程
+        在后台调大容量后，提交事务时为新增的名额递补候补学生
+        """
+        super().save_model(request, obj, form, change)
+        if change and 'capacity' in form.changed_data:
+            transaction.on_commit(lambda: promote_waitlist(obj.pk))
+
+
+def _usernames(student_ids, limit=20):
+    """消息中列出的学生用户名(最多limit个)"""
+    names = sorted(User.objects.filter(pk__in=student_ids[:limit]).values_list('username', flat=True))
+    more = f" 等{len(student_ids)}人" if len(student_ids) > limit else ""
+    return "、".join(names) + more
+
+
+@admin.register(Enrollment)
+class EnrollmentAdmin(LargeTableAdmin):
+    list_display = ('student', 'course', 'enrolled_at')
+    # 学生与课程随列表一次JOIN取出，__str__与列显示不再逐行查询
+    list_select_related = ('student', 'course')
+    # 学生用户名精确匹配(走唯一索引)，课程名称模糊匹配
+    search_fields = ('=student__username', 'course__name')
+    autocomplete_fields = ('student', 'course')
+    action_form = EnrollmentActionForm
+    actions = ('move_to_course',)
+
+    @admin.action(description="把所选学生转到目标课程")
+    def move_to_course(self, request, queryset):
+        target_course = _action_value(self, request, 'target_course')
+        if target_course is None:
+            return
+        result = bulk.move_enrollments(queryset, target_course)
+        if result.status == EnrollStatus.NOT_FOUND:
+            self.message_user(request, f"课程 {target_course} 不存在", level=messages.ERROR)
+            return
+        if result.status == EnrollStatus.FULL:
+            self.message_user(request, "目标课程剩余名额不足，未转移任何学生", level=messages.ERROR)
+            return
+        self.message_user(request, f"已转移 {result.moved} 名学生")
+        if result.skipped:
+            self.message_user(
+                request, f"{result.skipped} 条记录已在目标课程中，已跳过", level=messages.WARNING
+            )
+        for student_ids, reason in ((result.prerequisites, "未修完目标课程的先修课程"),
+                                    (result.conflicts, "与目标课程时间冲突")):
+            if student_ids:
+                self.message_user(
+                    request, f"{len(student_ids)} 名学生{reason}，未转移：{_usernames(student_ids)}",
+                    level=messages.WARNING,
+                )
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(LargeTableAdmin):
+    list_display = ('student', 'course', 'position', 'created_at')
+    list_select_related = ('student', 'course')
+    search_fields = ('=student__username', 'course__name')
+    autocomplete_fields = ('student', 'course')
+    ordering = ('course', 'position')
+
+
+@admin.register(Completion)
+class CompletionAdmin(LargeTableAdmin):
+    list_display = ('student', 'course', 'completed_at')
+    list_select_related = ('student', 'course')
+    search_fields = ('=student__username', 'course__name')
+    autocomplete_fields = ('student', 'course')
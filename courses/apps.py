@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoursesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "courses"
+
+    def ready(self):
+        # 注册信号处理函数(选课计数维护等)
+        from . import signals  # noqa: F401
+        # 注册部署检查
+        from . import checks  # noqa: F401
@@ -0,0 +1,89 @@
+"""
+只读页面的原生异步实现(课程列表、我的课程、首页)
+供ASGI部署使用(settings.COURSES_ASYNC_VIEWS = True)：
+视图直接在事件循环中运行，使用异步ORM、异步缓存与异步用户认证，
+模板与页面行为和views.py中的同步版本完全一致
+"""
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render
+
+from . import cache as catalog_cache
+from .fragments import acourse_cards
+from .pagination import akeyset_paginate
+from .prerequisites import amissing_prerequisites
+from .routers import read_only_view
+from .views import _catalog_filters, _course_list_context, _my_courses_querysets
+
+
+async def _resolve_user(request):
+    """
+    异步读取当前用户并替换request.user
+    模板上下文处理器访问request.user时不会再触发同步的数据库查询
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+async def _catalog_page(request):
+    """views._catalog_page的异步版本"""
+    filters, courses = _catalog_filters(request.GET)
+    cursor = request.GET.get('cursor')
+
+    async def load():
+        page = await akeyset_paginate(courses, filters['order'], cursor)
+        return page.items, page.next_cursor
+
+    if 'free' in filters:
+        items, next_cursor = await load()
+    else:
+        items, next_cursor = await catalog_cache.acatalog_page({**filters, 'cursor': cursor}, load)
+    return filters, await catalog_cache.aapply_seat_counts(items), next_cursor
+
+
+# 课程列表视图(异步)
+@read_only_view
+@login_required
+async def course_list(request):
+    """
+    显示课程列表(游标分页)及当前用户选课状态
+    与views.course_list相同，数据库与缓存访问均为异步调用
+    """
+    user = await _resolve_user(request)
+    filters, items, next_cursor = await _catalog_page(request)
+    enrolled_courses = await catalog_cache.aenrolled_course_ids(user)
+    locked = await amissing_prerequisites(user, [course.id for course in items])
+    cards = await acourse_cards(items, enrolled_courses, locked.keys())
+    return render(
+        request,
+        'courses/course_list.html',
+        _course_list_context(filters, items, next_cursor, enrolled_courses, cards),
+    )
+
+
+# 我的课程视图(异步)
+@read_only_view
+@login_required
+async def my_courses(request):
+    """
+    显示当前用户已选课程与候补课程
+    查询集在视图中异步求值，模板渲染时不再访问数据库
+    """
+    user = await _resolve_user(request)
+    enrollments, waitlist = _my_courses_querysets(user)
+    return render(request, 'courses/my_courses.html', {
+        'enrollments': [enrollment async for enrollment in enrollments.aiterator()],
+        'waitlist': [entry async for entry in waitlist.aiterator()],
+    })
+
+
+# 首页视图(异步)
+@read_only_view
+@login_required
+async def index(request):
+    """
+    登录后首页
+    功能：
+    - 显示用户欢迎信息和主要功能入口
+    """
+    await _resolve_user(request)
+    return render(request, "courses/index.html")
@@ -0,0 +1,230 @@
+"""
+基准测试辅助工具
+- benchmark_database: 在独立的临时数据库中运行基准测试，不污染正式数据
+- run_concurrently: 用线程池模拟并发学生
+- build_urlconf / asgi_get / run_asgi_load: 在进程内直接驱动ASGI应用
+- summarize: 计算延迟分位数与吞吐量
+- QueryCounter / oversubscribed_courses: 统计每个请求的SQL条数，校验没有超额选课
+"""
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.models import Count, F, Q
+from django.urls import URLPattern, path
+
+
+@contextmanager
+def benchmark_database(alias=DEFAULT_DB_ALIAS):
+    """
+    创建并迁移一个临时测试数据库，退出时销毁
+    SQLite下使用临时文件而非内存库，使并发线程各自持有独立连接，更接近真实部署
+    """
+    connection = connections[alias]
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    tmpdir = None
+    if connection.vendor == 'sqlite' and not old_test_name:
+        tmpdir = tempfile.mkdtemp(prefix='courses-bench-')
+        test_settings['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def _timed(func, item):
+    started = time.perf_counter()
+    try:
+        return func(item), time.perf_counter() - started, None
+    except Exception as exc:  # 基准测试中记录错误而不是中断
+        return None, time.perf_counter() - started, exc
+    finally:
+        # 与请求结束时相同：按CONN_MAX_AGE关闭过期连接(默认每次都关闭)
+        close_old_connections()
+
+
+def run_concurrently(func, items, workers):
+    """
+    用workers个线程并发执行func(item)
+    返回：(结果列表, 延迟列表(秒), 错误列表, 总耗时(秒))
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outcomes = list(pool.map(lambda item: _timed(func, item), items))
+    elapsed = time.perf_counter() - started
+    results = [result for result, _, exc in outcomes if exc is None]
+    latencies = [latency for _, latency, _ in outcomes]
+    errors = [exc for _, _, exc in outcomes if exc is not None]
+    return results, latencies, errors, elapsed
+
+
+def percentile(sorted_values, fraction):
+    """最近秩法计算分位数(输入需已排序)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    """
+    汇总延迟分布
+    返回：请求数、吞吐量(次/秒)以及平均/p50/p95/p99/最大延迟(毫秒)
+    """
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'throughput': len(values) / elapsed if elapsed > 0 else 0.0,
+        'mean_ms': statistics.fmean(values) * 1000 if values else 0.0,
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p95_ms': percentile(values, 0.95) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+        'max_ms': values[-1] * 1000 if values else 0.0,
+    }
+
+
+class QueryCounter:
+    """
+    统计当前线程数据库连接上执行的SQL条数
+    用法：with QueryCounter() as counter: ...; counter.count
+    通过execute_wrapper计数，不依赖DEBUG，也不保存SQL文本
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self.count = 0
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        # connections[alias]按线程区分，计数只包含本线程发出的查询
+        self._wrapper = connections[self.using].execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrapper.__exit__(*exc_info)
+
+
+def oversubscribed_courses():
+    """
+    返回超额选课或已选人数与选课记录数不一致的课程ID(一次聚合查询)
+    """
+    from courses.models import Course
+
+    return list(
+        Course.objects.annotate(actual=Count('enrollment'))
+        .filter(Q(enrolled_count__gt=F('capacity')) | ~Q(enrolled_count=F('actual')))
+        .values_list('pk', flat=True)
+    )
+
+
+# 可在同步与异步实现之间切换的只读页面
+READ_VIEW_NAMES = ('index', 'course_list', 'my_courses')
+
+
+def build_urlconf(read_views):
+    """
+    生成一个临时URLconf模块，将只读页面替换为read_views模块中的实现
+    其余路由与项目一致；返回可用于ROOT_URLCONF的模块名
+    """
+    from Python_Final_Project import urls as project_urls
+    from courses import urls as course_urls
+
+    patterns = []
+    for pattern in course_urls.urlpatterns:
+        if isinstance(pattern, URLPattern) and pattern.name in READ_VIEW_NAMES:
+            pattern = path(str(pattern.pattern), getattr(read_views, pattern.name), name=pattern.name)
+        patterns.append(pattern)
+    patterns += [pattern for pattern in project_urls.urlpatterns if str(pattern.pattern) == 'admin/']
+
+    name = f'courses_bench_urls_{read_views.__name__.replace(".", "_")}'
+    module = types.ModuleType(name)
+    module.urlpatterns = patterns
+    sys.modules[name] = module
+    return name
+
+
+async def asgi_get(app, path_info, query_string='', cookies=''):
+    """
+    向ASGI应用发送一次GET请求
+    返回：(状态码, 响应体字节数)
+    """
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path_info,
+        'query_string': query_string.encode('ascii'),
+        'headers': [(b'host', b'testserver'), (b'cookie', cookies.encode('ascii'))],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 0),
+    }
+    request_sent = False
+    disconnect = asyncio.Event()
+    status = None
+    size = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status, size
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            size += len(message.get('body', b''))
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnect.set()
+    return status, size
+
+
+async def run_asgi_load(app, requests, concurrency):
+    """
+    以固定并发度向ASGI应用发送请求
+    参数：
+    - requests: (path, query_string, cookies) 列表
+    - concurrency: 同时在途的请求数
+    返回：(状态码列表, 延迟列表(秒), 总耗时(秒))
+    """
+    queue = iter(requests)
+    statuses, latencies = [], []
+
+    async def worker():
+        for path_info, query_string, cookies in queue:
+            started = time.perf_counter()
+            status, _ = await asgi_get(app, path_info, query_string, cookies)
+            latencies.append(time.perf_counter() - started)
+            statuses.append(status)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return statuses, latencies, time.perf_counter() - started
+
@@ -0,0 +1,147 @@
+"""
+课程与选课记录的批量操作(供管理后台的批量动作使用)
+每个操作都是少量集合式UPDATE/DELETE(批量转课按主键分块，每块几条语句)；
+这些语句绕过模型信号，结束后用sync_enrollment_counts按真实记录重算已选人数，
+并刷新选课热度、选课数据版本与相关缓存
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache, prerequisites, timetable
+from .models import Course, Enrollment, WaitlistEntry
+from .services import EnrollStatus, promote_waitlists
+from .signals import sync_enrollment_counts
+
+# 批量转课时每次读取与更新的记录数
+MOVE_CHUNK_SIZE = 1000
+
+
+def set_capacity(courses, capacity):
+    """
+    批量修改课程容量
+    参数：
+    - courses: 课程查询集
+    - capacity: 新容量；已选人数超过新容量的课程保持不变
+    返回：(修改的课程数, 因已选人数超过新容量而跳过的课程数)
+    容量调大后，事务提交时为新增的名额递补候补学生
+    """
+    course_ids = list(courses.values_list('pk', flat=True))
+    with transaction.atomic():
+        updated = Course.objects.filter(pk__in=course_ids, enrolled_count__lte=capacity).update(
+            capacity=capacity, updated_at=timezone.now()
+        )
+        sync_enrollment_counts(course_ids)
+        cache.invalidate_catalog()
+    transaction.on_commit(lambda: promote_waitlists(course_ids))
+    return updated, len(course_ids) - updated
+
+
+class MoveResult:
+    """
+    批量转课结果
+    - status: NOT_FOUND 目标课程不存在；FULL 目标课程剩余名额不足，不转移任何记录；ENROLLED 转移完成
+    - moved: 转移的记录数
+    - skipped: 已在目标课程中(或同一学生的另一条记录已转入)而跳过的记录数
+    - conflicts: 与目标课程时间冲突、未转移的学生ID列表
+    - prerequisites: 未修完目标课程的先修课程、未转移的学生ID列表
+    """
+
+    def __init__(self, status=EnrollStatus.ENROLLED):
+        self.status = status
+        self.moved = 0
+        self.skipped = 0
+        self.conflicts = []
+        self.prerequisites = []
+
+
+class _NotEnoughSeats(Exception):
+    """可转移的记录超过目标课程剩余名额，回滚整个事务"""
+
+
+def _movable(rows, target_id, graph, result):
+    """
+    筛选一块记录中可以转入目标课程的记录
+    逻辑：
+    1. 跳过已在目标课程中的学生(一条查询)，同一学生只转移一条记录
+    2. 与选课相同地检查先修课程与时间冲突(转出的课程不计)，不满足的学生记入result
+    返回：[(记录ID, 学生ID, 源课程ID)]
+    """
+    taken = set(
+        Enrollment.objects.filter(course_id=target_id, student_id__in={student_id for _, student_id, _ in rows})
+        .values_list('student_id', flat=True)
+    )
+    moves = {}
+    for _, student_id, course_id in rows:
+        if student_id in taken or student_id in moves:
+            result.skipped += 1
+        else:
+            moves[student_id] = course_id
+    missing = prerequisites.students_missing_prerequisites(moves.keys(), target_id, graph)
+    conflicts = timetable.conflicting_students(
+        {student_id: course_id for student_id, course_id in moves.items() if student_id not in missing}, target_id
+    )
+    movable = []
+    for pk, student_id, course_id in rows:
+        if moves.get(student_id) != course_id:
+            continue
+        if student_id in missing:
+            result.prerequisites.append(student_id)
+        elif student_id in conflicts:
+            result.conflicts.append(student_id)
+        else:
+            movable.append((pk, student_id, course_id))
+        del moves[student_id]
+    return movable
+
+
+def _move(enrollments, target_course_id):
+    result = MoveResult()
+    with transaction.atomic():
+        target = Course.objects.select_for_update().filter(pk=target_course_id).first()
+        if target is None:
+            return MoveResult(EnrollStatus.NOT_FOUND), set()
+
+        available = target.available_seats()
+        graph = prerequisites.prerequisite_graph()
+        selected = enrollments.exclude(course_id=target.pk).order_by('pk').values_list('pk', 'student_id', 'course_id')
+        source_ids = set()
+        last_pk = 0
+        while rows := list(selected.filter(pk__gt=last_pk)[:MOVE_CHUNK_SIZE]):
+            last_pk = rows[-1][0]
+            movable = _movable(rows, target.pk, graph, result)
+            if not movable:
+                continue
+            result.moved += len(movable)
+            if result.moved > available:
+                raise _NotEnoughSeats
+            student_ids = [student_id for _, student_id, _ in movable]
+            source_ids.update(course_id for _, _, course_id in movable)
+            Enrollment.objects.filter(pk__in=[pk for pk, _, _ in movable]).update(course_id=target.pk)
+            WaitlistEntry.objects.filter(course_id=target.pk, student_id__in=student_ids).delete()
+            cache.invalidate_enrolled(student_ids)
+        if result.moved:
+            sync_enrollment_counts([*source_ids, target.pk])
+    return result, source_ids
+
+
+def move_enrollments(enrollments, target_course_id):
+    """
+    把选课记录批量转到另一门课程(如同一课程的不同班级之间调整学生)
+    参数：
+    - enrollments: 选课记录查询集
+    - target_course_id: 目标课程ID
+    返回：MoveResult
+    逻辑：
+    1. 锁定目标课程，按主键分块读取所选记录(每块MOVE_CHUNK_SIZE条)，内存占用与选中的行数无关
+    2. 每块跳过已在目标课程中的学生，并与选课、购物车相同地检查先修课程与时间冲突
+    3. 每块一条UPDATE修改记录的课程，一条DELETE移除这些学生在目标课程的候补记录
+    4. 可转移的记录超过目标课程剩余名额时整个事务回滚，返回FULL
+    5. 重算源课程与目标课程的已选人数，源课程释放的名额在提交后递补候补学生
+    """
+    try:
+        result, source_ids = _move(enrollments, target_course_id)
+    except _NotEnoughSeats:
+        return MoveResult(EnrollStatus.FULL)
+    if source_ids:
+        transaction.on_commit(lambda: promote_waitlists(source_ids))
+    return result
@@ -0,0 +1,259 @@
+"""
+课程目录与选课状态缓存
+基于Django缓存框架，可使用任意后端(生产环境建议Redis/Memcached，多个工作进程共享)
+
+缓存内容与失效方式(由signals.py中的post_save/post_delete触发)：
+- 目录页：课程的静态字段(名称、教师、容量等)，键中带有目录代号；
+  课程增删改时代号加一，旧页面自然失效，选课写入不影响目录页
+- 已选人数：每门课程一个键，该课程的选课记录增删时删除
+- 学生已选课程ID集合：每名学生一个键，该学生的选课记录增删时删除
+JSON接口的ETag所用的目录版本与选课数据版本保存在数据库中(见models.CatalogVersion)，
+不依赖缓存后端是否在进程间共享
+
+失效在写入时立即执行，并在事务提交后再执行一次，
+避免并发读取在提交前把旧数据重新写回缓存
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Course, Enrollment
+
+CACHE_ALIAS = getattr(settings, 'COURSES_CACHE_ALIAS', 'default')
+CATALOG_TIMEOUT = 600
+SEATS_TIMEOUT = 60
+ENROLLED_TIMEOUT = 300
+
+_GENERATION_KEY = 'courses:catalog:generation'
+
+
+class CacheStats:
+    """按命名空间统计缓存命中/未命中次数(进程内，线程安全)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, namespace, hits=0, misses=0):
+        with self._lock:
+            counts = self._counts.setdefault(namespace, [0, 0])
+            counts[0] += hits
+            counts[1] += misses
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def snapshot(self):
+        """返回 {命名空间: {'hits', 'misses', 'hit_rate'}}"""
+        with self._lock:
+            counts = {namespace: tuple(values) for namespace, values in self._counts.items()}
+        return {
+            namespace: {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            }
+            for namespace, (hits, misses) in counts.items()
+        }
+
+
+cache_stats = CacheStats()
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _after_commit(func, *args):
+    """立即执行一次失效，并在事务提交后再执行一次"""
+    func(*args)
+    transaction.on_commit(lambda: func(*args))
+
+
+def catalog_generation():
+    """
+    读取目录代号
+    键不存在(首次使用或被淘汰)时以当前时间创建，保证不会与旧代号重复
+    """
+    cache = get_cache()
+    generation = cache.get(_GENERATION_KEY)
+    if generation is None:
+        cache.add(_GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(_GENERATION_KEY, time.time_ns())
+    return generation
+
+
+def _bump_generation():
+    try:
+        get_cache().incr(_GENERATION_KEY)
+    except ValueError:
+        # 代号不存在时下次读取会重新创建
+        pass
+
+
+def invalidate_catalog():
+    """课程增删改后使所有缓存的目录页失效"""
+    _after_commit(_bump_generation)
+
+
+async def acatalog_generation():
+    """catalog_generation的异步版本"""
+    cache = get_cache()
+    generation = await cache.aget(_GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(_GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = await cache.aget(_GENERATION_KEY, time.time_ns())
+    return generation
+
+
+def _catalog_key(generation, params):
+    digest = hashlib.md5(repr(sorted(params.items())).encode('utf-8')).hexdigest()
+    return f'courses:catalog:{generation}:{digest}'
+
+
+def catalog_page(params, loader):
+    """
+    读取缓存的目录页
+    参数：
+    - params: 决定页面内容的参数(筛选条件与游标)
+    - loader: 未命中时调用，返回(课程列表, 下一页游标)
+    返回：(课程列表, 下一页游标)，课程的已选人数需再用apply_seat_counts覆盖
+    """
+    key = _catalog_key(catalog_generation(), params)
+    cache = get_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        cache_stats.record('catalog', hits=1)
+        return cached
+    cache_stats.record('catalog', misses=1)
+    page = loader()
+    cache.set(key, page, CATALOG_TIMEOUT)
+    return page
+
+
+async def acatalog_page(params, loader):
+    """catalog_page的异步版本，loader为协程函数"""
+    key = _catalog_key(await acatalog_generation(), params)
+    cache = get_cache()
+    cached = await cache.aget(key)
+    if cached is not None:
+        cache_stats.record('catalog', hits=1)
+        return cached
+    cache_stats.record('catalog', misses=1)
+    page = await loader()
+    await cache.aset(key, page, CATALOG_TIMEOUT)
+    return page
+
+
+def _seats_key(course_id):
+    return f'courses:seats:{course_id}'
+
+
+def seat_counts(course_ids):
+    """
+    批量读取课程已选人数
+    一次get_many读取缓存，未命中的课程用一条查询补齐并回填
+    返回：{课程ID: 已选人数}
+    """
+    cache = get_cache()
+    keys = {_seats_key(course_id): course_id for course_id in course_ids}
+    found = cache.get_many(keys)
+    counts = {keys[key]: value for key, value in found.items()}
+    missing = [course_id for course_id in course_ids if course_id not in counts]
+    cache_stats.record('seats', hits=len(counts), misses=len(missing))
+    if missing:
+        loaded = dict(Course.objects.filter(pk__in=missing).values_list('pk', 'enrolled_count'))
+        cache.set_many({_seats_key(course_id): count for course_id, count in loaded.items()}, SEATS_TIMEOUT)
+        counts.update(loaded)
+    return counts
+
+
+async def aseat_counts(course_ids):
+    """seat_counts的异步版本"""
+    cache = get_cache()
+    keys = {_seats_key(course_id): course_id for course_id in course_ids}
+    found = await cache.aget_many(keys)
+    counts = {keys[key]: value for key, value in found.items()}
+    missing = [course_id for course_id in course_ids if course_id not in counts]
+    cache_stats.record('seats', hits=len(counts), misses=len(missing))
+    if missing:
+        rows = Course.objects.filter(pk__in=missing).values_list('pk', 'enrolled_count')
+        loaded = {pk: count async for pk, count in rows}
+        await cache.aset_many({_seats_key(course_id): count for course_id, count in loaded.items()}, SEATS_TIMEOUT)
+        counts.update(loaded)
+    return counts
+
+
+def _overlay_counts(courses, counts):
+    for course in courses:
+        course.enrolled_count = counts.get(course.id, course.enrolled_count)
+    return courses
+
+
+def apply_seat_counts(courses):
+    """用最新的已选人数覆盖课程对象上的enrolled_count"""
+    return _overlay_counts(courses, seat_counts([course.id for course in courses]))
+
+
+async def aapply_seat_counts(courses):
+    """apply_seat_counts的异步版本"""
+    return _overlay_counts(courses, await aseat_counts([course.id for course in courses]))
+
+
+def _delete_seats(course_ids):
+    get_cache().delete_many([_seats_key(course_id) for course_id in course_ids])
+
+
+def invalidate_seats(course_ids):
+    """课程的选课记录变化后删除其已选人数缓存"""
+    _after_commit(_delete_seats, list(course_ids))
+
+
+def _enrolled_key(user_id):
+    return f'courses:enrolled:{user_id}'
+
+
+def enrolled_course_ids(user):
+    """
+    读取学生已选课程ID集合(frozenset，成员判断O(1))
+    未命中时查询一次并写入缓存
+    """
+    cache = get_cache()
+    key = _enrolled_key(user.pk)
+    ids = cache.get(key)
+    if ids is not None:
+        cache_stats.record('enrolled', hits=1)
+        return ids
+    cache_stats.record('enrolled', misses=1)
+    ids = frozenset(Enrollment.objects.filter(student=user).values_list('course_id', flat=True))
+    cache.set(key, ids, ENROLLED_TIMEOUT)
+    return ids
+
+
+async def aenrolled_course_ids(user):
+    """enrolled_course_ids的异步版本"""
+    cache = get_cache()
+    key = _enrolled_key(user.pk)
+    ids = await cache.aget(key)
+    if ids is not None:
+        cache_stats.record('enrolled', hits=1)
+        return ids
+    cache_stats.record('enrolled', misses=1)
+    rows = Enrollment.objects.filter(student=user).values_list('course_id', flat=True)
+    ids = frozenset([course_id async for course_id in rows])
+    await cache.aset(key, ids, ENROLLED_TIMEOUT)
+    return ids
+
+
+def _delete_enrolled(user_ids):
+    get_cache().delete_many([_enrolled_key(user_id) for user_id in user_ids])
+
+
+def invalidate_enrolled(user_ids):
+    """学生的选课记录变化后删除其已选课程集合缓存"""
+    _after_commit(_delete_enrolled, list(user_ids))
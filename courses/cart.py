@@ -0,0 +1,210 @@
+"""
+选课购物车：一个请求内同时选多门课、退多门课
+整个购物车在一个事务中全部生效或全部不生效：
+1. 集合查询完成校验：所涉课程的容量与已选人数、该学生在这些课程中的选课记录、
+   已完成的课程(先修要求，先修图来自缓存)，以及待选课程与已选课程的上课时段
+   (待选课程之间、与保留的已选课程之间都不能冲突)
+2. 选课用一条带条件的UPDATE为所有课程同时占座，占到的名额少于要选的课程数
+   (校验之后有课程被抢满)时整个事务回滚
+3. 选课记录用bulk_create一次写入；退课记录用一条DELETE删除(信号维护已选人数)
+4. 退课释放的名额在事务提交后递补给候补学生
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import cache, heat, prerequisites, timetable
+from .models import CatalogVersion, Course, Enrollment, WaitlistEntry
+from .services import EnrollStatus, enrollment_stats, promote_waitlists, run_with_retry
+
+# 单个购物车最多包含的课程数
+MAX_CART_SIZE = 20
+
+ADD = 'add'
+DROP = 'drop'
+# 退课结果(选课结果使用EnrollStatus的取值)
+DROPPED = 'dropped'
+NOT_ENROLLED = 'not_enrolled'
+# 购物车被拒绝时，本身可以执行的课程标记为已回滚
+ROLLED_BACK = 'rolled_back'
+
+# 出现这些结果时整个购物车不生效
+_REJECTING = {
+    EnrollStatus.NOT_FOUND.value, EnrollStatus.FULL.value,
+    EnrollStatus.CONFLICT.value, EnrollStatus.PREREQUISITES.value,
+}
+
+
+class CartError(ValueError):
+    """购物车参数不合法(为空、过大或同一课程同时选与退)"""
+
+
+class _SeatsTaken(Exception):
+    """校验之后有课程被抢满，回滚整个事务"""
+
+
+class CartResult:
+    """
+    购物车执行结果
+    - applied: 是否全部生效
+    - items: [(动作, 课程ID, 结果)]，顺序与请求一致
+    """
+
+    def __init__(self, items, applied):
+        self.items = items
+        self.applied = applied
+
+    def as_dict(self):
+        return {
+            'applied': self.applied,
+            'results': [
+                {'action': action, 'course_id': course_id, 'status': status}
+                for action, course_id, status in self.items
+            ],
+        }
+
+
+def _normalize(ids):
+    """去重并保持顺序"""
+    return list(dict.fromkeys(ids))
+
+
+def _plan(student, add, drop):
+    """
+    校验购物车(两条查询，有可选课程时再查询一次上课时段)
+    返回：[(动作, 课程ID, 结果)]
+    """
+    course_ids = [*add, *drop]
+    seats = {
+        pk: capacity - enrolled
+        for pk, capacity, enrolled in Course.objects.filter(pk__in=course_ids)
+        .values_list('pk', 'capacity', 'enrolled_count')
+    }
+    enrolled = set(
+        Enrollment.objects.filter(student=student, course_id__in=course_ids).values_list('course_id', flat=True)
+    )
+    items = []
+    for course_id in add:
+        if course_id not in seats:
+            status = EnrollStatus.NOT_FOUND.value
+        elif course_id in enrolled:
+            status = EnrollStatus.ALREADY_ENROLLED.value
+        elif seats[course_id] <= 0:
+            status = EnrollStatus.FULL.value
+        else:
+            status = EnrollStatus.ENROLLED.value
+        items.append((ADD, course_id, status))
+    for course_id in drop:
+        if course_id not in seats:
+            status = EnrollStatus.NOT_FOUND.value
+        elif course_id not in enrolled:
+            status = NOT_ENROLLED
+        else:
+            status = DROPPED
+        items.append((DROP, course_id, status))
+    return _check_conflicts(student, _check_prerequisites(student, items), drop)
+
+
+def _check_prerequisites(student, items):
+    """未修完先修课程的待选课程标记为prerequisites(整个购物车最多查询一次已完成课程)"""
+    candidates = [course_id for action, course_id, status in items
+                  if action == ADD and status == EnrollStatus.ENROLLED.value]
+    missing = prerequisites.missing_prerequisites(student, candidates) if candidates else {}
+    return [
+        (action, course_id, EnrollStatus.PREREQUISITES.value if action == ADD and course_id in missing else status)
+        for action, course_id, status in items
+    ]
+
+
+def _check_conflicts(student, items, drop):
+    """按请求顺序把可选的课程依次加入区间索引，与索引中已有时段冲突的课程标记为conflict"""
+    candidates = [course_id for action, course_id, status in items
+                  if action == ADD and status == EnrollStatus.ENROLLED.value]
+    if not candidates:
+        return items
+    slots, taken = timetable.slot_map(student, candidates)
+    table = timetable.build_timetable(slots, taken - set(drop))
+    checked = []
+    for action, course_id, status in items:
+        if action == ADD and status == EnrollStatus.ENROLLED.value:
+            intervals = slots.get(course_id, ())
+            if timetable.first_conflict(table, intervals) is not None:
+                status = EnrollStatus.CONFLICT.value
+            else:
+                for start, end in intervals:
+                    table.add(start, end, course_id)
+        checked.append((action, course_id, status))
+    return checked
+
+
+def _reject(items):
+    return CartResult(
+        [(action, course_id, status if status in _REJECTING else ROLLED_BACK)
+         for action, course_id, status in items],
+        applied=False,
+    )
+
+
+def _apply(student, add, drop):
+    with transaction.atomic():
+        items = _plan(student, add, drop)
+        if any(status in _REJECTING for _, _, status in items):
+            return _reject(items), []
+
+        to_add = [course_id for action, course_id, status in items
+                  if action == ADD and status == EnrollStatus.ENROLLED.value]
+        to_drop = [course_id for action, course_id, status in items if status == DROPPED]
+
+        if to_add:
+            claimed = Course.objects.filter(
+                pk__in=to_add, enrolled_count__lt=F('capacity')
+            ).update(enrolled_count=F('enrolled_count') + 1)
+            if claimed != len(to_add):
+                raise _SeatsTaken
+            enrollments = [Enrollment(student=student, course_id=course_id) for course_id in to_add]
+            Enrollment.objects.bulk_create(enrollments)
+            for course_id in to_add:
+                heat.adjust_heat(course_id, 1)
+            WaitlistEntry.objects.filter(student=student, course_id__in=to_add).delete()
+            CatalogVersion.bump_data()
+            cache.invalidate_seats(to_add)
+            cache.invalidate_enrolled([student.pk])
+        if to_drop:
+            Enrollment.objects.filter(student=student, course_id__in=to_drop).delete()
+    return CartResult(items, applied=True), to_drop
+
+
+def apply_cart(student, add=(), drop=()):
+    """
+    执行购物车
+    参数：
+    - student: 学生(User)
+    - add / drop: 要选、要退的课程ID
+    返回：CartResult
+    - 有课程不存在、已满、未修完先修课程或上课时间冲突时全部不生效，其余课程的结果为rolled_back
+    - 已选的课程再选、未选的课程退课不影响其他课程，结果分别为already与not_enrolled
+    异常：参数不合法时抛出CartError
+    """
+    add, drop = _normalize(add), _normalize(drop)
+    if not add and not drop:
+        raise CartError("购物车为空")
+    if len(add) + len(drop) > MAX_CART_SIZE:
+        raise CartError(f"一次最多处理 {MAX_CART_SIZE} 门课程")
+    if set(add) & set(drop):
+        raise CartError("同一门课程不能同时选课和退课")
+
+    try:
+        result, dropped = run_with_retry(_apply, student, add, drop)
+    except _SeatsTaken:
+        # 事务已回滚，重新校验以标出被抢满的课程
+        result, dropped = _reject(_plan(student, add, drop)), []
+    except IntegrityError:
+        # 同一学生并发提交了重叠的购物车：唯一约束已回滚本次事务，按最新状态重新执行
+        result, dropped = run_with_retry(_apply, student, add, drop)
+
+    if dropped:
+        transaction.on_commit(lambda: promote_waitlists(dropped))
+    for action, _, status in result.items:
+        if action == ADD and status != ROLLED_BACK:
+            enrollment_stats.record('attempts')
+            enrollment_stats.record(status)
+    return result
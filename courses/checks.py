@@ -0,0 +1,32 @@
+"""
+部署检查(manage.py check --deploy)
+"""
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+
+from .cache import CACHE_ALIAS
+
+# 只在单个进程内有效的缓存后端
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_rate_limit_cache(app_configs, **kwargs):
+    """限流计数器所在的缓存不在进程间共享时，全局限额实际是每个进程一份"""
+    if not getattr(settings, 'COURSES_RATE_LIMITS', True):
+        return []
+    backend_class = type(caches[CACHE_ALIAS])
+    backend = f'{backend_class.__module__}.{backend_class.__name__}'
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        checks.Warning(
+            f"限流计数器保存在进程内缓存({backend})中，多进程部署时每个工作进程各有一份限额",
+            hint="将COURSES_CACHE_ALIAS指向Redis/Memcached等共享缓存，或只运行一个工作进程",
+            id='courses.W001',
+        )
+    ]
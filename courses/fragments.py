@@ -0,0 +1,106 @@
+"""
+课程卡片的片段缓存
+课程列表页每张卡片的名称、教师、容量与选课链接只随课程本身变化，
+只有已选人数与选课状态(已选、可选、未修完先修课程)因请求而异。卡片模板在渲染时输出
+分隔标记，渲染结果按标记切分为静态片段缓存起来，请求时只把动态部分拼接进去：
+
+    片段[0] + 已选人数 + 片段[1]
+    + (片段[2] 已选标记 | 片段[3] 选课按钮 | 片段[4] 需先修标记) + 片段[5]
+
+缓存键包含课程的更新时间(Course.updated_at)，课程被修改后旧片段自然失效；
+一页卡片用一次get_many读取，未命中的卡片渲染后用一次set_many回填。
+渲染结果切分出的片段数不符时，该卡片不缓存，改为直接渲染完整卡片
+"""
+import logging
+import secrets
+
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from .cache import cache_stats, get_cache
+
+CARD_TEMPLATE = 'courses/_course_card.html'
+# 卡片模板或其输出格式变化时加一，使所有旧片段失效
+CARD_TEMPLATE_VERSION = 2
+CARD_TIMEOUT = 3600
+# 模板中的分隔标记：HTML注释加进程内随机串。课程字段经过自动转义，其中的"<"会被改写，
+# 渲染结果中的标记因此只可能来自模板本身
+SLOT = f'<!--card-slot-{secrets.token_hex(8)}-->'
+_PARTS = 6
+
+logger = logging.getLogger('courses.fragments')
+
+
+def _card_key(course):
+    return f'courses:card:{CARD_TEMPLATE_VERSION}:{course.id}:{course.updated_at.timestamp():.6f}'
+
+
+def _render_parts(course):
+    """渲染一张卡片的静态片段，片段数不符时返回None"""
+    html = get_template(CARD_TEMPLATE).render({'course': course, 'slot': mark_safe(SLOT)})
+    parts = tuple(html.split(SLOT))
+    if len(parts) != _PARTS:
+        logger.warning(
+            '%s 应切分为 %d 个片段，课程 %s 实际为 %d 个，改为直接渲染', CARD_TEMPLATE, _PARTS, course.id, len(parts)
+        )
+        return None
+    return parts
+
+
+def _render_card(course, enrolled, locked):
+    """不使用片段缓存，直接渲染完整卡片"""
+    return get_template(CARD_TEMPLATE).render({'course': course, 'enrolled': enrolled, 'locked': locked})
+
+
+def _assemble(courses, parts_by_key, keys, enrolled_ids, locked_ids):
+    html = []
+    for course, key in zip(courses, keys):
+        parts = parts_by_key.get(key)
+        if parts is None:
+            html.append(_render_card(course, course.id in enrolled_ids, course.id in locked_ids))
+            continue
+        head, middle, enrolled_badge, enroll_button, locked_badge, tail = parts
+        if course.id in enrolled_ids:
+            status = enrolled_badge
+        elif course.id in locked_ids:
+            status = locked_badge
+        else:
+            status = enroll_button
+        html += [head, str(course.enrolled_count), middle, status, tail]
+    return mark_safe(''.join(html))
+
+
+def _fill_missing(courses, keys, found):
+    """渲染未命中的卡片，返回可以缓存的片段(切分失败的卡片不缓存)"""
+    missing = {key: _render_parts(course) for course, key in zip(courses, keys) if key not in found}
+    cache_stats.record('cards', hits=len(found), misses=len(missing))
+    return {key: parts for key, parts in missing.items() if parts is not None}
+
+
+def course_cards(courses, enrolled_ids, locked_ids=frozenset()):
+    """
+    渲染一页课程卡片
+    参数：
+    - courses: 课程对象列表(enrolled_count已覆盖为最新值)
+    - enrolled_ids: 当前用户已选课程ID集合
+    - locked_ids: 当前用户未修完先修课程的课程ID集合
+    返回：卡片HTML(SafeString)
+    """
+    keys = [_card_key(course) for course in courses]
+    cache = get_cache()
+    found = cache.get_many(keys)
+    missing = _fill_missing(courses, keys, found)
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+    return _assemble(courses, {**found, **missing}, keys, enrolled_ids, locked_ids)
+
+
+async def acourse_cards(courses, enrolled_ids, locked_ids=frozenset()):
+    """course_cards的异步版本"""
+    keys = [_card_key(course) for course in courses]
+    cache = get_cache()
+    found = await cache.aget_many(keys)
+    missing = _fill_missing(courses, keys, found)
+    if missing:
+        await cache.aset_many(missing, CARD_TIMEOUT)
+    return _assemble(courses, {**found, **missing}, keys, enrolled_ids, locked_ids)
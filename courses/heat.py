@@ -0,0 +1,111 @@
+"""
+选课热度快照(CourseHeat)的维护与查询
+- 选课记录增删：对应行的已选人数与选课比例在数据库侧原子增减
+- 课程增改：同步标签与容量
+- rebuild_heat：按课程表全量或部分重建(批量写入之后)
+"""
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from .models import Course, CourseHeat
+
+# 图表支持的排序方式
+HEAT_ORDERINGS = {
+    'enrolled': ('-enrolled', 'course_id'),
+    'fill': ('-fill_ratio', 'course_id'),
+}
+
+
+def _ratio(enrolled, capacity=None):
+    """
+    选课比例表达式，容量为0时记为0
+    UPDATE语句右侧读取的是旧值，因此同一语句中修改了人数或容量时需传入新值表达式
+    """
+    if capacity is not None:
+        if not capacity:
+            return Value(0.0)
+        return Cast(enrolled, FloatField()) / Value(float(capacity))
+    return Case(
+        When(capacity=0, then=Value(0.0)),
+        default=Cast(enrolled, FloatField()) / Cast(F('capacity'), FloatField()),
+        output_field=FloatField(),
+    )
+
+
+def fill_ratio(enrolled, capacity):
+    return enrolled / capacity if capacity else 0.0
+
+
+def adjust_heat(course_id, delta):
+    """选课记录增删后增量更新快照，选课比例按(旧人数 + delta)计算"""
+    enrolled = F('enrolled') + delta
+    CourseHeat.objects.filter(course_id=course_id).update(
+        enrolled=enrolled, fill_ratio=_ratio(enrolled)
+    )
+
+
+def sync_course(course):
+    """课程新建或修改后同步快照中的标签与容量"""
+    updated = CourseHeat.objects.filter(course_id=course.pk).update(
+        label=course.name,
+        capacity=course.capacity,
+        fill_ratio=_ratio(F('enrolled'), course.capacity),
+    )
+    if not updated:
+        CourseHeat.objects.get_or_create(
+            course_id=course.pk,
+            defaults={
+                'label': course.name,
+                'capacity': course.capacity,
+                'enrolled': course.enrolled_count,
+                'fill_ratio': fill_ratio(course.enrolled_count, course.capacity),
+            },
+        )
+
+
+def rebuild_heat(course_ids=None, batch_size=1000):
+    """
+    按课程表重建快照(分批upsert，内存占用与课程总数无关)
+    参数：
+    - course_ids: 只重建这些课程，为None时重建全部
+    返回：写入的行数
+    """
+    courses = Course.objects.order_by('pk')
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+    total = 0
+    batch = []
+    rows = courses.values_list('pk', 'name', 'enrolled_count', 'capacity').iterator(chunk_size=batch_size)
+    for pk, name, enrolled, capacity in rows:
+        batch.append(CourseHeat(
+            course_id=pk,
+            label=name,
+            enrolled=enrolled,
+            capacity=capacity,
+            fill_ratio=fill_ratio(enrolled, capacity),
+        ))
+        if len(batch) >= batch_size:
+            total += _upsert(batch)
+            batch = []
+    if batch:
+        total += _upsert(batch)
+    return total
+
+
+def _upsert(rows):
+    CourseHeat.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['course'],
+        update_fields=['label', 'enrolled', 'capacity', 'fill_ratio', 'updated_at'],
+    )
+    return len(rows)
+
+
+def top_courses(limit=20, order='enrolled'):
+    """按已选人数或选课比例取前limit门课程的快照(走索引，只读limit行)"""
+    return list(
+        CourseHeat.objects.order_by(*HEAT_ORDERINGS[order]).values_list(
+            'course_id', 'label', 'enrolled', 'capacity', 'fill_ratio'
+        )[:limit]
+    )
@@ -0,0 +1,228 @@
+"""
+选课记录批量导入
+按块流式处理(用户名, 课程)行：每块在一个事务中批量解析用户、校验重复与容量、
+bulk_create写入，并补做bulk_create不会触发的信号副作用(已选人数、热度快照、
+选课数据版本、缓存、候补记录)。内存占用只与块大小有关，与文件大小无关
+"""
+import time
+from collections import defaultdict
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import cache, heat
+from .models import CatalogVersion, Course, Enrollment, WaitlistEntry
+from .services import run_with_retry
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class ImportReport:
+    """导入统计"""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.unknown_users = 0
+        self.unknown_courses = 0
+        self.over_capacity = 0
+        self.chunks = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def merge(self, other):
+        """累加一块数据的统计"""
+        for field in ('inserted', 'duplicates', 'invalid', 'unknown_users', 'unknown_courses', 'over_capacity'):
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'unknown_users': self.unknown_users,
+            'unknown_courses': self.unknown_courses,
+            'over_capacity': self.over_capacity,
+            'chunks': self.chunks,
+            'elapsed_seconds': self.elapsed,
+            'rows_per_second': self.rows_per_second,
+        }
+
+
+def course_lookup(by='id'):
+    """
+    一次性加载课程解析表
+    - by='id': 课程ID字符串 -> 课程ID
+    - by='name': 课程名称 -> 课程ID(重名课程无法唯一确定，不放入解析表)
+    """
+    if by == 'id':
+        return {str(pk): pk for pk in Course.objects.values_list('pk', flat=True).iterator()}
+    lookup, ambiguous = {}, set()
+    for pk, name in Course.objects.values_list('pk', 'name').iterator():
+        if name in lookup:
+            ambiguous.add(name)
+        lookup[name] = pk
+    for name in ambiguous:
+        del lookup[name]
+    return lookup
+
+
+def _chunks(rows, size):
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _import_chunk(chunk, courses, report, allow_over_capacity):
+    """
+    在一个事务内导入一块数据
+    逻辑：
+    1. 用户名或课程为空的行记为无效，一次查询解析本块其余行的用户名
+    2. 锁定涉及的课程行(select_for_update)，并发选课在本块提交前等待，容量判断准确
+    3. 一次查询找出已存在的选课记录，本块内的重复行同样跳过
+    4. 每门课程最多接受剩余名额数的记录，批量写入(见_insert，被并发写入抢先的记录计为重复)
+    5. 按课程批量增加已选人数与热度快照(按实际写入数)，清理被导入学生的候补记录，选课数据版本加一
+    返回：{课程ID: 本块实际新增的学生ID列表}
+    """
+    valid = []
+    for username, course_ref in chunk:
+        if username and course_ref:
+            valid.append((username, course_ref))
+        else:
+            report.invalid += 1
+    users = dict(
+        User.objects.filter(username__in={username for username, _ in valid}).values_list('username', 'pk')
+    )
+    pairs = []
+    seen = set()
+    for username, course_ref in valid:
+        student_id = users.get(username)
+        course_id = courses.get(course_ref)
+        if student_id is None:
+            report.unknown_users += 1
+        elif course_id is None:
+            report.unknown_courses += 1
+        elif (student_id, course_id) in seen:
+            report.duplicates += 1
+        else:
+            seen.add((student_id, course_id))
+            pairs.append((student_id, course_id))
+    if not pairs:
+        return {}
+
+    course_ids = {course_id for _, course_id in pairs}
+    remaining = {
+        pk: capacity - enrolled
+        for pk, capacity, enrolled in Course.objects.select_for_update()
+        .filter(pk__in=course_ids)
+        .values_list('pk', 'capacity', 'enrolled_count')
+    }
+    existing = set(
+        Enrollment.objects.filter(
+            student_id__in={student_id for student_id, _ in pairs}, course_id__in=course_ids
+        ).values_list('student_id', 'course_id')
+    )
+
+    accepted = defaultdict(list)
+    for student_id, course_id in pairs:
+        if (student_id, course_id) in existing:
+            report.duplicates += 1
+        elif not allow_over_capacity and len(accepted[course_id]) >= remaining[course_id]:
+            report.over_capacity += 1
+        else:
+            accepted[course_id].append(student_id)
+
+    accepted = {course_id: student_ids for course_id, student_ids in accepted.items() if student_ids}
+    _insert(accepted, report)
+    for course_id, student_ids in accepted.items():
+        Course.objects.filter(pk=course_id).update(enrolled_count=F('enrolled_count') + len(student_ids))
+        heat.adjust_heat(course_id, len(student_ids))
+        WaitlistEntry.objects.filter(course_id=course_id, student_id__in=student_ids).delete()
+    if accepted:
+        CatalogVersion.bump_data()
+    report.inserted += sum(len(student_ids) for student_ids in accepted.values())
+    return accepted
+
+
+def _insert(accepted, report):
+    """
+    写入接受的记录，保证accepted与实际写入的记录一致
+    逻辑：在保存点内bulk_create；与并发写入的记录冲突时回滚保存点，
+    把数据库中已存在的记录从accepted中移除(计为重复)后重新写入；
+    一条都没有移除时冲突另有原因(如外键错误)，直接抛出
+    """
+    while accepted:
+        try:
+            with transaction.atomic():
+                Enrollment.objects.bulk_create([
+                    Enrollment(student_id=student_id, course_id=course_id)
+                    for course_id, student_ids in accepted.items()
+                    for student_id in student_ids
+                ])
+            return
+        except IntegrityError:
+            existing = set(
+                Enrollment.objects.filter(
+                    student_id__in={student_id for student_ids in accepted.values() for student_id in student_ids},
+                    course_id__in=accepted.keys(),
+                ).values_list('student_id', 'course_id')
+            )
+            removed = 0
+            for course_id, student_ids in list(accepted.items()):
+                kept = [student_id for student_id in student_ids if (student_id, course_id) not in existing]
+                removed += len(student_ids) - len(kept)
+                if kept:
+                    accepted[course_id] = kept
+                else:
+                    del accepted[course_id]
+            if not removed:
+                raise
+            report.duplicates += removed
+
+
+def import_enrollments(rows, courses, chunk_size=DEFAULT_CHUNK_SIZE, allow_over_capacity=False,
+                       progress=None):
+    """
+    导入选课记录
+    参数：
+    - rows: (用户名, 课程引用)的可迭代对象，按需读取
+    - courses: 课程引用 -> 课程ID 的解析表(见course_lookup)
+    - chunk_size: 每个事务处理的行数
+    - allow_over_capacity: 为True时不检查课程容量
+    - progress: 每块完成后以ImportReport调用的回调
+    返回：ImportReport
+    """
+    report = ImportReport()
+    for chunk in _chunks(rows, chunk_size):
+        report.rows += len(chunk)
+
+        def run():
+            # 每次(重试)使用全新的块统计，事务回滚后不会重复计数
+            chunk_report = ImportReport()
+            with transaction.atomic():
+                accepted = _import_chunk(chunk, courses, chunk_report, allow_over_capacity)
+            return accepted, chunk_report
+
+        accepted, chunk_report = run_with_retry(run)
+        report.merge(chunk_report)
+        report.chunks += 1
+
+        if accepted:
+            cache.invalidate_seats(accepted.keys())
+            cache.invalidate_enrolled(
+                {student_id for student_ids in accepted.values() for student_id in student_ids}
+            )
+        report.elapsed = time.perf_counter() - report.started
+        if progress is not None:
+            progress(report)
+    report.elapsed = time.perf_counter() - report.started
+    return report
@@ -0,0 +1,192 @@
+"""
+剩余名额实时推送(Server-Sent Events，需ASGI部署)
+
+SeatHub是每个工作进程内的一个扇出中心：
+- 每个连接只保存订阅的课程ID、待发送的最新数据和一个asyncio.Event，空闲连接几乎不占资源
+- 后台任务每隔interval秒读取一次目录版本与选课数据版本(一条主键查询)；
+  版本变化时用一条查询读取所有被订阅课程的已选人数，只把发生变化的课程推送给订阅者
+- 同一课程在一个周期内无论变化多少次，最多推送一条消息(合并更新)
+- 版本号由所有工作进程的写入共同维护，因此其他进程中的选课同样能被推送
+- 轮询失败(如数据库暂时不可用)时记录异常，按指数退避延长等待，最长MAX_POLL_BACKOFF秒，
+  成功一次后恢复正常周期；连接保持不断
+"""
+import asyncio
+import contextvars
+import json
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import CatalogVersion, Course
+
+# 推送周期(秒)，同一课程每个周期最多一条消息
+LIVE_INTERVAL = getattr(settings, 'COURSES_LIVE_INTERVAL', 1.0)
+# 空闲连接的心跳间隔(秒)，防止代理断开长连接
+HEARTBEAT_INTERVAL = 15.0
+# 单个连接最多订阅的课程数
+MAX_SUBSCRIBED_COURSES = 200
+# 轮询连续失败时的最长等待(秒)
+MAX_POLL_BACKOFF = 30.0
+
+logger = logging.getLogger('courses.live')
+
+
+def seat_payload(course_id, enrolled_count, capacity):
+    return {
+        'course_id': course_id,
+        'enrolled_count': enrolled_count,
+        'capacity': capacity,
+        'available_seats': capacity - enrolled_count,
+    }
+
+
+def format_event(payload, event='seats'):
+    """编码为一条SSE消息"""
+    data = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def fetch_seats(course_ids, using=None):
+    """读取课程的已选人数与容量，返回{课程ID: 推送数据}(using为空时由数据库路由决定)"""
+    rows = Course.objects.using(using).filter(pk__in=list(course_ids)).values_list('pk', 'enrolled_count', 'capacity')
+    return {pk: seat_payload(pk, enrolled, capacity) async for pk, enrolled, capacity in rows}
+
+
+class Subscriber:
+    """一个SSE连接的订阅状态"""
+    __slots__ = ('course_ids', 'pending', 'event')
+
+    def __init__(self, course_ids):
+        self.course_ids = frozenset(course_ids)
+        # 课程ID -> 最新推送数据；未发送前被新数据覆盖，从而合并同一周期内的多次变化
+        self.pending = {}
+        self.event = asyncio.Event()
+
+    def push(self, course_id, payload):
+        self.pending[course_id] = payload
+        self.event.set()
+
+    def drain(self):
+        """取出所有待发送数据"""
+        pending, self.pending = self.pending, {}
+        self.event.clear()
+        return list(pending.values())
+
+
+class SeatHub:
+    """进程内的名额变化扇出中心"""
+
+    def __init__(self, interval=LIVE_INTERVAL):
+        self.interval = interval
+        self._by_course = defaultdict(set)
+        self._subscribers = set()
+        self._last = {}
+        self._version = None
+        self._task = None
+        self._loop = None
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self, course_ids, snapshot):
+        """
+        注册订阅
+        参数：
+        - course_ids: 订阅的课程ID
+        - snapshot: 连接建立时读取的当前数据，作为后续比较的基准
+        """
+        subscriber = Subscriber(course_ids)
+        self._subscribers.add(subscriber)
+        for course_id in subscriber.course_ids:
+            self._by_course[course_id].add(subscriber)
+            if course_id in snapshot:
+                self._last.setdefault(course_id, snapshot[course_id])
+        self._ensure_running()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+        for course_id in subscriber.course_ids:
+            subscribers = self._by_course.get(course_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._by_course[course_id]
+                self._last.pop(course_id, None)
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            # 后台任务由所有连接共享，使用空白上下文运行，不继承启动它的请求的
+            # 副本路由状态与指标记录器
+            self._task = loop.create_task(self._run(), context=contextvars.Context())
+
+    def retry_delay(self, failures):
+        """连续失败failures次后的等待时间：interval * 2^failures，不超过MAX_POLL_BACKOFF(且不短于interval)"""
+        if not failures:
+            return self.interval
+        return min(max(MAX_POLL_BACKOFF, self.interval), self.interval * 2 ** min(failures, 32))
+
+    async def _run(self):
+        failures = 0
+        while self._by_course:
+            await asyncio.sleep(self.retry_delay(failures))
+            try:
+                await self.poll()
+            except Exception:
+                failures += 1
+                logger.exception(
+                    "名额推送轮询失败(连续%d次)，%.1f秒后重试", failures, self.retry_delay(failures)
+                )
+            else:
+                failures = 0
+
+    async def poll(self):
+        """
+        检查一次变化并推送
+        版本未变化时只有一次主键查询；版本与名额都读主库，
+        不会读到比版本号更旧的副本数据
+        """
+        rows = CatalogVersion.objects.using(DEFAULT_DB_ALIAS).filter(
+            pk__in=(CatalogVersion.SINGLETON_ID, CatalogVersion.DATA_ID)
+        ).order_by('pk').values_list('pk', 'version')
+        version = tuple([row async for row in rows])
+        if version == self._version or not self._by_course:
+            return
+        self._version = version
+        current = await fetch_seats(self._by_course.keys(), using=DEFAULT_DB_ALIAS)
+        for course_id, payload in current.items():
+            if self._last.get(course_id) == payload:
+                continue
+            self._last[course_id] = payload
+            for subscriber in self._by_course.get(course_id, ()):
+                subscriber.push(course_id, payload)
+
+
+hub = SeatHub()
+
+
+async def stream(subscriber, snapshot):
+    """
+    一个SSE连接的事件流
+    先发送当前快照，之后等待推送；长时间无变化时发送心跳注释
+    """
+    try:
+        yield f"retry: {int(LIVE_INTERVAL * 3000)}\n\n"
+        for payload in snapshot.values():
+            yield format_event(payload)
+        while True:
+            try:
+                await asyncio.wait_for(subscriber.event.wait(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            for payload in subscriber.drain():
+                yield format_event(payload)
+    finally:
+        hub.unsubscribe(subscriber)
@@ -0,0 +1,53 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from courses.models import Course, CourseSlot
+from courses.timetable import find_conflicts
+
+
+def _clock(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class Command(BaseCommand):
+    """
+    审计全部选课记录中的上课时间冲突
+    一条查询按(学生, 星期, 开始时间)顺序流式读取所有已选课程的时段，
+    扫描线一次遍历找出每个学生的重叠时段；内存占用只与单个学生的课表大小有关
+    """
+    help = "一次扫描找出所有学生已选课程之间的上课时间冲突"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help='最多列出的冲突条数(0为全部)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='每次从数据库读取的行数')
+
+    def handle(self, *args, **options):
+        rows = (
+            CourseSlot.objects.filter(course__enrollment__isnull=False)
+            .order_by('course__enrollment__student_id', 'weekday', 'start_time', 'course_id')
+            .values_list('course__enrollment__student_id', 'course_id', 'weekday', 'start_time', 'end_time')
+            .iterator(chunk_size=options['chunk_size'])
+        )
+        conflicts = []
+        pairs = set()
+        for conflict in find_conflicts(rows):
+            student_id, course_a, course_b = conflict[:3]
+            pairs.add((student_id, *sorted((course_a, course_b))))
+            if not options['limit'] or len(conflicts) < options['limit']:
+                conflicts.append(conflict)
+
+        if not pairs:
+            self.stdout.write(self.style.SUCCESS("没有发现上课时间冲突"))
+            return
+
+        # 只为列出的冲突查询学生与课程名称
+        usernames = dict(User.objects.filter(pk__in={c[0] for c in conflicts}).values_list('pk', 'username'))
+        names = dict(Course.objects.filter(pk__in={c[i] for c in conflicts for i in (1, 2)}).values_list('pk', 'name'))
+        weekdays = dict(CourseSlot.WEEKDAYS)
+        for student_id, course_a, course_b, weekday, start, end in conflicts:
+            self.stdout.write(
+                f"{usernames.get(student_id, student_id)}: 《{names.get(course_a, course_a)}》与"
+                f"《{names.get(course_b, course_b)}》在{weekdays[weekday]} {_clock(start)}-{_clock(end)} 冲突"
+            )
+        students = len({student_id for student_id, _, _ in pairs})
+        self.stdout.write(self.style.WARNING(f"共 {students} 名学生存在 {len(pairs)} 组课程时间冲突"))
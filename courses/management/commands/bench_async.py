@@ -0,0 +1,89 @@
+import asyncio
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from courses import async_views, views
+from courses.benchmarks import benchmark_database, build_urlconf, run_asgi_load, summarize
+from courses.cache import get_cache
+from courses.heat import rebuild_heat
+from courses.models import Course, Enrollment
+from courses.signals import sync_enrollment_counts
+
+# 压测的只读页面
+PAGES = ('/', '/courses/', '/my-courses/')
+
+
+class Command(BaseCommand):
+    """
+    比较只读页面同步实现与原生异步实现在ASGI下的表现
+    在临时数据库中生成数据，以相同的请求序列和并发度分别驱动两种实现，
+    报告吞吐量与延迟分位数
+    """
+    help = "在ASGI下对比同步与异步只读视图的吞吐量与尾延迟"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200, help='学生数量')
+        parser.add_argument('--courses', type=int, default=300, help='课程数量')
+        parser.add_argument('--requests', type=int, default=2000, help='每种实现的请求数')
+        parser.add_argument('--concurrency', type=int, default=50, help='同时在途的请求数')
+        parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with benchmark_database():
+            cookies = self._prepare(rng, options)
+            requests = [
+                (rng.choice(PAGES), '', rng.choice(cookies)) for _ in range(options['requests'])
+            ]
+            for label, module in (('sync', views), ('async', async_views)):
+                get_cache().clear()
+                urlconf = build_urlconf(module)
+                with override_settings(ROOT_URLCONF=urlconf, ALLOWED_HOSTS=['testserver'], DEBUG=False):
+                    app = get_asgi_application()
+                    statuses, latencies, elapsed = asyncio.run(
+                        run_asgi_load(app, requests, options['concurrency'])
+                    )
+                connections.close_all()
+                self._report(label, statuses, summarize(latencies, elapsed))
+
+    def _prepare(self, rng, options):
+        """生成课程、学生与选课记录，返回每名学生的会话Cookie"""
+        password = make_password(None)
+        User.objects.bulk_create(
+            User(username=f'bench{i}', password=password) for i in range(options['students'])
+        )
+        Course.objects.bulk_create(
+            Course(name=f'压测课程{i:04d}', teacher=f'教师{i % 20}', capacity=100)
+            for i in range(options['courses'])
+        )
+        course_ids = list(Course.objects.values_list('pk', flat=True))
+        students = list(User.objects.all())
+        Enrollment.objects.bulk_create(
+            Enrollment(student=student, course_id=course_id)
+            for student in students
+            for course_id in rng.sample(course_ids, min(5, len(course_ids)))
+        )
+        sync_enrollment_counts()
+        rebuild_heat()
+
+        cookies = []
+        for student in students:
+            client = Client()
+            client.force_login(student)
+            cookies.append(f"sessionid={client.cookies['sessionid'].value}")
+        return cookies
+
+    def _report(self, label, statuses, summary):
+        errors = sum(1 for status in statuses if status != 200)
+        self.stdout.write(
+            f"[{label:5}] {summary['requests']} 次请求，吞吐 {summary['throughput']:.1f} 次/秒，"
+            f"p50 {summary['p50_ms']:.1f}ms / p95 {summary['p95_ms']:.1f}ms / "
+            f"p99 {summary['p99_ms']:.1f}ms / max {summary['max_ms']:.1f}ms，非200响应 {errors} 次"
+        )
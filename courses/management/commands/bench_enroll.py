@@ -0,0 +1,66 @@
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from courses.benchmarks import benchmark_database, oversubscribed_courses, run_concurrently, summarize
+from courses.models import Course
+from courses.services import enroll_student, enrollment_stats
+
+
+class Command(BaseCommand):
+    """
+    模拟选课开放瞬间的抢课高峰
+    在临时数据库中创建若干课程与学生，由多个线程同时选课，
+    报告吞吐量、延迟分位数、锁冲突重试次数，并校验没有超额选课
+    """
+    help = "在临时数据库中压测并发选课路径，报告吞吐与争用情况"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=500, help='学生数量')
+        parser.add_argument('--courses', type=int, default=5, help='课程数量')
+        parser.add_argument('--capacity', type=int, default=50, help='每门课程容量')
+        parser.add_argument('--workers', type=int, default=16, help='并发线程数')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            password = make_password(None)
+            User.objects.bulk_create(
+                User(username=f'bench{i}', password=password) for i in range(options['students'])
+            )
+            Course.objects.bulk_create(
+                Course(name=f'压测课程{i}', teacher='压测', capacity=options['capacity'])
+                for i in range(options['courses'])
+            )
+            students = list(User.objects.all())
+            course_ids = list(Course.objects.values_list('id', flat=True))
+            # 每名学生依次抢每一门课，制造同一行上的写冲突
+            jobs = [(student, course_id) for student in students for course_id in course_ids]
+
+            enrollment_stats.reset()
+            results, latencies, errors, elapsed = run_concurrently(
+                lambda job: enroll_student(*job), jobs, options['workers']
+            )
+
+            oversubscribed = oversubscribed_courses()
+
+        summary = summarize(latencies, elapsed)
+        stats = enrollment_stats.snapshot()
+        outcome = Counter(result.value for result in results)
+        self.stdout.write(
+            f"请求 {summary['requests']} 次，耗时 {elapsed:.2f}s，吞吐 {summary['throughput']:.1f} 次/秒"
+        )
+        self.stdout.write(
+            f"延迟 p50 {summary['p50_ms']:.1f}ms / p95 {summary['p95_ms']:.1f}ms / "
+            f"p99 {summary['p99_ms']:.1f}ms / max {summary['max_ms']:.1f}ms"
+        )
+        self.stdout.write(f"结果分布 {dict(outcome)}，错误 {len(errors)} 次")
+        self.stdout.write(
+            f"锁冲突重试 {stats['retries']} 次 (每次选课 {stats['contention_ratio']:.3f} 次)，"
+            f"放弃 {stats['lock_failures']} 次"
+        )
+        if oversubscribed:
+            self.stdout.write(self.style.ERROR(f"超额或计数不一致的课程: {oversubscribed}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("未出现超额选课"))
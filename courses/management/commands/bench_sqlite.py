@@ -0,0 +1,167 @@
+import json
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+
+from courses.benchmarks import benchmark_database, oversubscribed_courses, run_concurrently, summarize
+from courses.models import Course, Enrollment
+from courses.routers import READ_ONLY_ALIAS, read_only_view
+from courses.seeding import seed
+from courses.services import drop_student, enroll_student, enrollment_stats
+
+# 对比的两种配置：SQLite默认配置与生产模式(见settings.py)
+MODES = {
+    'default': {
+        'options': {'init_command': 'PRAGMA journal_mode=DELETE;'},
+        'conn_max_age': 0,
+        'read_only': False,
+    },
+    'production': {
+        'options': {'init_command': settings.SQLITE_PRAGMAS, 'transaction_mode': 'IMMEDIATE'},
+        'conn_max_age': 600,
+        'read_only': True,
+    },
+}
+# 读、选课、退课请求的比例
+MIX = (('read', 60), ('enroll', 25), ('drop', 15))
+
+
+@read_only_view
+def _read(student_id):
+    """模拟课程列表与我的课程页面的读查询"""
+    list(Course.objects.order_by('name', 'id').values('id', 'name', 'teacher', 'capacity', 'enrolled_count')[:30])
+    list(Enrollment.objects.filter(student_id=student_id).values_list('course_id', flat=True))
+
+
+@contextmanager
+def _configured(connection, config):
+    """把临时数据库的连接切换为指定模式，退出时恢复原配置"""
+    settings_dict = connection.settings_dict
+    saved = {key: settings_dict.get(key) for key in ('OPTIONS', 'CONN_MAX_AGE')}
+    settings_dict['OPTIONS'] = {**settings_dict['OPTIONS'], **config['options']}
+    settings_dict['CONN_MAX_AGE'] = config['conn_max_age']
+    connection.close()
+    routers = []
+    if config['read_only']:
+        connections.settings[READ_ONLY_ALIAS] = {
+            **settings_dict,
+            'NAME': f"file:{settings_dict['NAME']}?mode=ro",
+            'OPTIONS': {'timeout': 20, 'init_command': 'PRAGMA query_only=1;'},
+        }
+        routers = ['courses.routers.ReadOnlyRouter']
+    try:
+        with override_settings(DATABASE_ROUTERS=routers):
+            yield
+    finally:
+        connections.close_all()
+        connections.settings.pop(READ_ONLY_ALIAS, None)
+        settings_dict.update(saved)
+
+
+class Command(BaseCommand):
+    """
+    对比SQLite默认配置与生产模式下的并发读写表现
+    两种配置各自在临时数据库文件中用相同种子生成数据，以相同的请求序列
+    (读课程列表、抢热门课程、退课)由多个线程并发执行，
+    报告各类请求的延迟分位数、锁错误次数与选课服务的重试次数
+    """
+    help = "对比SQLite默认配置与生产模式(WAL、BEGIN IMMEDIATE、只读连接)的锁错误与延迟"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=300, help='学生数量')
+        parser.add_argument('--courses', type=int, default=200, help='课程数量')
+        parser.add_argument('--requests', type=int, default=3000, help='请求总数')
+        parser.add_argument('--workers', type=int, default=16, help='并发线程数')
+        parser.add_argument('--seed', type=int, default=0, help='随机种子')
+        parser.add_argument('-o', '--output', help='结果JSON文件路径')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            self.stdout.write(self.style.WARNING("默认数据库不是SQLite，无需对比"))
+            return
+        results = {}
+        for mode, config in MODES.items():
+            with benchmark_database() as connection:
+                with _configured(connection, config):
+                    results[mode] = self._run(options)
+            self._report(mode, results[mode])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(results, handle, ensure_ascii=False, indent=2)
+            self.stdout.write(f"结果已写入 {options['output']}")
+
+    def _run(self, options):
+        rng = random.Random(options['seed'])
+        seed(options['students'], options['courses'], options['students'] * 3,
+             random_seed=options['seed'], prefix='bench')
+        students = list(User.objects.order_by('pk'))
+        hot_courses = list(Course.objects.order_by('-enrolled_count', 'pk').values_list('pk', flat=True)[:5])
+        enrolled = list(Enrollment.objects.values_list('student_id', 'course_id'))
+        rng.shuffle(enrolled)
+
+        kinds = rng.choices([kind for kind, _ in MIX], weights=[weight for _, weight in MIX], k=options['requests'])
+        jobs = []
+        for kind in kinds:
+            if kind == 'drop' and enrolled:
+                jobs.append(('drop', enrolled.pop()))
+            elif kind == 'enroll':
+                jobs.append(('enroll', (rng.choice(students).pk, rng.choice(hot_courses))))
+            else:
+                jobs.append(('read', (rng.choice(students).pk, None)))
+        students_by_id = {student.pk: student for student in students}
+
+        def execute(job):
+            kind, (student_id, course_id) = job
+            started = time.perf_counter()
+            error = None
+            try:
+                if kind == 'read':
+                    _read(student_id)
+                elif kind == 'enroll':
+                    enroll_student(students_by_id[student_id], course_id)
+                else:
+                    drop_student(students_by_id[student_id], course_id)
+            except Exception as exc:  # 记录锁错误而不是中断压测
+                error = type(exc).__name__ + ': ' + str(exc)
+            return kind, time.perf_counter() - started, error
+
+        enrollment_stats.reset()
+        outcomes, _, _, elapsed = run_concurrently(execute, jobs, options['workers'])
+        stats = enrollment_stats.snapshot()
+
+        by_kind = {}
+        for kind, _ in MIX:
+            latencies = [latency for k, latency, _ in outcomes if k == kind]
+            errors = Counter(error for k, _, error in outcomes if k == kind and error)
+            by_kind[kind] = {**summarize(latencies, elapsed), 'errors': dict(errors)}
+        return {
+            'throughput': len(outcomes) / elapsed if elapsed > 0 else 0.0,
+            'requests': by_kind,
+            'retries': stats['retries'],
+            'lock_failures': stats['lock_failures'],
+            'oversubscribed': oversubscribed_courses(),
+        }
+
+    def _report(self, mode, result):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"[{mode}] 吞吐 {result['throughput']:.1f} 次/秒，选课服务重试 {result['retries']} 次，"
+            f"放弃 {result['lock_failures']} 次"
+        ))
+        for kind, summary in result['requests'].items():
+            errors = sum(summary['errors'].values())
+            self.stdout.write(
+                f"  {kind:6} {summary['requests']:5} 次  p50 {summary['p50_ms']:.1f}ms / "
+                f"p95 {summary['p95_ms']:.1f}ms / p99 {summary['p99_ms']:.1f}ms，错误 {errors} 次"
+            )
+            for message, count in summary['errors'].items():
+                self.stdout.write(f"      {count} × {message}")
+        if result['oversubscribed']:
+            self.stdout.write(self.style.ERROR(f"  超额或计数不一致的课程: {result['oversubscribed']}"))
+
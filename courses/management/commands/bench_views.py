@@ -0,0 +1,205 @@
+import json
+import random
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from courses.benchmarks import (
+    QueryCounter, benchmark_database, oversubscribed_courses, run_concurrently, summarize,
+)
+from courses.cache import get_cache
+from courses.models import Course, Enrollment
+from courses.seeding import DEFAULT_PASSWORD, seed
+
+# 参与压测的视图，按执行顺序排列(先选课再退课)
+VIEW_NAMES = ('login_view', 'course_list', 'my_courses', 'enroll_course', 'drop_course')
+
+
+class Command(BaseCommand):
+    """
+    并发压测主要视图
+    对每种目录规模在临时数据库中用seed生成数据，由多个线程模拟学生并发请求
+    登录、课程列表、我的课程、选课、退课，报告延迟分位数、吞吐量、每次请求的
+    SQL条数与超额选课情况，结果写入JSON以便对比不同提交
+    某个视图的SQL条数随目录规模增长(N+1查询)时以非零状态退出
+    用法：
+    - python manage.py bench_views --sizes 100,2000 --students 300 --concurrency 16 -o bench.json
+    """
+    help = "在不同目录规模下并发压测课程相关视图，结果写入JSON并检查SQL条数是否随规模增长"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000', help='逗号分隔的课程数量(目录规模)')
+        parser.add_argument('--students', type=int, default=200, help='学生数量')
+        parser.add_argument('--enrollments-per-student', type=int, default=3, help='每名学生的初始选课数')
+        parser.add_argument('--requests', type=int, default=200, help='每个视图的请求数')
+        parser.add_argument('--concurrency', type=int, default=8, help='并发模拟学生数(线程数)')
+        parser.add_argument('--seed', type=int, default=0, help='随机种子')
+        parser.add_argument('--hasher', default='default', help='生成账号的密码哈希算法(见seed命令)')
+        parser.add_argument(
+            '--query-slack',
+            type=int,
+            default=0,
+            help='允许最大规模比最小规模多出的每请求SQL条数',
+        )
+        parser.add_argument('-o', '--output', help='结果JSON文件路径')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',') if size.strip()})
+        except ValueError:
+            raise CommandError("--sizes 必须是逗号分隔的整数")
+        if not sizes:
+            raise CommandError("至少需要一种目录规模")
+
+        runs = []
+        for size in sizes:
+            with benchmark_database():
+                with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+                    runs.append(self._run_size(size, options))
+
+        growth = self._query_growth(runs, options['query_slack'])
+        result = {
+            'created_at': timezone.now().isoformat(),
+            'options': {
+                key: options[key]
+                for key in ('students', 'enrollments_per_student', 'requests', 'concurrency', 'seed', 'hasher')
+            },
+            'runs': runs,
+            'query_growth': growth,
+            'passed': not any(item['grew'] for item in growth.values())
+            and not any(run['oversubscribed'] for run in runs),
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(result, handle, ensure_ascii=False, indent=2)
+            self.stdout.write(f"结果已写入 {options['output']}")
+
+        for run in runs:
+            if run['oversubscribed']:
+                self.stdout.write(self.style.ERROR(
+                    f"[{run['courses']} 门课程] 超额或计数不一致的课程: {run['oversubscribed']}"
+                ))
+        grew = [name for name, item in growth.items() if item['grew']]
+        if grew:
+            raise CommandError(f"以下视图的每请求SQL条数随目录规模增长: {', '.join(grew)}")
+        if not result['passed']:
+            raise CommandError("出现超额选课")
+        self.stdout.write(self.style.SUCCESS("SQL条数不随目录规模增长，未出现超额选课"))
+
+    def _run_size(self, size, options):
+        """在当前临时数据库中生成一种规模的数据并依次压测各视图"""
+        rng = random.Random(options['seed'])
+        seed(
+            options['students'],
+            size,
+            options['students'] * options['enrollments_per_student'],
+            random_seed=options['seed'],
+            hasher=options['hasher'],
+            prefix='bench',
+        )
+        students = list(User.objects.order_by('pk'))
+        cookies = {}
+        for student in students:
+            client = Client()
+            client.force_login(student)
+            cookies[student.pk] = client.cookies['sessionid'].value
+        course_ids = list(Course.objects.values_list('pk', flat=True))
+        hot_courses = course_ids[:10]
+        enrolled = list(Enrollment.objects.values_list('student_id', 'course_id'))
+        count = options['requests']
+
+        # 冷缓存探测请求：每种规模下走同一条代码路径(新选一门有空位的课、退一门无人候补的课)
+        probe_student = students[0]
+        roomy_course = Course.objects.exclude(pk__in=hot_courses).exclude(
+            enrollment__student=probe_student
+        ).order_by(F('enrolled_count') - F('capacity'), 'pk').first()
+        drop_pair = next(pair for pair in enrolled if pair[1] not in hot_courses)
+        enrolled.remove(drop_pair)
+        probes = {
+            'login_view': (
+                'post', reverse('login'), {'username': probe_student.username, 'password': DEFAULT_PASSWORD}, None
+            ),
+            'course_list': ('get', reverse('course_list'), None, probe_student.pk),
+            'my_courses': ('get', reverse('my_courses'), None, probe_student.pk),
+            'enroll_course': ('get', reverse('enroll_course', args=[roomy_course.pk]), None, probe_student.pk),
+            'drop_course': ('get', reverse('drop_course', args=[drop_pair[1]]), None, drop_pair[0]),
+        }
+
+        # 每个视图的并发请求：(方法, 路径, 表单数据, 学生ID)
+        jobs = {
+            'login_view': [
+                ('post', reverse('login'), {'username': student.username, 'password': DEFAULT_PASSWORD}, None)
+                for student in rng.choices(students, k=count)
+            ],
+            'course_list': [
+                ('get', reverse('course_list'), None, student.pk) for student in rng.choices(students, k=count)
+            ],
+            'my_courses': [
+                ('get', reverse('my_courses'), None, student.pk) for student in rng.choices(students, k=count)
+            ],
+            # 选课集中在少数课程上，制造同一行上的写冲突
+            'enroll_course': [
+                ('get', reverse('enroll_course', args=[course_id]), None, student.pk)
+                for student, course_id in zip(rng.choices(students, k=count), rng.choices(hot_courses, k=count))
+            ],
+            'drop_course': [
+                ('get', reverse('drop_course', args=[course_id]), None, student_id)
+                for student_id, course_id in rng.sample(enrolled, min(count, len(enrolled)))
+            ],
+        }
+
+        def request(job):
+            method, path, data, student_id = job
+            client = Client()
+            if student_id is not None:
+                client.cookies['sessionid'] = cookies[student_id]
+            with QueryCounter() as counter:
+                response = getattr(client, method)(path, data)
+            return response.status_code, counter.count
+
+        views = {}
+        for name in VIEW_NAMES:
+            # 先在冷缓存、无并发争用的情况下单独发出一个请求，得到稳定的SQL条数用于规模对比
+            get_cache().clear()
+            _, cold_queries = request(probes[name])
+            get_cache().clear()
+            results, latencies, errors, elapsed = run_concurrently(request, jobs[name], options['concurrency'])
+            queries = [queries for _, queries in results]
+            summary = summarize(latencies, elapsed)
+            summary.update({
+                'queries_mean': sum(queries) / len(queries) if queries else 0.0,
+                'queries_max': max(queries, default=0),
+                'queries_cold': cold_queries,
+                'errors': len(errors) + sum(1 for status, _ in results if status >= 400),
+                'statuses': dict(Counter(str(status) for status, _ in results)),
+            })
+            for exc in errors[:3]:
+                self.stderr.write(f"[{size} 门课程] {name} 请求失败: {exc!r}")
+            views[name] = summary
+            self.stdout.write(
+                f"[{size} 门课程] {name:14} 吞吐 {summary['throughput']:.1f} 次/秒，"
+                f"p50 {summary['p50_ms']:.1f}ms / p95 {summary['p95_ms']:.1f}ms / "
+                f"p99 {summary['p99_ms']:.1f}ms，SQL 平均 {summary['queries_mean']:.1f} "
+                f"最多 {summary['queries_max']} 条 (冷缓存 {cold_queries} 条)，错误 {summary['errors']} 次"
+            )
+        return {'courses': size, 'views': views, 'oversubscribed': oversubscribed_courses()}
+
+    def _query_growth(self, runs, slack):
+        """
+        比较最小与最大规模下每个视图冷缓存单次请求的SQL条数
+        并发阶段的条数包含锁冲突重试，不用于规模对比
+        """
+        smallest, largest = runs[0], runs[-1]
+        return {
+            name: {
+                'queries_cold': [run['views'][name]['queries_cold'] for run in runs],
+                'grew': largest['views'][name]['queries_cold'] > smallest['views'][name]['queries_cold'] + slack,
+            }
+            for name in VIEW_NAMES
+        }
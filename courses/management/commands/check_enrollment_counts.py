@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from courses.signals import enrollment_count_drift, sync_enrollment_counts
+
+
+class Command(BaseCommand):
+    """
+    检查并修复课程已选人数(enrolled_count)的漂移
+    用法：
+    - python manage.py check_enrollment_counts          只检查并报告
+    - python manage.py check_enrollment_counts --fix    按选课记录重算
+    """
+    help = "检查课程已选人数冗余字段与选课记录是否一致，可选修复"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='将不一致的课程按实际选课记录数重算',
+        )
+
+    def handle(self, *args, **options):
+        drift = enrollment_count_drift()
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("所有课程的已选人数均一致"))
+            return
+
+        for course_id, stored, actual in drift:
+            self.stdout.write(f"课程 {course_id}: 记录值 {stored}，实际 {actual}")
+
+        if not options['fix']:
+            self.stdout.write(self.style.WARNING(f"共 {len(drift)} 门课程计数不一致，使用 --fix 修复"))
+            return
+
+        with transaction.atomic():
+            updated = sync_enrollment_counts([course_id for course_id, _, _ in drift])
+        self.stdout.write(self.style.SUCCESS(f"已修复 {updated} 门课程的已选人数"))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.exporting import CHUNK_SIZE, EXPORT_FORMATS, export_lines
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    """
+    流式导出选课记录或某门课程的名单
+    用法：
+    - python manage.py export_enrollments > enrollments.csv
+    - python manage.py export_enrollments --course 3 --format jsonl -o roster.jsonl
+    """
+    help = "以CSV或JSON Lines流式导出选课记录，内存占用与行数无关"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help='导出格式')
+        parser.add_argument('--course', type=int, help='只导出该课程ID的名单')
+        parser.add_argument('-o', '--output', help='输出文件路径，默认写到标准输出')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='每次从数据库读取的行数')
+
+    def handle(self, *args, **options):
+        course_id = options['course']
+        if course_id is not None and not Course.objects.filter(pk=course_id).exists():
+            raise CommandError(f"课程 {course_id} 不存在")
+
+        lines = export_lines(options['format'], course_id, options['chunk_size'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        count = 0
+        with open(options['output'], 'w', newline='', encoding='utf-8') as handle:
+            for line in lines:
+                handle.write(line)
+                count += 1
+        if options['format'] == 'csv':
+            count -= 1  # 表头
+        self.stderr.write(self.style.SUCCESS(f"已导出 {count} 条选课记录到 {options['output']}"))
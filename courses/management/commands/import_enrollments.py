@@ -0,0 +1,75 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.importing import DEFAULT_CHUNK_SIZE, course_lookup, import_enrollments
+
+
+def _cell(row, field):
+    return (row.get(field) or '').strip()
+
+
+class Command(BaseCommand):
+    """
+    从CSV文件批量导入选课记录
+    文件需包含表头：username列，以及course_id列(按课程ID)或course列(按课程名称)
+    用法：
+    - python manage.py import_enrollments roster.csv
+    - python manage.py import_enrollments roster.csv --chunk-size 10000 --allow-over-capacity
+    """
+    help = "流式导入选课名单(CSV)，报告导入速度、重复记录与超出容量的记录"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV文件路径，"-"表示标准输入')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='每个事务处理的行数')
+        parser.add_argument('--encoding', default='utf-8-sig', help='文件编码')
+        parser.add_argument(
+            '--allow-over-capacity',
+            action='store_true',
+            help='不检查课程容量(默认超出容量的记录会被跳过并计数)',
+        )
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            self._run(sys.stdin, options)
+            return
+        try:
+            with open(options['path'], newline='', encoding=options['encoding']) as handle:
+                self._run(handle, options)
+        except OSError as exc:
+            raise CommandError(f"无法读取文件: {exc}")
+
+    def _run(self, handle, options):
+        reader = csv.DictReader(handle)
+        fields = reader.fieldnames or []
+        if 'username' not in fields:
+            raise CommandError("CSV缺少username列")
+        if 'course_id' in fields:
+            course_field, lookup_by = 'course_id', 'id'
+        elif 'course' in fields:
+            course_field, lookup_by = 'course', 'name'
+        else:
+            raise CommandError("CSV缺少course_id或course列")
+
+        # 列数不足的行缺少的字段为None，按空值处理，由导入统计为无效行
+        rows = ((_cell(row, 'username'), _cell(row, course_field)) for row in reader)
+        report = import_enrollments(
+            rows,
+            course_lookup(lookup_by),
+            chunk_size=options['chunk_size'],
+            allow_over_capacity=options['allow_over_capacity'],
+            progress=self._progress if options['verbosity'] > 1 else None,
+        )
+
+        self.stdout.write(
+            f"处理 {report.rows} 行，用时 {report.elapsed:.2f}s ({report.rows_per_second:.0f} 行/秒)"
+        )
+        self.stdout.write(
+            f"新增 {report.inserted}，重复 {report.duplicates}，超出容量 {report.over_capacity}，"
+            f"未知用户 {report.unknown_users}，未知课程 {report.unknown_courses}，无效 {report.invalid}"
+        )
+        self.stdout.write(self.style.SUCCESS("导入完成"))
+
+    def _progress(self, report):
+        self.stdout.write(f"  已处理 {report.rows} 行 ({report.rows_per_second:.0f} 行/秒)")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from courses.services import promote_waitlists
+
+
+class Command(BaseCommand):
+    """
+    批量递补候补学生
+    处理所有有空余名额且有候补学生的课程(如批量调大容量之后)
+    """
+    help = "为有空余名额的课程按候补顺序递补学生"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'course_ids',
+            nargs='*',
+            type=int,
+            help='只处理指定课程ID，默认处理全部课程',
+        )
+
+    def handle(self, *args, **options):
+        results = promote_waitlists(options['course_ids'] or None)
+        for course_id, student_ids in results.items():
+            self.stdout.write(f"课程 {course_id}: 递补 {len(student_ids)} 名学生")
+        total = sum(len(student_ids) for student_ids in results.values())
+        self.stdout.write(self.style.SUCCESS(f"共递补 {total} 名学生"))
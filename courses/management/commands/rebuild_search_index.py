@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from courses.search import is_supported, rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    全量重建课程全文索引
+    在批量导入课程(bulk_create等不触发信号的写入)之后使用
+    """
+    help = "按课程表全量重建FTS5全文索引"
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            self.stdout.write(self.style.WARNING("当前数据库不使用FTS5索引，无需重建"))
+            return
+        total = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"已为 {total} 门课程重建索引"))
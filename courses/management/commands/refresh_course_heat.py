@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from courses.heat import rebuild_heat
+
+
+class Command(BaseCommand):
+    """
+    全量重建选课热度快照
+    日常由信号增量维护，仅在批量导入或修复数据之后需要执行
+    """
+    help = "按课程表重建选课热度快照(CourseHeat)"
+
+    def handle(self, *args, **options):
+        total = rebuild_heat()
+        self.stdout.write(self.style.SUCCESS(f"已刷新 {total} 门课程的热度快照"))
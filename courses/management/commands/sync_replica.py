@@ -0,0 +1,52 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from courses.routers import replica_aliases
+
+
+class Command(BaseCommand):
+    """
+    把主库复制到只读副本(本地用两个SQLite文件模拟主从复制)
+    使用SQLite在线备份接口逐页复制，复制期间主库照常读写；
+    可配合 --interval 循环执行来模拟带延迟的异步复制
+    """
+    help = "用SQLite在线备份把主库复制到COURSES_REPLICA_ALIASES中的副本"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='aliases',
+                            help='只复制指定的副本别名(可重复)，默认全部')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='大于0时每隔该秒数重复复制，直到中断')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or list(replica_aliases())
+        if not aliases:
+            raise CommandError("未配置只读副本(环境变量COURSES_REPLICA_DBS)")
+        unknown = [alias for alias in aliases if alias not in replica_aliases()]
+        if unknown:
+            raise CommandError(f"不是已配置的副本: {', '.join(unknown)}")
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            raise CommandError("只支持SQLite主库，其他数据库请使用其自带的复制机制")
+
+        while True:
+            for alias in aliases:
+                started = time.perf_counter()
+                self._copy(alias)
+                self.stdout.write(f"{alias}: 复制完成，用时 {(time.perf_counter() - started) * 1000:.1f}ms")
+            if options['interval'] <= 0:
+                break
+            time.sleep(options['interval'])
+
+    def _copy(self, alias):
+        source = connections[DEFAULT_DB_ALIAS]
+        source.ensure_connection()
+        # 关闭副本上的持久连接，复制完成后重新打开即可看到新数据
+        connections[alias].close()
+        target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+        try:
+            source.connection.backup(target)
+        finally:
+            target.close()
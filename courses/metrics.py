@@ -0,0 +1,239 @@
+"""
+按视图统计请求延迟与SQL查询(进程内聚合)
+- RequestRecorder: 记录单个请求的查询条数、耗时与SQL文本
+- recording / install: 每个数据库连接创建时安装一次execute_wrapper，按上下文变量
+  把查询交给当前请求的记录器；上下文变量会随sync_to_async传递，异步视图中
+  在线程池里执行的ORM查询同样计入发起它的请求
+- ViewMetrics: 按URL名称聚合延迟直方图、查询条数直方图与查询总耗时(线程安全)
+- render_prometheus: 以Prometheus文本格式输出，并附带缓存命中、选课写路径与限流统计
+每个进程各自聚合，多进程部署时由Prometheus按实例分别抓取后再汇总
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .cache import cache_stats
+from .ratelimit import rate_limit_stats
+from .services import enrollment_stats
+
+# 延迟直方图的桶上限(秒)，与Prometheus客户端库的默认值一致
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 每个请求查询条数的桶上限
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+# 慢请求日志中最多保留的SQL条数
+MAX_RECORDED_QUERIES = 100
+# 未匹配到URL名称(如404)的请求统一计入该标签，避免标签数量无限增长
+UNRESOLVED = '<unresolved>'
+
+
+class RequestRecorder:
+    """
+    单个请求的查询记录器，接口与数据库execute_wrapper相同
+    只保存前MAX_RECORDED_QUERIES条SQL文本与耗时，供慢请求日志使用
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.seconds += duration
+            if len(self.queries) < MAX_RECORDED_QUERIES:
+                self.queries.append((sql, duration))
+
+
+_active_recorder = ContextVar('courses_active_recorder', default=None)
+
+
+def _dispatch(execute, sql, params, many, context):
+    recorder = _active_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(connection):
+    """在数据库连接上安装分发用的execute_wrapper(重复调用无副作用)"""
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+
+def current_recorder():
+    """当前上下文的记录器，没有时返回None"""
+    return _active_recorder.get()
+
+
+@contextmanager
+def recording(recorder):
+    """在当前上下文(线程或协程)中把查询交给recorder记录；recorder为None时暂停记录"""
+    token = _active_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _active_recorder.reset(token)
+
+
+class _Histogram:
+    """累积直方图：各桶计数、总和与总数"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.total = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.total += 1
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            yield bound, running
+
+
+class ViewMetrics:
+    """按(URL名称, 请求方法)聚合请求指标(进程内，线程安全)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._latency = {}
+            self._queries = {}
+            self._query_seconds = {}
+            self._responses = {}
+
+    def record(self, view, method, status, duration, recorder):
+        key = (view, method)
+        with self._lock:
+            if key not in self._latency:
+                self._latency[key] = _Histogram(LATENCY_BUCKETS)
+                self._queries[key] = _Histogram(QUERY_BUCKETS)
+                self._query_seconds[key] = 0.0
+            self._latency[key].observe(duration)
+            self._queries[key].observe(recorder.count)
+            self._query_seconds[key] += recorder.seconds
+            status_key = (view, method, status)
+            self._responses[status_key] = self._responses.get(status_key, 0) + 1
+
+    def snapshot(self):
+        """
+        返回 {(URL名称, 方法): {'requests', 'latency_sum', 'queries_sum', 'query_seconds'}}
+        """
+        with self._lock:
+            return {
+                key: {
+                    'requests': histogram.total,
+                    'latency_sum': histogram.sum,
+                    'queries_sum': self._queries[key].sum,
+                    'query_seconds': self._query_seconds[key],
+                }
+                for key, histogram in self._latency.items()
+            }
+
+    def render(self):
+        """以Prometheus文本格式输出本进程的请求指标"""
+        with self._lock:
+            lines = []
+            lines += _histogram_lines(
+                'courses_request_duration_seconds', '按视图统计的请求耗时', self._latency
+            )
+            lines += _histogram_lines(
+                'courses_request_queries', '按视图统计的每个请求SQL条数', self._queries
+            )
+            lines += [
+                '# HELP courses_request_query_seconds_total 按视图累计的SQL执行时间',
+                '# TYPE courses_request_query_seconds_total counter',
+            ]
+            lines += [
+                f'courses_request_query_seconds_total{_labels(view=view, method=method)} {seconds:.6f}'
+                for (view, method), seconds in sorted(self._query_seconds.items())
+            ]
+            lines += [
+                '# HELP courses_responses_total 按视图与状态码统计的响应数',
+                '# TYPE courses_responses_total counter',
+            ]
+            lines += [
+                f'courses_responses_total{_labels(view=view, method=method, status=status)} {count}'
+                for (view, method, status), count in sorted(self._responses.items())
+            ]
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_bound(bound):
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+def _histogram_lines(name, help_text, histograms):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for (view, method), histogram in sorted(histograms.items()):
+        for bound, count in histogram.cumulative():
+            lines.append(f'{name}_bucket{_labels(view=view, method=method, le=_format_bound(bound))} {count}')
+        lines.append(f'{name}_bucket{_labels(view=view, method=method, le="+Inf")} {histogram.total}')
+        lines.append(f'{name}_sum{_labels(view=view, method=method)} {histogram.sum:.6f}')
+        lines.append(f'{name}_count{_labels(view=view, method=method)} {histogram.total}')
+    return lines
+
+
+def _stats_lines():
+    """缓存命中统计、选课写路径统计与限流统计"""
+    lines = [
+        '# HELP courses_cache_requests_total 按命名空间统计的缓存命中与未命中次数',
+        '# TYPE courses_cache_requests_total counter',
+    ]
+    for namespace, stats in sorted(cache_stats.snapshot().items()):
+        lines.append(f'courses_cache_requests_total{_labels(namespace=namespace, result="hit")} {stats["hits"]}')
+        lines.append(f'courses_cache_requests_total{_labels(namespace=namespace, result="miss")} {stats["misses"]}')
+
+    stats = enrollment_stats.snapshot()
+    lines += [
+        '# HELP courses_enrollment_events_total 选课写路径的结果与争用计数',
+        '# TYPE courses_enrollment_events_total counter',
+    ]
+    lines += [
+        f'courses_enrollment_events_total{_labels(event=field)} {stats[field]}'
+        for field in enrollment_stats.FIELDS
+    ]
+
+    lines += [
+        '# HELP courses_rate_limit_total 选课写接口限流的放行(其中local为本地租约放行)、拒绝与退还次数',
+        '# TYPE courses_rate_limit_total counter',
+    ]
+    for scope, counts in sorted(rate_limit_stats.snapshot().items()):
+        lines += [
+            f'courses_rate_limit_total{_labels(scope=scope, result=result)} {counts[result]}'
+            for result in rate_limit_stats.RESULTS
+        ]
+    return lines
+
+
+def render_prometheus():
+    """返回完整的Prometheus文本格式指标"""
+    return '\n'.join(view_metrics.render() + _stats_lines()) + '\n'
+
+
+view_metrics = ViewMetrics()
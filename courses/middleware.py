@@ -0,0 +1,177 @@
+"""
+课程应用的中间件
+- MetricsMiddleware: 按视图记录请求延迟、SQL条数与SQL耗时，并记录慢请求日志
+- ProfilingMiddleware: 管理员按需对单个请求做cProfile分析并获取SQL执行计划
+- ReplicaStickinessMiddleware: 只读副本的读己之写粘滞(见routers.py)
+"""
+import cProfile
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import profiling, routers
+from .metrics import UNRESOLVED, RequestRecorder, recording, view_metrics
+
+slow_logger = logging.getLogger('courses.slow')
+
+# 超过该耗时(秒)的请求写入慢请求日志
+SLOW_REQUEST_SECONDS = getattr(settings, 'COURSES_SLOW_REQUEST_SECONDS', 1.0)
+
+
+class MetricsMiddleware:
+    """
+    请求指标中间件(同时支持WSGI与ASGI)
+    逻辑：
+    1. 把本请求的记录器设为当前上下文的记录器，统计所有数据库连接上的SQL条数与耗时
+    2. 响应返回后按URL名称聚合到view_metrics，由/metrics/接口输出
+    3. 耗时超过SLOW_REQUEST_SECONDS时，把请求与其执行的SQL写入courses.slow日志
+    应放在MIDDLEWARE的最前面，使统计覆盖其余中间件(会话、认证等)的查询
+    流式响应只统计到响应头返回为止
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        recorder = RequestRecorder()
+        started = time.perf_counter()
+        with recording(recorder):
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = RequestRecorder()
+        started = time.perf_counter()
+        with recording(recorder):
+            response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    def _record(self, request, response, duration, recorder):
+        match = request.resolver_match
+        view = match.view_name if match is not None else UNRESOLVED
+        view_metrics.record(view, request.method, response.status_code, duration, recorder)
+        if duration >= SLOW_REQUEST_SECONDS:
+            slow_logger.warning(
+                "慢请求 %s %s (%s) 耗时 %.3fs，SQL %d 条共 %.3fs\n%s",
+                request.method,
+                request.get_full_path(),
+                view,
+                duration,
+                recorder.count,
+                recorder.seconds,
+                '\n'.join(f'  [{seconds * 1000:.1f}ms] {sql}' for sql, seconds in recorder.queries),
+            )
+
+
+class ProfilingMiddleware:
+    """
+    按需请求性能分析中间件(同时支持WSGI与ASGI)
+    逻辑：
+    1. 请求未携带 X-Profile: 1 请求头或 ?_profile=1 参数时直接放行，
+       只多一次请求头与查询参数的字典查找，不访问数据库
+    2. 请求方为管理员时，在cProfile下执行请求并记录全部SQL与参数
+    3. 响应返回后获取每条SQL的执行计划，保存pstats与文本报告，
+       并通过 X-Profile-Id 响应头返回分析ID，可在 /profiles/ 下载
+    必须放在AuthenticationMiddleware之后；COURSES_PROFILING为False时不加载
+    ASGI下cProfile统计的是事件循环线程，同一时间段内其他请求的协程也会计入
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'COURSES_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not profiling.requested(request) or not request.user.is_staff:
+            return self.get_response(request)
+
+        profiler, capture = cProfile.Profile(), profiling.QueryCapture()
+        started = time.perf_counter()
+        with recording(capture):
+            response = profiler.runcall(self.get_response, request)
+        elapsed = time.perf_counter() - started
+        return self._finish(request, response, profiler, capture, elapsed)
+
+    async def __acall__(self, request):
+        if not profiling.requested(request) or not (await request.auser()).is_staff:
+            return await self.get_response(request)
+
+        profiler, capture = cProfile.Profile(), profiling.QueryCapture()
+        started = time.perf_counter()
+        with recording(capture):
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+        elapsed = time.perf_counter() - started
+        return await sync_to_async(self._finish)(request, response, profiler, capture, elapsed)
+
+    def _finish(self, request, response, profiler, capture, elapsed):
+        report = profiling.build_report(request, response, profiler, capture, elapsed)
+        response['X-Profile-Id'] = profiling.save(profiler, report)
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """
+    只读副本的读己之写中间件(同时支持WSGI与ASGI)
+    逻辑：
+    1. 请求携带未过期的粘滞Cookie时，本请求的读查询全部走主库
+    2. 本请求写入了课程/选课等分流模型时，响应中设置粘滞Cookie，
+       之后COURSES_REPLICA_STICKY_SECONDS秒内(应大于副本的复制延迟)该客户端读主库
+    未配置COURSES_REPLICA_ALIASES时不加载
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not routers.replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, 'COURSES_REPLICA_STICKY_SECONDS', 10)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with routers.replica_request(routers.is_pinned(request)) as state:
+            response = self.get_response(request)
+        return self._finish(state, response)
+
+    async def __acall__(self, request):
+        with routers.replica_request(routers.is_pinned(request)) as state:
+            response = await self.get_response(request)
+        return self._finish(state, response)
+
+    def _finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                routers.STICKY_COOKIE,
+                f'{time.time() + self.sticky_seconds:.3f}',
+                max_age=self.sticky_seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
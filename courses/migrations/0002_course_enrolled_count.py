@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_enrolled_count(apps, schema_editor):
+    """按已有选课记录回填已选人数"""
+    Course = apps.get_model("courses", "Course")
+    Enrollment = apps.get_model("courses", "Enrollment")
+    actual = (
+        Enrollment.objects.filter(course=OuterRef("pk"))
+        .order_by()
+        .values("course")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    Course.objects.update(enrolled_count=Coalesce(Subquery(actual), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="enrolled_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="已选人数"
+            ),
+        ),
+        migrations.RunPython(backfill_enrolled_count, migrations.RunPython.noop),
+    ]
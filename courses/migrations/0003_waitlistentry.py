@@ -0,0 +1,63 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0002_course_enrolled_count"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WaitlistEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("position", models.PositiveBigIntegerField(verbose_name="候补序号")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="加入时间"),
+                ),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="courses.course",
+                        verbose_name="课程",
+                    ),
+                ),
+                (
+                    "student",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="学生",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "候补记录",
+                "verbose_name_plural": "候补记录",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("course", "student"), name="unique_waitlist_student"
+                    ),
+                    models.UniqueConstraint(
+                        fields=("course", "position"), name="unique_waitlist_position"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0003_waitlistentry"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(fields=["name", "id"], name="course_name_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["teacher", "name", "id"], name="course_teacher_name_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(fields=["teacher", "id"], name="course_teacher_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(fields=["created_at"], name="course_created_at_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["-enrolled_count", "id"], name="course_enrolled_count_idx"
+            ),
+        ),
+    ]
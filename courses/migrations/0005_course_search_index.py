@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """SQLite下创建FTS5课程索引并写入已有课程"""
+    from courses.search import INDEXED_FIELDS, create_index, is_supported, segment
+
+    connection = schema_editor.connection
+    if not is_supported(connection):
+        return
+    create_index(connection)
+    Course = apps.get_model("courses", "Course")
+    rows = [
+        [pk] + [segment(value) for value in values]
+        for pk, *values in Course.objects.values_list("pk", *INDEXED_FIELDS)
+    ]
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO courses_course_fts (rowid, name, teacher, description) "
+                "VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    from courses.search import drop_index, is_supported
+
+    if is_supported(schema_editor.connection):
+        drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0004_course_catalog_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_singleton(apps, schema_editor):
+    """创建目录版本的唯一一行"""
+    CatalogVersion = apps.get_model("courses", "CatalogVersion")
+    CatalogVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0005_course_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "version",
+                    models.PositiveBigIntegerField(default=0, verbose_name="版本号"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="更新时间"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "课程目录版本",
+                "verbose_name_plural": "课程目录版本",
+            },
+        ),
+        migrations.RunPython(create_singleton, migrations.RunPython.noop),
+    ]
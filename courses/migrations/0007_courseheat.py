@@ -0,0 +1,83 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_heat(apps, schema_editor):
+    """按已有课程生成热度快照"""
+    Course = apps.get_model("courses", "Course")
+    CourseHeat = apps.get_model("courses", "CourseHeat")
+    CourseHeat.objects.bulk_create(
+        [
+            CourseHeat(
+                course_id=pk,
+                label=name,
+                enrolled=enrolled,
+                capacity=capacity,
+                fill_ratio=enrolled / capacity if capacity else 0.0,
+            )
+            for pk, name, enrolled, capacity in Course.objects.values_list(
+                "pk", "name", "enrolled_count", "capacity"
+            )
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0006_catalogversion"),
+    ]
+
+    operations = [
+        # 选课热度图表改为读取CourseHeat快照，课程表上的已选人数索引不再需要
+        migrations.RemoveIndex(
+            model_name="course",
+            name="course_enrolled_count_idx",
+        ),
+        migrations.CreateModel(
+            name="CourseHeat",
+            fields=[
+                (
+                    "course",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="heat",
+                        serialize=False,
+                        to="courses.course",
+                        verbose_name="课程",
+                    ),
+                ),
+                ("label", models.CharField(max_length=100, verbose_name="标签")),
+                (
+                    "enrolled",
+                    models.PositiveIntegerField(default=0, verbose_name="已选人数"),
+                ),
+                (
+                    "capacity",
+                    models.PositiveIntegerField(default=0, verbose_name="课程容量"),
+                ),
+                ("fill_ratio", models.FloatField(default=0.0, verbose_name="选课比例")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+            ],
+            options={
+                "verbose_name": "选课热度",
+                "verbose_name_plural": "选课热度",
+                "indexes": [
+                    models.Index(
+                        fields=["-enrolled", "course"], name="heat_enrolled_idx"
+                    ),
+                    models.Index(
+                        fields=["-fill_ratio", "course"], name="heat_fill_ratio_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_heat, migrations.RunPython.noop),
+    ]
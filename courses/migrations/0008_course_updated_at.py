@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    """已有课程的更新时间取创建时间"""
+    Course = apps.get_model("courses", "Course")
+    Course.objects.update(updated_at=models.F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0007_courseheat"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="更新时间",
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0008_course_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CourseSlot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "weekday",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (1, "周一"),
+                            (2, "周二"),
+                            (3, "周三"),
+                            (4, "周四"),
+                            (5, "周五"),
+                            (6, "周六"),
+                            (7, "周日"),
+                        ],
+                        verbose_name="星期",
+                    ),
+                ),
+                ("start_time", models.TimeField(verbose_name="开始时间")),
+                ("end_time", models.TimeField(verbose_name="结束时间")),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="slots",
+                        to="courses.course",
+                        verbose_name="课程",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "上课时段",
+                "verbose_name_plural": "上课时段",
+                "ordering": ["weekday", "start_time"],
+                "constraints": [
+                    models.CheckConstraint(
+                        condition=models.Q(("end_time__gt", models.F("start_time"))),
+                        name="slot_end_after_start",
+                    ),
+                    models.CheckConstraint(
+                        condition=models.Q(("weekday__gte", 1), ("weekday__lte", 7)),
+                        name="slot_weekday_range",
+                    ),
+                ],
+            },
+        ),
+    ]
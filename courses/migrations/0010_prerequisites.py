@@ -0,0 +1,73 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0009_courseslot"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="prerequisites",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="required_by",
+                to="courses.course",
+                verbose_name="先修课程",
+            ),
+        ),
+        migrations.CreateModel(
+            name="Completion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "completed_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="完成时间"
+                    ),
+                ),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="completions",
+                        to="courses.course",
+                        verbose_name="课程",
+                    ),
+                ),
+                (
+                    "student",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="学生",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "修读完成记录",
+                "verbose_name_plural": "修读完成记录",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("student", "course"), name="unique_completion"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0010_prerequisites"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WaitlistIndexNode",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("node", models.PositiveBigIntegerField(verbose_name="节点")),
+                ("size", models.IntegerField(default=0, verbose_name="人数")),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="courses.course",
+                        verbose_name="课程",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "候补名次索引",
+                "verbose_name_plural": "候补名次索引",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("course", "node"), name="unique_waitlist_index_node"
+                    )
+                ],
+            },
+        ),
+    ]
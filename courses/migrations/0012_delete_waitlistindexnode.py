@@ -0,0 +1,16 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0011_waitlistindexnode"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="WaitlistIndexNode",
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User  # 使用Django内置用户模型
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 
 class Course(models.Model):
@@ -22,18 +24,65 @@ class Course(models.Model):
     # 创建时间字段，自动记录创建时间
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
 
+    # 更新时间字段，每次保存时自动更新；作为课程卡片片段缓存的版本(见fragments.py)
+    # 只更新已选人数的F()表达式不修改该字段，选课不会使片段缓存失效
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    # 已选人数冗余字段，由选课记录的增删在数据库侧原子维护(见signals.py)
+    # 不可在表单中编辑，避免后台保存时覆盖真实计数
+    enrolled_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="已选人数")
+
+    # 先修课程(有向：本课程要求先修完成这些课程)，不允许成环(见prerequisites.py)
+    prerequisites = models.ManyToManyField(
+        'self',
+        symmetrical=False,
+        blank=True,
+        related_name='required_by',
+        verbose_name="先修课程"
+    )
+
+    class Meta:
+        """
+        模型元数据配置
+        索引与课程目录的游标分页、筛选条件一一对应
+        """
+        indexes = [
+            # 按名称分页：ORDER BY name, id
+            models.Index(fields=['name', 'id'], name='course_name_id_idx'),
+            # 按教师筛选后按名称/ID分页
+            models.Index(fields=['teacher', 'name', 'id'], name='course_teacher_name_id_idx'),
+            models.Index(fields=['teacher', 'id'], name='course_teacher_id_idx'),
+            # 按创建时间筛选
+            models.Index(fields=['created_at'], name='course_created_at_idx'),
+        ]
+
     def __str__(self):
         """定义对象的字符串表示形式，用于管理后台和shell显示"""
         return f"{self.name} - {self.teacher}"
 
+    def save(self, *args, **kwargs):
+        """
+        保存课程
+        更新已有课程时默认不写回enrolled_count：
+        内存中的计数可能已经过期，写回会覆盖数据库侧的原子增减结果
+        新建、强制插入(force_insert)或调用方自行指定update_fields时按原样保存
+        """
+        updating = self.pk is not None and not self._state.adding and not kwargs.get('force_insert')
+        if updating and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'enrolled_count'
+            ]
+        super().save(*args, **kwargs)
+
     def available_seats(self):
         """
         计算课程剩余可选名额
         方法逻辑：
-        1. 通过反向查询(enrollment_set)获取当前课程的选课记录数
+        1. 读取冗余的已选人数字段(enrolled_count)，无需COUNT查询
         2. 用总容量减去已选人数得到剩余名额
         """
-        return self.capacity - self.enrollment_set.count()
+        return self.capacity - self.enrolled_count
 
     def is_full(self):
         """
@@ -83,4 +132,279 @@ class Enrollment(models.Model):
 
     def __str__(self):
         """定义选课记录的字符串表示形式"""
-        return f"{self.student.username} 选修了 {self.course.name}"
\ No newline at end of file
+        return f"{self.student.username} 选修了 {self.course.name}"
+
+
+class WaitlistEntryQuerySet(models.QuerySet):
+    def with_rank(self):
+        """
+        为每条候补记录标注队列名次queue_rank(从1开始)
+        以相关子查询在(course, position)唯一索引上做范围计数(position < 本记录序号)，
+        列表页无需逐条查询；加入与退出候补只写候补记录本身，没有共享的计数行
+        """
+        ahead = (
+            WaitlistEntry.objects.filter(
+                course=models.OuterRef('course'), position__lt=models.OuterRef('position')
+            )
+            .order_by()
+            .values('course')
+            .annotate(total=models.Count('pk'))
+            .values('total')
+        )
+        return self.annotate(
+            queue_rank=Coalesce(models.Subquery(ahead), models.Value(0)) + 1
+        )
+
+
+class WaitlistEntry(models.Model):
+    """
+    候补记录模型
+    课程满员时学生按先后顺序排队，有名额释放时由队首依次递补
+    """
+    # 候补学生
+    student = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="学生"
+    )
+
+    # 候补课程
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        verbose_name="课程"
+    )
+
+    # 队列序号，同一课程内单调递增；(course, position)唯一索引支撑按序取队首
+    position = models.PositiveBigIntegerField(verbose_name="候补序号")
+
+    # 加入候补的时间
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="加入时间"
+    )
+
+    objects = WaitlistEntryQuerySet.as_manager()
+
+    class Meta:
+        """
+        模型元数据配置
+        """
+        constraints = [
+            # 同一学生在同一课程只能候补一次(同时用于按学生查找自己的序号)
+            models.UniqueConstraint(fields=['course', 'student'], name='unique_waitlist_student'),
+            # 队列序号唯一，索引使取队首、计算排名都只需走索引
+            models.UniqueConstraint(fields=['course', 'position'], name='unique_waitlist_position'),
+        ]
+        verbose_name = "候补记录"
+        verbose_name_plural = "候补记录"
+
+    def __str__(self):
+        """定义候补记录的字符串表示形式"""
+        return f"{self.student_id} 候补 {self.course_id} (#{self.position})"
+
+    def rank(self):
+        """
+        计算当前在队列中的名次(从1开始)
+        在(course, position)索引上做范围计数，不扫描整张候补表
+        """
+        return WaitlistEntry.objects.filter(
+            course_id=self.course_id, position__lt=self.position
+        ).count() + 1
+
+
+class CatalogVersion(models.Model):
+    """
+    课程目录版本
+    两行记录：
+    - SINGLETON_ID: 目录版本，课程的增删改(目录结构变化)使版本号加一
+    - DATA_ID: 选课数据版本，选课、退课、完成记录与先修关系变化时在同一事务中加一
+    两者一起供JSON接口生成ETag/Last-Modified，未变化的轮询无需查询课程表；
+    版本号保存在数据库中，所有工作进程看到同一个值
+    """
+    SINGLETON_ID = 1
+    DATA_ID = 2
+
+    # 版本号，每次写入原子加一
+    version = models.PositiveBigIntegerField(default=0, verbose_name="版本号")
+
+    # 最后一次变化的时间
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name="更新时间")
+
+    class Meta:
+        """
+        模型元数据配置
+        """
+        verbose_name = "课程目录版本"
+        verbose_name_plural = "课程目录版本"
+
+    def __str__(self):
+        """定义目录版本的字符串表示形式"""
+        return f"v{self.version}"
+
+    @classmethod
+    def current(cls):
+        """
+        读取当前目录版本(按主键读取一行)
+        返回：CatalogVersion实例，表中尚无记录时自动创建
+        """
+        obj, _ = cls.objects.get_or_create(pk=cls.SINGLETON_ID)
+        return obj
+
+    @classmethod
+    def versions(cls):
+        """
+        一次查询读取目录版本与选课数据版本
+        返回：(目录版本, 选课数据版本) 两个CatalogVersion实例，尚无记录时自动创建
+        """
+        rows = {obj.pk: obj for obj in cls.objects.filter(pk__in=(cls.SINGLETON_ID, cls.DATA_ID))}
+        return tuple(
+            rows[pk] if pk in rows else cls.objects.get_or_create(pk=pk)[0]
+            for pk in (cls.SINGLETON_ID, cls.DATA_ID)
+        )
+
+    @classmethod
+    def bump(cls, pk=SINGLETON_ID):
+        """在数据库侧原子地将版本号加一并刷新更新时间(pk为DATA_ID时更新选课数据版本)"""
+        updated = cls.objects.filter(pk=pk).update(
+            version=models.F('version') + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            cls.objects.get_or_create(pk=pk, defaults={'version': 1})
+
+    @classmethod
+    def bump_data(cls):
+        """选课数据变化后选课数据版本加一(在写入所在的事务中调用)"""
+        cls.bump(cls.DATA_ID)
+
+
+class CourseHeat(models.Model):
+    """
+    选课热度快照
+    每门课程一行，保存图表所需的名称、已选人数、容量与选课比例，
+    随选课记录增删增量更新，图表接口直接按索引读取前N行
+    """
+    # 对应课程，同时作为主键
+    course = models.OneToOneField(
+        Course,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='heat',
+        verbose_name="课程"
+    )
+
+    # 图表标签(课程名称)
+    label = models.CharField(max_length=100, verbose_name="标签")
+
+    # 已选人数
+    enrolled = models.PositiveIntegerField(default=0, verbose_name="已选人数")
+
+    # 课程容量
+    capacity = models.PositiveIntegerField(default=0, verbose_name="课程容量")
+
+    # 选课比例 = 已选人数 / 容量
+    fill_ratio = models.FloatField(default=0.0, verbose_name="选课比例")
+
+    # 最后更新时间
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        """
+        模型元数据配置
+        """
+        indexes = [
+            # 按已选人数/选课比例取前N门课程
+            models.Index(fields=['-enrolled', 'course'], name='heat_enrolled_idx'),
+            models.Index(fields=['-fill_ratio', 'course'], name='heat_fill_ratio_idx'),
+        ]
+        verbose_name = "选课热度"
+        verbose_name_plural = "选课热度"
+
+    def __str__(self):
+        """定义热度快照的字符串表示形式"""
+        return f"{self.label}: {self.enrolled}/{self.capacity}"
+
+
+class Completion(models.Model):
+    """
+    课程修读完成记录
+    学生完成(通过)一门课程后记录一行，用于检查后续课程的先修要求
+    """
+    # 学生
+    student = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="学生"
+    )
+
+    # 已完成的课程
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='completions',
+        verbose_name="课程"
+    )
+
+    # 完成时间
+    completed_at = models.DateTimeField(default=timezone.now, verbose_name="完成时间")
+
+    class Meta:
+        """
+        模型元数据配置
+        """
+        constraints = [
+            # 同一课程只记录一次；(student, course)索引同时支撑按学生读取已完成课程
+            models.UniqueConstraint(fields=['student', 'course'], name='unique_completion'),
+        ]
+        verbose_name = "修读完成记录"
+        verbose_name_plural = "修读完成记录"
+
+    def __str__(self):
+        """定义完成记录的字符串表示形式"""
+        return f"{self.student_id} 完成 {self.course_id}"
+
+
+class CourseSlot(models.Model):
+    """
+    课程的每周上课时段
+    一门课程可以有多个时段(如周一、周三各一次)；选课时检查与学生已选课程的时段是否重叠
+    """
+    WEEKDAYS = [
+        (1, "周一"), (2, "周二"), (3, "周三"), (4, "周四"),
+        (5, "周五"), (6, "周六"), (7, "周日"),
+    ]
+
+    # 所属课程
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='slots',
+        verbose_name="课程"
+    )
+
+    # 星期几(1为周一)
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAYS, verbose_name="星期")
+
+    # 开始与结束时间，时段为左闭右开区间，前一节的结束时间可以等于后一节的开始时间
+    start_time = models.TimeField(verbose_name="开始时间")
+    end_time = models.TimeField(verbose_name="结束时间")
+
+    class Meta:
+        """
+        模型元数据配置
+        """
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(end_time__gt=models.F('start_time')), name='slot_end_after_start'
+            ),
+            models.CheckConstraint(
+                condition=models.Q(weekday__gte=1, weekday__lte=7), name='slot_weekday_range'
+            ),
+        ]
+        ordering = ['weekday', 'start_time']
+        verbose_name = "上课时段"
+        verbose_name_plural = "上课时段"
+
+    def __str__(self):
+        """定义上课时段的字符串表示形式"""
+        return f"{self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
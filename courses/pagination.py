@@ -0,0 +1,122 @@
+"""
+课程目录的游标(keyset)分页
+不使用OFFSET：每一页都以上一页最后一行的排序键为起点做索引范围查询，
+因此无论翻到第几页，查询代价都相同
+"""
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+
+# 支持的排序方式 -> 排序字段(末尾的id保证排序键唯一)
+ORDERINGS = {
+    'name': ('name', 'id'),
+    'id': ('id',),
+}
+DEFAULT_ORDERING = 'name'
+PAGE_SIZE = 30
+# 排序字段在游标中的取值类型
+FIELD_TYPES = {
+    'name': str,
+    'id': int,
+}
+# 数据库整数列的取值范围(64位有符号整数)
+_MAX_INT = 2 ** 63 - 1
+
+
+def encode_cursor(values):
+    """将排序键编码为URL安全的游标字符串"""
+    raw = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, ordering):
+    """
+    解码游标
+    游标格式不合法、与排序方式不匹配或取值类型与排序字段不符时返回None(即从第一页开始)
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    fields = ORDERINGS[ordering]
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    if not all(_valid_value(field, value) for field, value in zip(fields, values)):
+        return None
+    return values
+
+
+def _valid_value(field, value):
+    expected = FIELD_TYPES[field]
+    # bool是int的子类，需要单独排除
+    if type(value) is not expected:
+        return False
+    return expected is not int or -_MAX_INT <= value <= _MAX_INT
+
+
+def _after(fields, values):
+    """
+    构造“排在游标之后”的条件，等价于行值比较 (f1, f2, ...) > (v1, v2, ...)
+    展开为 f1 > v1 OR (f1 = v1 AND f2 > v2) OR ...，可直接走复合索引
+    """
+    condition = Q()
+    for index, field in enumerate(fields):
+        clause = Q(**{f'{field}__gt': values[index]})
+        for previous, value in zip(fields[:index], values[:index]):
+            clause &= Q(**{previous: value})
+        condition |= clause
+    return condition
+
+
+class KeysetPage:
+    """一页结果：当前页对象列表与下一页游标(没有下一页时为None)"""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _page_queryset(queryset, ordering, cursor, page_size):
+    """按游标过滤并排序，多取一行用于判断是否还有下一页"""
+    fields = ORDERINGS[ordering]
+    queryset = queryset.order_by(*fields)
+    values = decode_cursor(cursor, ordering)
+    if values is not None:
+        queryset = queryset.filter(_after(fields, values))
+    return queryset[:page_size + 1]
+
+
+def _make_page(rows, ordering, page_size):
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, field) for field in ORDERINGS[ordering]])
+    return KeysetPage(rows, next_cursor)
+
+
+def keyset_paginate(queryset, ordering=DEFAULT_ORDERING, cursor=None, page_size=PAGE_SIZE):
+    """
+    对查询集做游标分页
+    参数：
+    - ordering: ORDERINGS中的排序方式
+    - cursor: 上一页返回的next_cursor
+    - page_size: 每页条数
+    """
+    rows = list(_page_queryset(queryset, ordering, cursor, page_size))
+    return _make_page(rows, ordering, page_size)
+
+
+async def akeyset_paginate(queryset, ordering=DEFAULT_ORDERING, cursor=None, page_size=PAGE_SIZE):
+    """keyset_paginate的异步版本(使用异步ORM迭代)"""
+    rows = [row async for row in _page_queryset(queryset, ordering, cursor, page_size)]
+    return _make_page(rows, ordering, page_size)
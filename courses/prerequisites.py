@@ -0,0 +1,233 @@
+"""
+先修课程图与选课资格检查
+- PrerequisiteGraph: 由先修关系表一次查询构建，按拓扑序计算每门课程的传递闭包
+  (直接与间接先修课程)；编译结果存入缓存，仅在先修关系变化时重建。
+  表中出现环(如并发写入)时记录错误日志，环上及依赖环的课程视为暂不可选，不影响其他课程
+- validate_new_edges: 写入先修关系前在事务内串行化检查，以最新的先修关系表判断是否成环
+- completed_course_ids: 学生已完成的课程集合，每个请求只查询一次(缓存在用户对象上)
+- missing_prerequisites: 一次批量判断多门课程(购物车、课程目录页)，
+  整批只需读取一次先修图与一次已完成课程
+完成一门课程视为同时满足它的全部先修课程(如先修课程以免修方式获得学分)
+"""
+import logging
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .cache import get_cache
+from .models import CatalogVersion, Completion, Course
+
+logger = logging.getLogger('courses.prerequisites')
+
+GRAPH_KEY = 'courses:prerequisites:graph'
+GRAPH_TIMEOUT = 3600
+
+
+class PrerequisiteCycleError(ValidationError):
+    """先修关系成环"""
+
+
+class PrerequisiteGraph:
+    """
+    先修课程图(只读)
+    - direct: {课程ID: 直接先修课程ID集合}
+    - closure: {课程ID: 全部(传递)先修课程ID集合}
+    - locked: 处在环上或依赖环上课程的课程ID集合(数据异常，暂不可选)
+    只包含有先修要求或作为先修课程出现的课程
+    """
+
+    def __init__(self, edges):
+        direct = {}
+        for course_id, prerequisite_id in edges:
+            direct.setdefault(course_id, set()).add(prerequisite_id)
+            direct.setdefault(prerequisite_id, set())
+        self.direct = {course_id: frozenset(ids) for course_id, ids in direct.items()}
+        self.closure, self.locked = self._closure()
+
+    def _closure(self):
+        """
+        Kahn拓扑排序：先修课程先于依赖它的课程处理，闭包 = 直接先修 ∪ 各先修课程的闭包
+        排序结束仍有课程未处理时说明存在环：记录日志，这些课程的闭包只含直接先修课程
+        """
+        pending = {course_id: len(ids) for course_id, ids in self.direct.items()}
+        dependents = {}
+        for course_id, ids in self.direct.items():
+            for prerequisite_id in ids:
+                dependents.setdefault(prerequisite_id, []).append(course_id)
+
+        ready = [course_id for course_id, count in pending.items() if count == 0]
+        closure = {}
+        while ready:
+            course_id = ready.pop()
+            closure[course_id] = frozenset().union(
+                self.direct[course_id], *(closure[p] for p in self.direct[course_id])
+            )
+            for dependent in dependents.get(course_id, ()):
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    ready.append(dependent)
+
+        locked = frozenset(self.direct) - frozenset(closure)
+        if locked:
+            logger.error("先修关系存在环，以下课程暂不可选: %s", sorted(locked))
+            for course_id in locked:
+                closure[course_id] = self.direct[course_id]
+        return closure, locked
+
+    def requires(self, course_id):
+        """课程的直接先修课程"""
+        return self.direct.get(course_id, frozenset())
+
+    def satisfied(self, completed_ids):
+        """已完成课程及其全部先修课程"""
+        return frozenset().union(completed_ids, *(self.closure.get(c, ()) for c in completed_ids))
+
+    def missing(self, course_id, satisfied):
+        """未满足的直接先修课程；暂不可选的课程返回全部直接先修课程"""
+        if course_id in self.locked:
+            return self.requires(course_id)
+        return self.requires(course_id) - satisfied
+
+    def creates_cycle(self, course_id, prerequisite_ids):
+        """为课程添加这些先修课程是否会成环"""
+        return _reaches(self.direct, prerequisite_ids, course_id)
+
+
+def _reaches(direct, start_ids, target_id):
+    """
+    沿直接先修关系从start_ids出发能否到达target_id(含start_ids本身)
+    深度优先遍历，不依赖闭包，先修关系中已有环时同样正确
+    """
+    stack = list(start_ids)
+    seen = set()
+    while stack:
+        current = stack.pop()
+        if current == target_id:
+            return True
+        if current not in seen:
+            seen.add(current)
+            stack.extend(direct.get(current, ()))
+    return False
+
+
+def _edges():
+    through = Course.prerequisites.through
+    return through.objects.values_list('from_course_id', 'to_course_id')
+
+
+def prerequisite_graph():
+    """读取编译好的先修图，缓存未命中时用一条查询重建"""
+    cache = get_cache()
+    graph = cache.get(GRAPH_KEY)
+    if graph is None:
+        graph = PrerequisiteGraph(_edges())
+        cache.set(GRAPH_KEY, graph, GRAPH_TIMEOUT)
+    return graph
+
+
+def invalidate_graph():
+    """先修关系变化后删除缓存的先修图(立即执行，并在事务提交后再执行一次)"""
+    get_cache().delete(GRAPH_KEY)
+    transaction.on_commit(lambda: get_cache().delete(GRAPH_KEY))
+
+
+def _cycle_error():
+    return PrerequisiteCycleError("先修关系不能成环：所选先修课程直接或间接要求先修本课程")
+
+
+def validate_prerequisites(course_id, prerequisite_ids):
+    """
+    按缓存的先修图检查为课程添加先修课程后不会成环，成环时抛出PrerequisiteCycleError
+    用于表单校验；写入时的最终检查见validate_new_edges
+    """
+    if course_id is not None and prerequisite_graph().creates_cycle(course_id, prerequisite_ids):
+        raise _cycle_error()
+
+
+def validate_new_edges(edges):
+    """
+    写入先修关系前的最终检查(须在写事务内调用，由m2m_changed的pre_add触发)
+    逻辑：
+    1. 锁定目录版本行，使并发的先修关系修改串行执行(只有课程结构的修改会写这一行)
+    2. 以最新的先修关系表(而不是缓存)逐条检查待添加的(课程, 先修课程)，成环时抛出PrerequisiteCycleError
+    """
+    edges = list(edges)
+    if not edges:
+        return
+    CatalogVersion.current()
+    list(CatalogVersion.objects.select_for_update().filter(pk=CatalogVersion.SINGLETON_ID).values_list('pk'))
+    direct = {}
+    for course_id, prerequisite_id in _edges():
+        direct.setdefault(course_id, set()).add(prerequisite_id)
+    for course_id, prerequisite_id in edges:
+        if _reaches(direct, [prerequisite_id], course_id):
+            raise _cycle_error()
+        direct.setdefault(course_id, set()).add(prerequisite_id)
+
+
+def completed_course_ids(user):
+    """学生已完成的课程ID集合，同一个用户对象只查询一次"""
+    if not hasattr(user, '_completed_course_ids'):
+        user._completed_course_ids = frozenset(
+            Completion.objects.filter(student=user).values_list('course_id', flat=True)
+        )
+    return user._completed_course_ids
+
+
+async def acompleted_course_ids(user):
+    """completed_course_ids的异步版本"""
+    if not hasattr(user, '_completed_course_ids'):
+        rows = Completion.objects.filter(student=user).values_list('course_id', flat=True)
+        user._completed_course_ids = frozenset([course_id async for course_id in rows])
+    return user._completed_course_ids
+
+
+def _missing(graph, course_ids, completed):
+    satisfied = graph.satisfied(completed)
+    return {
+        course_id: missing
+        for course_id in course_ids
+        if (missing := graph.missing(course_id, satisfied))
+    }
+
+
+def missing_prerequisites(user, course_ids, graph=None):
+    """
+    批量检查选课资格
+    返回：{课程ID: 未满足的直接先修课程ID集合}，只包含不满足要求的课程
+    这些课程都没有先修要求时不查询已完成课程
+    """
+    graph = graph or prerequisite_graph()
+    if not any(graph.requires(course_id) for course_id in course_ids):
+        return {}
+    return _missing(graph, course_ids, completed_course_ids(user))
+
+
+def students_missing_prerequisites(student_ids, course_id, graph=None):
+    """
+    批量检查多名学生能否选修同一门课程(如后台批量转课)
+    返回：未满足该课程先修要求的学生ID集合
+    课程没有先修要求时不查询，否则一条查询取出这些学生的已完成课程
+    """
+    graph = graph or prerequisite_graph()
+    if not student_ids or not graph.requires(course_id):
+        return set()
+    completed = {}
+    rows = Completion.objects.filter(student_id__in=student_ids).values_list('student_id', 'course_id')
+    for student_id, completed_id in rows:
+        completed.setdefault(student_id, set()).add(completed_id)
+    return {
+        student_id for student_id in student_ids
+        if _missing(graph, [course_id], completed.get(student_id, ()))
+    }
+
+
+async def amissing_prerequisites(user, course_ids):
+    """missing_prerequisites的异步版本"""
+    graph = await get_cache().aget(GRAPH_KEY)
+    if graph is None:
+        graph = PrerequisiteGraph([edge async for edge in _edges()])
+        await get_cache().aset(GRAPH_KEY, graph, GRAPH_TIMEOUT)
+    if not any(graph.requires(course_id) for course_id in course_ids):
+        return {}
+    return _missing(graph, course_ids, await acompleted_course_ids(user))
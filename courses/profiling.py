@@ -0,0 +1,123 @@
+"""
+按需请求性能分析
+管理员在请求上附加 X-Profile: 1 请求头或 ?_profile=1 参数时，由ProfilingMiddleware
+在cProfile下执行该请求，并记录其执行的每条SQL及其执行计划(SQLite为EXPLAIN QUERY PLAN)。
+结果保存为pstats文件(可用snakeviz/pstats打开)与文本报告，可通过下载接口获取
+"""
+import io
+import os
+import pstats
+import re
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .metrics import current_recorder, recording
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PARAM = '_profile'
+PROFILE_DIR = getattr(
+    settings, 'COURSES_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'courses-profiles')
+)
+# 报告中列出的函数条数
+REPORT_FUNCTIONS = 40
+# 只对这些语句获取执行计划(EXPLAIN不会真正执行语句)
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+PROFILE_ID_RE = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+PROFILE_KINDS = {'pstats': '.pstats', 'report': '.txt'}
+
+
+def requested(request):
+    """请求是否要求性能分析(只检查请求头与查询参数，不访问数据库)"""
+    return request.headers.get(PROFILE_HEADER) == '1' or request.GET.get(PROFILE_PARAM) == '1'
+
+
+class QueryCapture:
+    """
+    记录SQL文本与参数，供事后获取执行计划
+    接口与数据库execute_wrapper相同，并把查询继续交给外层记录器(请求指标)
+    """
+
+    def __init__(self):
+        self.parent = current_recorder()
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            if self.parent is not None:
+                return self.parent(execute, sql, params, many, context)
+            return execute(sql, params, many, context)
+        finally:
+            alias = context['connection'].alias
+            self.queries.append((alias, sql, None if many else params, time.perf_counter() - started))
+
+
+def _explain(alias, sql, params):
+    """返回一条SQL的执行计划文本行"""
+    connection = connections[alias]
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+    except Exception as exc:  # 执行计划只用于诊断，失败时记录原因
+        return [f'(无法获取执行计划: {exc})']
+
+
+def build_report(request, response, profiler, capture, elapsed):
+    """生成文本报告：请求概况、按累计耗时排序的函数、每条SQL及其执行计划"""
+    out = io.StringIO()
+    out.write(f'{request.method} {request.get_full_path()} -> {response.status_code}\n')
+    out.write(f'用户: {request.user}  时间: {timezone.now().isoformat()}  耗时: {elapsed * 1000:.1f}ms\n')
+    out.write(f'SQL: {len(capture.queries)} 条，共 {sum(q[3] for q in capture.queries) * 1000:.1f}ms\n\n')
+
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats('cumulative').print_stats(REPORT_FUNCTIONS)
+
+    out.write('\n==== SQL 与执行计划 ====\n')
+    # 获取执行计划的查询不计入请求指标
+    with recording(None):
+        _write_queries(out, capture)
+    return out.getvalue()
+
+
+def _write_queries(out, capture):
+    for index, (alias, sql, params, seconds) in enumerate(capture.queries, 1):
+        out.write(f'\n[{index}] {alias} {seconds * 1000:.2f}ms\n{sql}\n')
+        if params:
+            out.write(f'参数: {params!r}\n')
+        if params is not None and sql.lstrip().upper().startswith(EXPLAINABLE):
+            for line in _explain(alias, sql, params):
+                out.write(f'    {line}\n')
+
+
+def save(profiler, report):
+    """保存pstats与文本报告，返回分析ID"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = f'{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+    profiler.dump_stats(profile_path(profile_id, 'pstats'))
+    with open(profile_path(profile_id, 'report'), 'w', encoding='utf-8') as handle:
+        handle.write(report)
+    return profile_id
+
+
+def profile_path(profile_id, kind):
+    """分析结果文件路径；ID或类型不合法时返回None"""
+    if not PROFILE_ID_RE.match(profile_id) or kind not in PROFILE_KINDS:
+        return None
+    return os.path.join(PROFILE_DIR, profile_id + PROFILE_KINDS[kind])
+
+
+def recent_profiles(limit=50):
+    """按时间倒序返回最近的分析ID"""
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    ids = {name.rsplit('.', 1)[0] for name in names if name.endswith('.pstats')}
+    return sorted((pid for pid in ids if PROFILE_ID_RE.match(pid)), reverse=True)[:limit]
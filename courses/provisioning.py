@@ -0,0 +1,144 @@
+"""
+批量开通学生账号
+密码哈希(PBKDF2)是纯CPU计算，在进程池中分散到所有CPU核心上执行；
+已存在的用户名在哈希之前就被过滤掉，写入使用bulk_create(ignore_conflicts=True)，
+并发开通同一用户名时以数据库唯一约束为准
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+
+DEFAULT_BATCH_SIZE = 2000
+# 每个工作进程一次处理的密码数，平衡进程间通信开销与负载均衡
+HASH_CHUNK_SIZE = 50
+
+
+class ProvisionReport:
+    """开通结果统计"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.existing = 0
+        self.invalid = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'existing': self.existing,
+            'invalid': self.invalid,
+            'elapsed_seconds': self.elapsed,
+            'rows_per_second': self.rows_per_second,
+        }
+
+
+def _init_worker():
+    """工作进程初始化：以spawn方式启动时需要重新加载Django配置"""
+    if not apps.ready:
+        django.setup()
+
+
+def _hash_password(args):
+    password, hasher = args
+    return make_password(password or None, hasher=hasher)
+
+
+def _valid(account):
+    username = account.get('username') or ''
+    if not username or len(username) > User._meta.get_field('username').max_length:
+        return False
+    try:
+        User.username_validator(username)
+    except ValidationError:
+        return False
+    return True
+
+
+def _provision_batch(batch, pool, hasher, report):
+    accounts = {}
+    for account in batch:
+        if not _valid(account):
+            report.invalid += 1
+        elif account['username'] in accounts:
+            report.existing += 1
+        else:
+            accounts[account['username']] = account
+
+    existing = set(User.objects.filter(username__in=accounts).values_list('username', flat=True))
+    report.existing += len(existing)
+    new = [account for username, account in accounts.items() if username not in existing]
+    if not new:
+        return
+
+    jobs = [(account.get('password'), hasher) for account in new]
+    if pool is None:
+        hashes = [_hash_password(job) for job in jobs]
+    else:
+        hashes = list(pool.map(_hash_password, jobs, chunksize=HASH_CHUNK_SIZE))
+
+    User.objects.bulk_create(
+        [
+            User(
+                username=account['username'],
+                password=password,
+                email=account.get('email') or '',
+                first_name=account.get('first_name') or '',
+                last_name=account.get('last_name') or '',
+            )
+            for account, password in zip(new, hashes)
+        ],
+        ignore_conflicts=True,
+    )
+    # 冲突的行被忽略(过滤之后被并发开通的用户名)。每个哈希都带有随机盐，
+    # 只有本次写入的行的密码字段等于本次计算的哈希，据此统计实际新建的账号
+    created = User.objects.filter(
+        username__in=[account['username'] for account in new], password__in=hashes
+    ).count()
+    report.created += created
+    report.existing += len(new) - created
+
+
+def provision_accounts(accounts, workers=None, batch_size=DEFAULT_BATCH_SIZE, hasher='default',
+                       progress=None):
+    """
+    批量开通账号
+    参数：
+    - accounts: 字典的可迭代对象，键为username、password(为空时设置为不可用密码)，
+      以及可选的email、first_name、last_name；按需读取，内存占用只与batch_size有关
+    - workers: 哈希进程数，默认为CPU核心数；为1时在当前进程中计算
+    - batch_size: 每批查询、哈希与写入的账号数
+    - hasher: 密码哈希算法名，必须在PASSWORD_HASHERS中
+    - progress: 每批完成后以ProvisionReport调用的回调
+    返回：ProvisionReport
+    """
+    get_hasher(hasher)  # 算法未配置时在启动进程池之前报错(ValueError)
+    workers = workers or os.cpu_count() or 1
+    report = ProvisionReport()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 1 else None
+    try:
+        iterator = iter(accounts)
+        while batch := list(islice(iterator, batch_size)):
+            report.rows += len(batch)
+            _provision_batch(batch, pool, hasher, report)
+            report.elapsed = time.perf_counter() - report.started
+            if progress is not None:
+                progress(report)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    report.elapsed = time.perf_counter() - report.started
+    return report
@@ -0,0 +1,237 @@
+"""
+选课写接口的限流(选课、退课、购物车)
+每条规则限制任意连续period秒内最多放行limit次，用滑动窗口计数实现：
+共享缓存中每个周期一个计数器(键中带有周期序号，过期后自动清除)，取令牌用一次原子incr；
+当前用量按 上一周期计数 × 上一周期仍在窗口内的比例 + 本周期计数 估算，
+周期交界处不会像固定窗口那样连续放行两个周期的令牌，数据库写入量与客户端的请求方式无关。
+计数器须保存在多个工作进程共享的缓存后端(Redis/Memcached等)中，限额才是全局的；
+进程内缓存(LocMemCache)下每个进程各有一份限额(manage.py check --deploy会给出警告)。
+
+进程内快速路径：
+- 租约：向共享计数器取令牌时一次取lease个，多出的令牌留在本进程，
+  同一周期内的后续请求直接在本地扣减，不访问缓存
+- 拒绝：某个桶被取空后，本进程记住它，在估算出的下一个令牌可用之前都在本地拒绝，
+  循环刷接口的脚本不会给缓存带来额外压力
+租出但未用完的令牌在周期结束时作废，因此多进程部署下实际放行数可能略少于limit
+"""
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+from .cache import get_cache
+
+USER = 'user'
+GLOBAL = 'global'
+
+# 默认规则：每名学生10秒内10次，所有学生合计每秒200次
+DEFAULT_RATE_LIMITS = {
+    USER: {'limit': 10, 'period': 10, 'lease': 2},
+    GLOBAL: {'limit': 200, 'period': 1, 'lease': 10},
+}
+# 本地状态的条目数超过该值时清除已过期周期的条目
+MAX_LOCAL_ENTRIES = 10_000
+
+
+class Rule:
+    """限流规则：period秒内最多limit个令牌，每次向共享缓存租lease个"""
+
+    def __init__(self, scope, limit, period, lease=1):
+        self.scope = scope
+        self.limit = limit
+        self.period = period
+        self.lease = max(1, min(lease, limit))
+
+    def window(self, now):
+        """当前周期的序号与结束时间"""
+        index = int(now // self.period)
+        return index, (index + 1) * self.period
+
+
+def rate_limit_rules():
+    """读取settings.COURSES_RATE_LIMITS(为None时不限流)"""
+    config = getattr(settings, 'COURSES_RATE_LIMITS', DEFAULT_RATE_LIMITS)
+    return [Rule(scope, **options) for scope, options in (config or {}).items()]
+
+
+class RateLimitStats:
+    """
+    各规则的放行与拒绝计数(进程内，线程安全)，以及放行中走本地租约的次数、
+    因后面的规则拒绝而退还的次数
+    """
+    RESULTS = ('allowed', 'local', 'limited', 'refunded')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, scope, result):
+        with self._lock:
+            counts = self._counts.setdefault(scope, dict.fromkeys(self.RESULTS, 0))
+            counts[result] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {scope: dict(counts) for scope, counts in self._counts.items()}
+
+
+rate_limit_stats = RateLimitStats()
+
+
+class RateLimiter:
+    """
+    滑动窗口限流器
+    - take(rule, ident): 从规则rule下标识为ident的桶中取一个令牌，
+      返回None表示放行，否则返回需要等待的秒数
+    - refund(rule, ident): 退还take取到的一个令牌
+    本地状态 {(规则, 标识): [失效时间, 剩余租约令牌, 是否已取空]} 由一把锁保护；
+    租约在周期结束时失效，取空状态在估算的等待时间结束时失效
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = {}
+
+    def reset(self):
+        with self._lock:
+            self._local.clear()
+
+    def _key(self, rule, ident, index):
+        return f'courses:ratelimit:{rule.scope}:{ident}:{index}'
+
+    def _take_local(self, slot, now):
+        """
+        本地快速路径
+        返回：True 放行(消耗一个租约令牌)，数值 拒绝(需等待的秒数)，None 需要访问共享缓存
+        """
+        with self._lock:
+            state = self._local.get(slot)
+            if state is None or state[0] <= now:
+                return None
+            if state[2]:
+                return state[0] - now
+            if state[1] > 0:
+                state[1] -= 1
+                return True
+            return None
+
+    def _store_local(self, slot, expires, remaining, exhausted, now):
+        with self._lock:
+            if len(self._local) >= MAX_LOCAL_ENTRIES:
+                self._local = {key: state for key, state in self._local.items() if state[0] > now}
+            self._local[slot] = [expires, remaining, exhausted]
+
+    def _lease(self, rule, ident, now):
+        """
+        向共享计数器租lease个令牌(一次原子incr，超出限额的部分随即decr退回)
+        返回：(租到的令牌数, 没有租到时需要等待的秒数)
+        逻辑：
+        1. 上一周期的计数按其仍在滑动窗口内的比例计入当前用量
+        2. 本周期计数器加lease，可用令牌 = limit - 上一周期折算用量 - 加之前的本周期计数
+        3. 没有令牌时，等待时间为上一周期的折算用量降到可以放行一次所需的时间，
+           最长到本周期结束
+        """
+        index, ends = rule.window(now)
+        cache = get_cache()
+        key = self._key(rule, ident, index)
+        previous = cache.get(self._key(rule, ident, index - 1), 0)
+        carried = previous * (ends - now) / rule.period
+        try:
+            total = cache.incr(key, rule.lease)
+        except ValueError:
+            # 本周期的第一个请求：创建计数器(并发创建时add只有一个成功)后再累加；
+            # 计数器在下一个周期作为上一周期计数使用，因此保留两个周期
+            cache.add(key, 0, 2 * rule.period + 1)
+            total = cache.incr(key, rule.lease)
+        used = carried + total - rule.lease
+        granted = max(0, min(rule.lease, math.floor(rule.limit - used)))
+        if granted < rule.lease:
+            cache.decr(key, rule.lease - granted)
+        if granted:
+            return granted, None
+        wait = ends - now
+        if previous:
+            wait = min(wait, (used + 1 - rule.limit) * rule.period / previous)
+        return 0, wait
+
+    def take(self, rule, ident, now=None):
+        now = time.time() if now is None else now
+        slot = (rule.scope, ident)
+
+        local = self._take_local(slot, now)
+        if local is True:
+            rate_limit_stats.record(rule.scope, 'local')
+            rate_limit_stats.record(rule.scope, 'allowed')
+            return None
+        if local is None:
+            granted, wait = self._lease(rule, ident, now)
+            if granted:
+                self._store_local(slot, rule.window(now)[1], granted - 1, False, now)
+                rate_limit_stats.record(rule.scope, 'allowed')
+                return None
+            self._store_local(slot, now + wait, 0, True, now)
+            local = wait
+        rate_limit_stats.record(rule.scope, 'limited')
+        return local
+
+    def refund(self, rule, ident, now=None):
+        """退还一个已放行的令牌(放回本地租约；租约已失效时作废)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._local.get((rule.scope, ident))
+            if state is not None and state[0] > now and not state[2]:
+                state[1] += 1
+        rate_limit_stats.record(rule.scope, 'refunded')
+
+
+limiter = RateLimiter()
+
+
+def check_rate_limit(user):
+    """
+    依次检查各条规则(先按学生，再全局)，学生自己的限额用完时不消耗全局令牌；
+    后面的规则拒绝时退还前面规则已取的令牌，被全局限额拒绝的请求不占用学生自己的限额
+    返回：None 放行，否则返回Retry-After秒数(向上取整)
+    """
+    taken = []
+    for rule in rate_limit_rules():
+        ident = user.pk if rule.scope == USER else '*'
+        wait = limiter.take(rule, ident)
+        if wait is not None:
+            for taken_rule, taken_ident in taken:
+                limiter.refund(taken_rule, taken_ident)
+            return max(1, math.ceil(wait))
+        taken.append((rule, ident))
+    return None
+
+
+def _too_many_requests(request, retry_after):
+    message = "请求过于频繁，请稍后再试"
+    if request.content_type == 'application/json' or not request.accepts('text/html'):
+        response = JsonResponse({'error': message, 'retry_after': retry_after}, status=429,
+                                json_dumps_params={'ensure_ascii': False})
+    else:
+        response = HttpResponse(message, status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limited(view):
+    """
+    限流装饰器(放在login_required之内)
+    超过限额时返回429与Retry-After响应头；JSON请求返回JSON错误
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        retry_after = check_rate_limit(request.user)
+        if retry_after is not None:
+            return _too_many_requests(request, retry_after)
+        return view(request, *args, **kwargs)
+    return wrapper
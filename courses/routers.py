@@ -0,0 +1,177 @@
+"""
+数据库路由
+- ReadOnlyRouter: SQLite生产模式(见settings.py中的COURSES_SQLITE_PRODUCTION)额外配置
+  一个只读连接别名'readonly'(以mode=ro打开同一个数据库文件)。被read_only_view装饰的
+  只读页面在执行期间把查询路由到只读连接，选课等写路径始终使用default连接：
+  WAL模式下读连接不阻塞写入，写连接也不会因为读事务升级为写事务而出现锁冲突
+- ReplicaRouter: 课程、选课记录等模型的读查询分流到只读副本(COURSES_REPLICA_ALIASES)，
+  写入走主库；刚选课/退课的客户端在复制延迟窗口内读主库(读己之写)
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_ONLY_ALIAS = 'readonly'
+
+_read_only = ContextVar('courses_read_only', default=False)
+
+
+def read_only_available():
+    """是否配置了只读连接别名"""
+    return READ_ONLY_ALIAS in connections.settings
+
+
+def read_only_view(view):
+    """
+    只读视图装饰器(同步与异步视图均可)
+    视图执行期间的读查询路由到只读连接；写入仍然走default连接
+    上下文变量会随sync_to_async传递，异步视图中的ORM查询同样生效
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    return wrapper
+
+
+class ReadOnlyRouter:
+    """
+    只读连接路由
+    - 读：处于read_only_view中且配置了只读别名时使用只读连接，否则交给默认路由
+    - 写：始终使用default连接
+    - 迁移：只在default连接上执行
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_only.get() and read_only_available():
+            return READ_ONLY_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 两个别名指向同一个数据库文件
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != READ_ONLY_ALIAS
+
+
+# 读查询分流到副本的模型
+REPLICATED_MODELS = frozenset({
+    'courses.course', 'courses.enrollment', 'courses.courseheat', 'courses.waitlistentry',
+})
+# 记录"读主库截止时间"的Cookie
+STICKY_COOKIE = 'courses_primary_until'
+
+
+def replica_aliases():
+    """已配置的只读副本别名"""
+    return tuple(getattr(settings, 'COURSES_REPLICA_ALIASES', ()))
+
+
+class ReplicaState:
+    """
+    单个请求的副本路由状态
+    - pinned: 客户端在复制延迟窗口内写过数据，本请求只读主库
+    - wrote: 本请求写入了分流模型，此后的读查询改读主库，响应时设置粘滞Cookie
+    - replica: 本请求选定的副本(同一请求内的读查询使用同一个副本)
+    """
+    __slots__ = ('pinned', 'wrote', 'replica')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+_replica_state = ContextVar('courses_replica_state', default=None)
+
+
+@contextmanager
+def replica_request(pinned=False):
+    """在当前上下文中开始一个请求的副本路由状态(由ReplicaStickinessMiddleware使用)"""
+    state = ReplicaState(pinned)
+    token = _replica_state.set(state)
+    try:
+        yield state
+    finally:
+        _replica_state.reset(token)
+
+
+def pinned_until(request):
+    """读取粘滞Cookie中的截止时间戳，无效时返回0"""
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return 0.0
+
+
+def is_pinned(request):
+    return pinned_until(request) > time.time()
+
+
+class ReplicaRouter:
+    """
+    只读副本路由
+    读查询(仅REPLICATED_MODELS)：
+    1. 未配置副本时交给后续路由；处于事务中(事务内必须读到本事务的写入)时读主库
+    2. 请求之外的读查询(管理命令、信号处理、缓存回填、后台任务)读主库，
+       避免把副本上的旧数据写入共享缓存
+    3. 客户端处于读己之写窗口，或本请求已写入分流模型时读主库
+    4. 否则读副本：请求内固定使用一个随机选定的副本
+    写入始终走主库，并标记本请求已写入
+    """
+
+    def _replicated(self, model):
+        return model._meta.label_lower in REPLICATED_MODELS
+
+    def _in_transaction(self):
+        return connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+    def db_for_read(self, model, **hints):
+        aliases = replica_aliases()
+        if not aliases or not self._replicated(model):
+            return None
+        if self._in_transaction():
+            return DEFAULT_DB_ALIAS
+        state = _replica_state.get()
+        if state is None or state.pinned or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = random.choice(aliases)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        if self._replicated(model):
+            state = _replica_state.get()
+            if state is not None:
+                state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本与主库数据相同
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 副本的表结构随数据一起从主库复制
+        return db not in replica_aliases()
@@ -0,0 +1,146 @@
+"""
+课程全文检索
+SQLite下使用FTS5虚拟表(courses_course_fts，rowid即课程ID)，按bm25相关度排序；
+其他数据库退化为icontains查询
+
+中文处理：unicode61分词器不会切分连续的汉字，因此写入索引前在每个汉字两侧加空格
+(单字切分)，查询时把连续汉字转换成短语查询，例如“数据库”→ "数 据 库"，
+即可匹配任意位置的中文子串；英文等词语按前缀匹配，例如 pyth → "pyth"*
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, Q, When
+
+from .models import Course
+
+FTS_TABLE = 'courses_course_fts'
+INDEXED_FIELDS = ('name', 'teacher', 'description')
+# bm25列权重：课程名称 > 授课教师 > 课程描述
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+# 中日韩统一表意文字(含扩展A区与兼容区)，交给re模块解析转义
+_CJK = r'\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_CJK_CHAR = re.compile(f'([{_CJK}])')
+_QUERY_TOKEN = re.compile(f'[{_CJK}]+|[^\\W{_CJK}_]+')
+
+
+def is_supported(using=None):
+    """当前数据库是否使用FTS5索引"""
+    return (using or connection).vendor == 'sqlite'
+
+
+def segment(text):
+    """写入索引前的分词：每个汉字单独成词"""
+    return _CJK_CHAR.sub(r' \1 ', text or '')
+
+
+def build_match_query(query):
+    """
+    将用户输入转换为FTS5 MATCH表达式
+    - 连续汉字 -> 逐字短语 "数 据 库"
+    - 其他词语 -> 前缀匹配 "pyth"*
+    多个词之间为AND关系；没有可检索的词时返回空字符串
+    """
+    terms = []
+    for token in _QUERY_TOKEN.findall(query or ''):
+        if _CJK_CHAR.match(token):
+            terms.append('"' + ' '.join(token) + '"')
+        else:
+            terms.append(f'"{token}"*')
+    return ' '.join(terms)
+
+
+def create_index(using_connection):
+    """创建FTS5虚拟表(迁移中调用)"""
+    with using_connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5({', '.join(INDEXED_FIELDS)}, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_index(using_connection):
+    """删除FTS5虚拟表(迁移回滚时调用)"""
+    with using_connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def index_course(course):
+    """写入或更新一门课程的索引(先删后插，rowid与课程ID一致)"""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [course.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(INDEXED_FIELDS)}) VALUES (%s, %s, %s, %s)",
+            [course.pk] + [segment(getattr(course, field)) for field in INDEXED_FIELDS],
+        )
+
+
+def remove_course(course_id):
+    """从索引中删除一门课程"""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [course_id])
+
+
+def rebuild_index(batch_size=2000):
+    """
+    按课程表全量重建索引(用于bulk_create等绕过信号的批量写入之后)
+    返回：写入索引的课程数
+    """
+    if not is_supported():
+        return 0
+    total = 0
+    batch = []
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        sql = f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(INDEXED_FIELDS)}) VALUES (%s, %s, %s, %s)"
+        rows = Course.objects.order_by().values_list('pk', *INDEXED_FIELDS).iterator(chunk_size=batch_size)
+        for pk, *values in rows:
+            batch.append([pk] + [segment(value) for value in values])
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            total += len(batch)
+    return total
+
+
+def search_course_ids(query, limit=20):
+    """
+    检索课程，返回按相关度排序的课程ID列表
+    SQLite下在FTS5索引中完成匹配、排序与截断，只返回limit个ID
+    """
+    if is_supported():
+        match = build_match_query(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, {', '.join(map(str, RANK_WEIGHTS))}) LIMIT %s",
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    terms = _QUERY_TOKEN.findall(query or '')
+    if not terms:
+        return []
+    condition = Q()
+    for term in terms:
+        condition &= Q(name__icontains=term) | Q(teacher__icontains=term) | Q(description__icontains=term)
+    return list(Course.objects.filter(condition).order_by('name', 'id').values_list('pk', flat=True)[:limit])
+
+
+def search_courses(query, limit=20):
+    """检索课程，返回按相关度排序的Course列表"""
+    ids = search_course_ids(query, limit)
+    if not ids:
+        return []
+    order = Case(*[When(pk=pk, then=index) for index, pk in enumerate(ids)])
+    return list(Course.objects.filter(pk__in=ids).order_by(order))
@@ -0,0 +1,177 @@
+"""
+规模测试用的合成数据
+按随机种子确定性地生成用户、课程与选课记录：课程热度服从Zipf分布(少数热门课程
+集中了大部分选课需求)，全部写入使用分批bulk_create，并在最后补做bulk_create
+不会触发的信号副作用(全文索引、热度快照、目录版本与缓存)
+"""
+import random
+import time
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.crypto import RANDOM_STRING_CHARS
+
+from . import cache, heat, search
+from .models import CatalogVersion, Course, Enrollment
+
+DEFAULT_PASSWORD = 'seed123'
+BATCH_SIZE = 2000
+# Zipf指数，越大热门课程越集中
+ZIPF_EXPONENT = 1.1
+CAPACITIES = (30, 40, 60, 80, 120, 200)
+
+SUBJECTS = (
+    "高等数学", "线性代数", "概率论", "离散数学", "数据结构", "算法设计", "操作系统", "计算机网络",
+    "数据库系统", "编译原理", "软件工程", "人工智能", "机器学习", "计算机图形学", "信息安全",
+    "大学物理", "大学英语", "中国近代史", "经济学原理", "心理学导论",
+)
+LEVELS = ("", "(一)", "(二)", "实验", "专题", "进阶")
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾萧田董潘袁蔡蒋余于杜叶程"
+
+
+class SeedReport:
+    """生成结果统计"""
+
+    def __init__(self):
+        self.users = 0
+        self.courses = 0
+        self.enrollments = 0
+        # 因课程已满或重复抽样而未能落地的选课需求
+        self.rejected = 0
+        self.elapsed = 0.0
+
+    def as_dict(self):
+        return {
+            'users': self.users,
+            'courses': self.courses,
+            'enrollments': self.enrollments,
+            'rejected': self.rejected,
+            'elapsed_seconds': self.elapsed,
+        }
+
+
+def seeded_password(rng, password=DEFAULT_PASSWORD, hasher='default'):
+    """
+    为全部生成账号计算一次密码哈希(各账号共用)
+    - hasher='default': 使用PASSWORD_HASHERS中的首选算法，只计算一次，登录校验照常可用
+    - 其他算法名(如'md5')必须已列在PASSWORD_HASHERS中，否则这些账号无法登录
+    """
+    algorithm = get_hasher(hasher)
+    # 盐的熵不足时首次登录会触发密码重新哈希(进而使已有会话失效)，长度与Django默认一致
+    salt = ''.join(rng.choice(RANDOM_STRING_CHARS) for _ in range(22))
+    return make_password(password, salt=salt, hasher=algorithm)
+
+
+def zipf_weights(count, exponent=ZIPF_EXPONENT):
+    """第k热门的课程权重为1/k^s"""
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _plan_enrollments(rng, n_users, capacities, target):
+    """
+    抽样选课需求：学生均匀抽取，课程按Zipf权重抽取(热度排名与课程顺序无关)
+    每批抽样前把已满的课程移出候选(学生转选其他课程)，抽到已满课程或重复的
+    (学生, 课程)对计为被拒绝；抽样总次数达到target的4倍或全部课程已满后停止
+    返回：(按课程下标分组的学生下标列表, 被拒绝的次数)
+    """
+    n_courses = len(capacities)
+    popularity = list(range(n_courses))
+    rng.shuffle(popularity)
+    weights = zipf_weights(n_courses)
+
+    roster = [[] for _ in range(n_courses)]
+    seen = set()
+    placed = rejected = attempts = 0
+    while placed < target and attempts < target * 4:
+        open_ranks = [
+            rank for rank, course in enumerate(popularity) if len(roster[course]) < capacities[course]
+        ]
+        if not open_ranks:
+            break
+        cum_weights = list(accumulate(weights[rank] for rank in open_ranks))
+        batch = min(target - placed, BATCH_SIZE)
+        attempts += batch
+        for rank in rng.choices(open_ranks, cum_weights=cum_weights, k=batch):
+            course = popularity[rank]
+            student = rng.randrange(n_users)
+            if (student, course) in seen or len(roster[course]) >= capacities[course]:
+                rejected += 1
+                continue
+            seen.add((student, course))
+            roster[course].append(student)
+            placed += 1
+    return roster, rejected
+
+
+def seed(n_users, n_courses, n_enrollments, random_seed=0, password=DEFAULT_PASSWORD,
+         hasher='default', prefix='seed', batch_size=BATCH_SIZE):
+    """
+    生成合成数据，相同的参数与随机种子得到相同的数据
+    参数：
+    - n_users / n_courses / n_enrollments: 学生数、课程数、目标选课记录数
+    - random_seed: 随机种子
+    - password / hasher: 生成账号的密码与哈希算法(见seeded_password)
+    - prefix: 用户名前缀，用户名为 前缀 + 六位序号
+    - batch_size: 每次bulk_create写入的行数
+    返回：SeedReport
+    """
+    started = time.perf_counter()
+    rng = random.Random(random_seed)
+    report = SeedReport()
+
+    capacities = [rng.choice(CAPACITIES) for _ in range(n_courses)]
+    if n_users:
+        roster, report.rejected = _plan_enrollments(rng, n_users, capacities, n_enrollments)
+    else:
+        roster = [[] for _ in range(n_courses)]
+    password_hash = seeded_password(rng, password, hasher)
+
+    with transaction.atomic():
+        courses = []
+        for batch in _batched(range(n_courses), batch_size):
+            courses += Course.objects.bulk_create([
+                Course(
+                    name=f"{rng.choice(SUBJECTS)}{rng.choice(LEVELS)} #{index + 1}",
+                    teacher=f"{rng.choice(SURNAMES)}教授",
+                    description=f"合成课程 {index + 1}",
+                    capacity=capacities[index],
+                    # 已选人数由选课计划直接得出，记录随后批量写入
+                    enrolled_count=len(roster[index]),
+                )
+                for index in batch
+            ])
+        course_ids = [course.pk for course in courses]
+
+        users = []
+        for batch in _batched(range(n_users), batch_size):
+            users += User.objects.bulk_create([
+                User(username=f'{prefix}{index:06d}', password=password_hash) for index in batch
+            ])
+        user_ids = [user.pk for user in users]
+
+        pairs = (
+            Enrollment(student_id=user_ids[student], course_id=course_ids[course])
+            for course, students in enumerate(roster)
+            for student in students
+        )
+        for batch in _batched(pairs, batch_size):
+            Enrollment.objects.bulk_create(batch)
+            report.enrollments += len(batch)
+
+        search.rebuild_index()
+        heat.rebuild_heat(course_ids)
+        CatalogVersion.bump()
+        cache.invalidate_catalog()
+
+    report.users = len(user_ids)
+    report.courses = len(course_ids)
+    report.elapsed = time.perf_counter() - started
+    return report
@@ -0,0 +1,332 @@
+import enum
+import random
+import threading
+import time
+
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+
+from . import prerequisites, timetable
+from .models import Course, Enrollment, WaitlistEntry
+
+
+class EnrollStatus(enum.Enum):
+    """选课结果(取值同时作为统计计数的字段名)"""
+    ENROLLED = "enrolled"            # 选课成功
+    ALREADY_ENROLLED = "already"     # 已经选过该课程
+    FULL = "full"                    # 课程已满
+    NOT_FOUND = "not_found"          # 课程不存在
+    WAITLISTED = "waitlisted"        # 已加入候补队列
+    CONFLICT = "conflict"            # 与已选课程上课时间冲突
+    PREREQUISITES = "prerequisites"  # 尚未修完先修课程
+
+
+class EnrollmentStats:
+    """
+    选课写路径的吞吐与争用统计(进程内，线程安全)
+    用于评估选课高峰期的窗口大小
+    """
+    FIELDS = (
+        'attempts', 'enrolled', 'already', 'full', 'not_found', 'waitlisted', 'conflict', 'prerequisites',
+        'promoted', 'promotion_skipped', 'retries', 'lock_failures',
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._started = time.perf_counter()
+            self._busy_seconds = 0.0
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def record(self, field, amount=1):
+        with self._lock:
+            self._counts[field] += amount
+
+    def record_duration(self, seconds):
+        with self._lock:
+            self._busy_seconds += seconds
+
+    def snapshot(self):
+        """
+        返回统计快照
+        包含各结果计数、重试次数、放弃次数，以及吞吐量(次/秒)与争用率(每次选课的平均重试数)
+        """
+        with self._lock:
+            data = dict(self._counts)
+            elapsed = time.perf_counter() - self._started
+            busy = self._busy_seconds
+        attempts = data['attempts']
+        data['elapsed_seconds'] = elapsed
+        data['throughput'] = attempts / elapsed if elapsed > 0 else 0.0
+        data['avg_latency_ms'] = busy / attempts * 1000 if attempts else 0.0
+        data['contention_ratio'] = data['retries'] / attempts if attempts else 0.0
+        return data
+
+
+enrollment_stats = EnrollmentStats()
+
+# 数据库锁冲突时的重试参数：指数退避并加入随机抖动，避免大量请求同时重试
+MAX_RETRIES = 6
+BASE_BACKOFF = 0.01
+MAX_BACKOFF = 0.5
+
+_TRANSIENT_MARKERS = ('locked', 'busy', 'deadlock', 'could not serialize')
+
+
+def _is_transient(exc):
+    """判断数据库错误是否为可重试的锁冲突(SQLite的database is locked、服务端数据库的死锁等)"""
+    message = str(exc).lower()
+    return any(marker in message for marker in _TRANSIENT_MARKERS)
+
+
+def run_with_retry(func, *args, **kwargs):
+    """
+    执行写事务，遇到锁冲突时指数退避重试
+    逻辑：
+    1. 调用方已处于事务中时不重试(外层事务已失效，只能交给外层处理)
+    2. 非锁冲突类错误直接抛出
+    3. 超过最大重试次数后记录一次放弃并抛出原异常
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as exc:
+            if connection.in_atomic_block or not _is_transient(exc):
+                raise
+            if attempt >= MAX_RETRIES:
+                enrollment_stats.record('lock_failures')
+                raise
+            enrollment_stats.record('retries')
+            delay = min(MAX_BACKOFF, BASE_BACKOFF * (2 ** attempt))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
+
+
+def _try_claim(course_id):
+    """以一条带条件的UPDATE占座：仅当 enrolled_count < capacity 时加一，返回是否成功"""
+    return Course.objects.filter(
+        pk=course_id, enrolled_count__lt=F('capacity')
+    ).update(enrolled_count=F('enrolled_count') + 1) > 0
+
+
+def _insert_claimed(student_id, course_id):
+    """插入已占座的选课记录，信号处理函数不再重复计数"""
+    enrollment = Enrollment(student_id=student_id, course_id=course_id)
+    enrollment._seat_claimed = True
+    enrollment.save(force_insert=True)
+    return enrollment
+
+
+class _Ineligible(Exception):
+    """占座之后校验未通过，回滚事务以释放名额"""
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+def _claim_seat(student, course_id):
+    """
+    在一个事务内占座并写入选课记录
+    逻辑：
+    1. 先以条件UPDATE占座：事务的第一条语句即为写入，SQLite默认的DEFERRED事务
+       在此取得写锁，之后的读取不会再因读锁升级为写锁而遇到database is locked
+    2. 未修完先修课程时拒绝(先修图来自缓存，已完成课程每个请求只查询一次)
+    3. 课程时段与学生已选课程冲突时拒绝(一条查询，区间索引上二分查找)
+    4. 已占座但校验未通过时回滚事务，名额随之释放
+    5. 占座成功后插入选课记录，并移除该学生在此课程的候补记录
+    6. 重复选课触发唯一约束时整个事务回滚，名额随之释放
+    """
+    try:
+        with transaction.atomic():
+            claimed = _try_claim(course_id)
+            if prerequisites.missing_prerequisites(student, [course_id]):
+                raise _Ineligible(EnrollStatus.PREREQUISITES)
+            if timetable.conflicting_course(student, course_id) is not None:
+                raise _Ineligible(EnrollStatus.CONFLICT)
+            if not claimed:
+                if Enrollment.objects.filter(student=student, course_id=course_id).exists():
+                    return EnrollStatus.ALREADY_ENROLLED
+                if Course.objects.filter(pk=course_id).exists():
+                    return EnrollStatus.FULL
+                return EnrollStatus.NOT_FOUND
+
+            _insert_claimed(student.pk, course_id)
+            WaitlistEntry.objects.filter(course_id=course_id, student=student).delete()
+            return EnrollStatus.ENROLLED
+    except _Ineligible as rejected:
+        return rejected.status
+
+
+def enroll_student(student, course_id):
+    """
+    为学生选课(容量受控、并发安全)
+    参数：
+    - student: 选课学生(User)
+    - course_id: 课程ID
+    返回：
+    - EnrollStatus 枚举值
+    """
+    started = time.perf_counter()
+    try:
+        status = run_with_retry(_claim_seat, student, course_id)
+    except IntegrityError:
+        # 同一学生并发重复提交：唯一约束已回滚本次占座
+        if not Enrollment.objects.filter(student=student, course_id=course_id).exists():
+            raise
+        status = EnrollStatus.ALREADY_ENROLLED
+    enrollment_stats.record('attempts')
+    enrollment_stats.record(status.value)
+    enrollment_stats.record_duration(time.perf_counter() - started)
+    return status
+
+
+def _delete_enrollment(student, course_id):
+    with transaction.atomic():
+        deleted, _ = Enrollment.objects.filter(student=student, course_id=course_id).delete()
+        if deleted:
+            _promote(course_id, limit=1)
+        return deleted > 0
+
+
+def drop_student(student, course_id):
+    """
+    为学生退课
+    返回：是否确实删除了选课记录
+    已选人数由post_delete信号原子减一，释放的名额在同一事务中递补给候补队首
+    """
+    return run_with_retry(_delete_enrollment, student, course_id)
+
+
+def _enqueue(student, course_id):
+    """
+    加入候补队列
+    逻辑：
+    1. 已在队列中则直接返回原记录
+    2. 新序号取当前队尾序号加一(在(course, position)索引上倒序取一条)
+    3. 序号被并发写入占用时由唯一约束拒绝，调用方重试
+    """
+    with transaction.atomic():
+        entry = WaitlistEntry.objects.filter(course_id=course_id, student=student).first()
+        if entry is not None:
+            return entry
+        tail = (
+            WaitlistEntry.objects.filter(course_id=course_id)
+            .order_by('-position')
+            .values_list('position', flat=True)
+            .first()
+        )
+        return WaitlistEntry.objects.create(
+            student=student, course_id=course_id, position=(tail or 0) + 1
+        )
+
+
+def join_waitlist(student, course_id):
+    """
+    学生加入课程候补队列
+    返回：(EnrollStatus, 候补记录或None)
+    - 已选该课程返回ALREADY_ENROLLED
+    - 课程不存在返回NOT_FOUND
+    - 加入队列后若恰好有空余名额(如容量刚被调大)，立即尝试递补
+    """
+    if Enrollment.objects.filter(student=student, course_id=course_id).exists():
+        return EnrollStatus.ALREADY_ENROLLED, None
+    if not Course.objects.filter(pk=course_id).exists():
+        return EnrollStatus.NOT_FOUND, None
+
+    for _ in range(MAX_RETRIES):
+        try:
+            entry = run_with_retry(_enqueue, student, course_id)
+            break
+        except IntegrityError:
+            # 同一序号被并发占用，或同一学生重复提交：重新读取队尾后再试
+            continue
+    else:
+        raise IntegrityError("无法分配候补序号")
+
+    if promote_waitlist(course_id):
+        if Enrollment.objects.filter(student=student, course_id=course_id).exists():
+            return EnrollStatus.ENROLLED, None
+    enrollment_stats.record('waitlisted')
+    return EnrollStatus.WAITLISTED, entry
+
+
+def leave_waitlist(student, course_id):
+    """退出候补队列，返回是否确实删除了记录"""
+    deleted, _ = WaitlistEntry.objects.filter(student=student, course_id=course_id).delete()
+    return deleted > 0
+
+
+def _promote(course_id, limit=None):
+    """
+    从队首开始依次递补，直到名额用完、队列为空或达到limit
+    每次递补：资格检查 -> 条件UPDATE占座 -> 插入选课记录 -> 删除候补记录
+    队首通过(course, position)索引取得，单次递补为O(log n)
+    资格检查与直接选课相同：加入候补后学生可能选了时间冲突的课程，先修要求也可能已变更，
+    不再满足条件的候补记录直接移除，继续检查下一位
+    须在事务内调用
+    返回：被递补的学生ID列表
+    """
+    promoted = []
+    graph = prerequisites.prerequisite_graph()
+    while limit is None or len(promoted) < limit:
+        head = (
+            WaitlistEntry.objects.select_for_update(of=('self',))
+            .select_related('student')
+            .filter(course_id=course_id)
+            .order_by('position')
+            .first()
+        )
+        if head is None:
+            break
+        if (
+            prerequisites.missing_prerequisites(head.student, [course_id], graph)
+            or timetable.conflicting_course(head.student, course_id) is not None
+        ):
+            head.delete()
+            enrollment_stats.record('promotion_skipped')
+            continue
+        if not _try_claim(course_id):
+            break
+        _insert_claimed(head.student_id, course_id)
+        head.delete()
+        promoted.append(head.student_id)
+    enrollment_stats.record('promoted', len(promoted))
+    return promoted
+
+
+def _promote_in_transaction(course_id):
+    with transaction.atomic():
+        return _promote(course_id)
+
+
+def promote_waitlist(course_id):
+    """
+    为单门课程递补所有空余名额(如后台调大容量之后)
+    返回：被递补的学生ID列表
+    """
+    return run_with_retry(_promote_in_transaction, course_id)
+
+
+def promote_waitlists(course_ids=None):
+    """
+    批量递补：找出有空余名额且有候补学生的课程逐一递补
+    参数：
+    - course_ids: 只处理这些课程，为None时处理全部
+    返回：{课程ID: 被递补的学生ID列表}
+    """
+    courses = Course.objects.filter(
+        enrolled_count__lt=F('capacity'), waitlistentry__isnull=False
+    )
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+    results = {}
+    for course_id in courses.values_list('pk', flat=True).distinct():
+        promoted = promote_waitlist(course_id)
+        if promoted:
+            results[course_id] = promoted
+    return results
@@ -0,0 +1,195 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache, heat, metrics, prerequisites, search
+from .models import CatalogVersion, Completion, Course, Enrollment
+
+
+def _adjust_enrolled_count(enrollment, delta):
+    """
+    在数据库侧原子调整课程的已选人数
+    逻辑：
+    1. 使用F表达式生成 UPDATE ... SET enrolled_count = enrolled_count + delta
+       并发写入时不会丢失更新
+    2. 若选课记录上已缓存课程对象，同步修正其内存中的计数
+    """
+    Course.objects.filter(pk=enrollment.course_id).update(
+        enrolled_count=F('enrolled_count') + delta
+    )
+    if Enrollment.course.is_cached(enrollment):
+        enrollment.course.enrolled_count += delta
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_created(sender, instance, created, **kwargs):
+    """
+    新建选课记录时已选人数加一
+    经services.enroll_student占座写入的记录已在条件UPDATE中计数，此处跳过
+    """
+    if created and not kwargs.get('raw') and not getattr(instance, '_seat_claimed', False):
+        _adjust_enrolled_count(instance, 1)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    """删除选课记录时已选人数减一"""
+    _adjust_enrolled_count(instance, -1)
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, update_fields=None, raw=False, **kwargs):
+    """课程名称、教师或描述变化时同步全文索引"""
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(search.INDEXED_FIELDS):
+        return
+    search.index_course(instance)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    """删除课程时同步删除全文索引"""
+    search.remove_course(instance.pk)
+
+
+@receiver(post_save, sender=Course)
+def course_heat_sync(sender, instance, update_fields=None, raw=False, **kwargs):
+    """课程名称或容量变化时同步选课热度快照"""
+    if raw:
+        return
+    if update_fields is not None and not {'name', 'capacity'} & set(update_fields):
+        return
+    heat.sync_course(instance)
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_heat_created(sender, instance, created, raw=False, **kwargs):
+    """新建选课记录时热度快照增量加一"""
+    if created and not raw:
+        heat.adjust_heat(instance.course_id, 1)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_heat_deleted(sender, instance, **kwargs):
+    """删除选课记录时热度快照增量减一"""
+    heat.adjust_heat(instance.course_id, -1)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def catalog_changed(sender, raw=False, **kwargs):
+    """课程增删改时目录版本加一(ETag随之变化)"""
+    if not raw:
+        CatalogVersion.bump()
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_data_changed(sender, raw=False, **kwargs):
+    """
+    选课记录增删时选课数据版本加一(ETag随之变化)
+    与选课写入在同一事务中更新，回滚时版本号随之回滚；目录版本行不受影响
+    """
+    if not raw:
+        CatalogVersion.bump_data()
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_cache_invalidate(sender, instance, raw=False, **kwargs):
+    """课程增删改：目录页与该课程的已选人数缓存失效"""
+    if not raw:
+        cache.invalidate_catalog()
+        cache.invalidate_seats([instance.pk])
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_cache_invalidate(sender, instance, raw=False, **kwargs):
+    """选课记录增删：该课程的已选人数与该学生的已选集合缓存失效"""
+    if not raw:
+        cache.invalidate_seats([instance.course_id])
+        cache.invalidate_enrolled([instance.student_id])
+
+
+@receiver(m2m_changed, sender=Course.prerequisites.through)
+def prerequisites_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    先修关系变化
+    - 添加前在写事务内以最新数据检查不会成环
+      (正向：为instance添加先修课程；反向：instance成为pk_set中课程的先修课程)
+    - 变化后使缓存的先修图失效
+    """
+    if action == 'pre_add':
+        if reverse:
+            prerequisites.validate_new_edges((course_id, instance.pk) for course_id in pk_set)
+        else:
+            prerequisites.validate_new_edges((instance.pk, prerequisite_id) for prerequisite_id in pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        prerequisites.invalidate_graph()
+        CatalogVersion.bump_data()
+
+
+@receiver(post_save, sender=Completion)
+@receiver(post_delete, sender=Completion)
+def completion_changed(sender, raw=False, **kwargs):
+    """完成记录变化会改变目录接口中的选课资格，选课数据版本加一(ETag随之变化)"""
+    if not raw:
+        CatalogVersion.bump_data()
+
+
+@receiver(post_delete, sender=Course)
+def course_prerequisites_deleted(sender, instance, **kwargs):
+    """删除课程时级联删除的先修关系不触发m2m_changed，先修图同样失效"""
+    prerequisites.invalidate_graph()
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """新建数据库连接时安装请求指标的查询记录(见metrics.py)"""
+    metrics.install(connection)
+
+
+def enrollment_count_drift(course_ids=None):
+    """
+    查找已选人数与真实选课记录数不一致的课程
+    参数：
+    - course_ids: 只检查这些课程，为None时检查全部
+    返回：
+    - (课程ID, 冗余计数, 实际计数) 列表
+    """
+    courses = Course.objects.annotate(actual_count=Count('enrollment'))
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+    return [
+        (course_id, stored, actual)
+        for course_id, stored, actual in courses.values_list('id', 'enrolled_count', 'actual_count')
+        if stored != actual
+    ]
+
+
+def sync_enrollment_counts(course_ids=None):
+    """
+    用一条UPDATE语句按真实选课记录数重算已选人数
+    用于修复计数漂移，以及绕过信号的批量写入(bulk_create/queryset.update)之后；
+    同时刷新选课热度快照、选课数据版本与已选人数缓存
+    返回：被更新的课程数
+    """
+    actual = (
+        Enrollment.objects.filter(course=OuterRef('pk'))
+        .order_by()
+        .values('course')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    courses = Course.objects.all()
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+    updated = courses.update(enrolled_count=Coalesce(Subquery(actual), Value(0)))
+    CatalogVersion.bump_data()
+    heat.rebuild_heat(course_ids)
+    cache.invalidate_seats(course_ids if course_ids is not None else Course.objects.values_list('pk', flat=True))
+    return updated
@@ -1,7 +1,41 @@
-from django.test import TestCase, Client
+import datetime
+import json
+import random
+import os
+import pstats
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import Course, Enrollment
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from .models import CatalogVersion, Completion, Course, CourseHeat, CourseSlot, Enrollment, WaitlistEntry
+from . import async_views, bulk, checks, fragments, importing, live, routers, services
+from .provisioning import provision_accounts
+from .middleware import ReplicaStickinessMiddleware
+from .routers import READ_ONLY_ALIAS, STICKY_COOKIE, ReadOnlyRouter, ReplicaRouter, read_only_view
+from .benchmarks import QueryCounter, build_urlconf, oversubscribed_courses
+from .cache import cache_stats, get_cache
+from .fragments import course_cards
+from .pagination import encode_cursor
+from .timetable import Timetable
+from .prerequisites import PrerequisiteCycleError, PrerequisiteGraph, missing_prerequisites, prerequisite_graph
+from .admin import CourseForm, EstimatedCountPaginator
+from .metrics import render_prometheus, view_metrics
+from .ratelimit import RateLimiter, Rule, limiter, rate_limit_stats
+from .services import (
+    EnrollStatus, drop_student, enroll_student, join_waitlist, leave_waitlist, promote_waitlists,
+)
 
 
 class CourseModelTest(TestCase):
@@ -57,6 +91,69 @@ class CourseModelTest(TestCase):
         )
 
 
+class EnrollmentCounterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user1 = User.objects.create_user(username='counter1', password='test123')
+        cls.user2 = User.objects.create_user(username='counter2', password='test123')
+        cls.course = Course.objects.create(name="编译原理", teacher="钱教授", capacity=2)
+
+    def test_counter_follows_enrollments(self):
+        """测试选课记录增删时已选人数同步变化"""
+        Enrollment.objects.create(student=self.user1, course=self.course)
+        Enrollment.objects.create(student=self.user2, course=self.course)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 2)
+        self.assertTrue(self.course.is_full())
+
+        Enrollment.objects.filter(student=self.user1).delete()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+    def test_save_does_not_overwrite_counter(self):
+        """测试用过期的课程对象保存时不会覆盖已选人数"""
+        stale = Course.objects.get(pk=self.course.pk)
+        Enrollment.objects.create(student=self.user1, course=self.course)
+        stale.capacity = 5
+        stale.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.capacity, 5)
+        self.assertEqual(self.course.enrolled_count, 1)
+
+    def test_force_insert_and_explicit_fields_saved_as_given(self):
+        """测试强制插入与显式指定update_fields时按调用方的参数保存"""
+        restored = Course.objects.get(pk=self.course.pk)
+        Course.objects.filter(pk=restored.pk).delete()
+        restored.save(force_insert=True)
+        self.assertTrue(Course.objects.filter(pk=restored.pk).exists())
+
+        restored.enrolled_count = 1
+        restored.save(update_fields=['enrolled_count'])
+        restored.refresh_from_db()
+        self.assertEqual(restored.enrolled_count, 1)
+
+    def test_seat_checks_issue_no_queries(self):
+        """测试剩余名额判断不再发起COUNT查询"""
+        with self.assertNumQueries(0):
+            self.course.available_seats()
+            self.course.is_full()
+
+    def test_check_enrollment_counts_command(self):
+        """测试计数漂移的检查与修复命令"""
+        Enrollment.objects.create(student=self.user1, course=self.course)
+        Course.objects.filter(pk=self.course.pk).update(enrolled_count=7)
+
+        out = StringIO()
+        call_command('check_enrollment_counts', stdout=out)
+        self.assertIn('记录值 7，实际 1', out.getvalue())
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 7)
+
+        call_command('check_enrollment_counts', '--fix', stdout=StringIO())
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+
 class EnrollmentModelTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -185,6 +282,8 @@ class CourseListViewTest(TestCase):
         )
 
     def setUp(self):
+        # 测试结束时的回滚不会触发缓存失效，每个测试前清空缓存
+        get_cache().clear()
         self.client = Client()
         self.client.login(username='coursetest', password='testpass')
 
@@ -214,6 +313,1216 @@ class CourseListViewTest(TestCase):
         self.assertContains(response, '选课')
 
 
+class CatalogPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='pager', password='testpass')
+        Course.objects.bulk_create(
+            Course(name=f"课程{i:03d}", teacher="甲老师" if i % 2 else "乙老师", capacity=1)
+            for i in range(65)
+        )
+        cls.full_course = Course.objects.get(name="课程001")
+        Enrollment.objects.create(student=cls.user, course=cls.full_course)
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.login(username='pager', password='testpass')
+
+    def _walk(self, params):
+        names = []
+        response = self.client.get(reverse('course_list'), params)
+        while True:
+            names.extend(course.name for course in response.context['courses'])
+            if not response.context['next_query']:
+                return names
+            response = self.client.get(reverse('course_list') + '?' + response.context['next_query'])
+
+    def test_keyset_pages_cover_catalog(self):
+        """测试逐页翻阅可不重不漏地遍历全部课程"""
+        names = self._walk({})
+        self.assertEqual(names, sorted(f"课程{i:03d}" for i in range(65)))
+        self.assertEqual(len(self._walk({'order': 'id'})), 65)
+
+    def test_filters(self):
+        """测试按教师与空余名额筛选"""
+        names = self._walk({'teacher': '甲老师', 'free': '1'})
+        self.assertEqual(len(names), 31)
+        self.assertNotIn("课程001", names)
+
+    def test_query_count_independent_of_page(self):
+        """测试任意一页的查询数相同(缓存未命中时，含重建先修图的一条查询)"""
+        first = self.client.get(reverse('course_list'))
+        cursor_query = first.context['next_query']
+        get_cache().clear()
+        with self.assertNumQueries(6):
+            self.client.get(reverse('course_list'))
+        get_cache().clear()
+        with self.assertNumQueries(6):
+            self.client.get(reverse('course_list') + '?' + cursor_query)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        """测试非法游标回到第一页"""
+        response = self.client.get(reverse('course_list'), {'cursor': '!!!', 'created_after': '2024-13-40'})
+        self.assertEqual(response.context['courses'][0].name, "课程000")
+
+    def test_bad_typed_cursor_falls_back_to_first_page(self):
+        """测试取值类型与排序字段不符的游标回到第一页，而不是返回500"""
+        for order, values in (('id', ["x"]), ('name', [{}, 1]), ('name', ["课程010", "1"]),
+                              ('id', [True]), ('id', [10 ** 30])):
+            cursor = encode_cursor(values)
+            response = self.client.get(reverse('course_list'), {'order': order, 'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['courses']), 30)
+            response = self.client.get(reverse('course_api'), {'order': order, 'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+
+
+class CourseSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='searcher', password='testpass')
+        cls.db = Course.objects.create(name="数据库系统原理", teacher="李教授", description="关系代数与SQL")
+        cls.python = Course.objects.create(name="Python程序设计", teacher="王老师", description="入门课程")
+        cls.web = Course.objects.create(name="Web开发", teacher="赵老师", description="使用Python和数据库构建网站")
+
+    def setUp(self):
+        self.client.login(username='searcher', password='testpass')
+
+    def _search(self, query):
+        response = self.client.get(reverse('course_search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()['results']]
+
+    def test_chinese_substring_and_ranking(self):
+        """测试中文子串匹配，课程名称命中排在描述命中之前"""
+        self.assertEqual(self._search('数据库'), ["数据库系统原理", "Web开发"])
+        self.assertEqual(self._search('李教授'), ["数据库系统原理"])
+
+    def test_prefix_match(self):
+        """测试英文前缀匹配"""
+        self.assertEqual(self._search('pyth'), ["Python程序设计", "Web开发"])
+
+    def test_index_follows_save_and_delete(self):
+        """测试课程修改与删除后索引同步"""
+        self.python.name = "机器学习"
+        self.python.save()
+        self.assertEqual(self._search('机器'), ["机器学习"])
+        self.assertEqual(self._search('程序设计'), [])
+
+        self.python.delete()
+        self.assertEqual(self._search('机器'), [])
+
+    def test_rebuild_after_bulk_create(self):
+        """测试批量写入后重建索引"""
+        Course.objects.bulk_create([Course(name="编译器构造", teacher="孙老师")])
+        self.assertEqual(self._search('编译'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self._search('编译'), ["编译器构造"])
+
+
+class CourseApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='poller', password='testpass')
+        cls.course = Course.objects.create(name="概率论", teacher="陈教授", capacity=2)
+        Course.objects.create(name="线性代数", teacher="陈教授", capacity=2)
+        Enrollment.objects.create(student=cls.user, course=cls.course)
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.login(username='poller', password='testpass')
+
+    def test_payload(self):
+        """测试接口返回名额与已选标记"""
+        response = self.client.get(reverse('course_api'))
+        results = {item['name']: item for item in response.json()['results']}
+        self.assertEqual(results["概率论"]['available_seats'], 1)
+        self.assertTrue(results["概率论"]['enrolled'])
+        self.assertFalse(results["线性代数"]['enrolled'])
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+    def test_conditional_get(self):
+        """测试目录未变化时返回304且不查询课程表，变化后ETag更新"""
+        etag = self.client.get(reverse('course_api'))['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('course_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any('courses_course"' in query['sql'] for query in queries))
+
+        version, data = CatalogVersion.versions()
+        Enrollment.objects.filter(course=self.course).delete()
+        # 选课写入只改变选课数据版本，不更新目录版本行
+        self.assertEqual(CatalogVersion.versions()[0].version, version.version)
+        self.assertGreater(CatalogVersion.versions()[1].version, data.version)
+        # 版本号在数据库中，缓存被清空(或各工作进程缓存互不共享)时同样生效
+        get_cache().clear()
+        response = self.client.get(reverse('course_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CatalogCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cached', password='testpass')
+        cls.other = User.objects.create_user(username='cached2', password='testpass')
+        cls.course = Course.objects.create(name="计算机组成", teacher="韩教授", capacity=5)
+
+    def setUp(self):
+        get_cache().clear()
+        cache_stats.reset()
+        self.client.login(username='cached', password='testpass')
+
+    def _card(self):
+        response = self.client.get(reverse('course_list'))
+        return response.context['courses'][0], response.context['enrolled_courses']
+
+    def test_warm_cache_skips_catalog_queries(self):
+        """测试缓存命中时不再查询目录页、已选人数与已选集合"""
+        self._card()
+        with CaptureQueriesContext(connection) as queries:
+            self._card()
+        self.assertEqual(
+            [query['sql'] for query in queries if 'courses_enrollment' in query['sql']], []
+        )
+        stats = cache_stats.snapshot()
+        self.assertEqual(stats['catalog']['hits'], 1)
+        self.assertEqual(stats['enrolled']['hits'], 1)
+
+    def test_enrollment_invalidates_seats_and_enrolled_set(self):
+        """测试选课后已选人数与已选集合立即更新"""
+        self._card()
+        enroll_student(self.user, self.course.id)
+        enroll_student(self.other, self.course.id)
+        course, enrolled = self._card()
+        self.assertEqual(course.enrolled_count, 2)
+        self.assertIn(self.course.id, enrolled)
+
+    def test_course_change_invalidates_catalog(self):
+        """测试课程修改后目录页缓存失效"""
+        self._card()
+        self.course.name = "计算机体系结构"
+        self.course.save()
+        course, _ = self._card()
+        self.assertEqual(course.name, "计算机体系结构")
+
+
+class CourseHeatTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'heat{i}', password='test123') for i in range(3)]
+        cls.small = Course.objects.create(name="小班研讨", teacher="杨老师", capacity=2)
+        cls.large = Course.objects.create(name="大班讲授", teacher="杨老师", capacity=100)
+
+    def setUp(self):
+        self.client.login(username='heat0', password='test123')
+
+    def test_snapshot_follows_enrollments(self):
+        """测试快照随选课、退课与容量修改增量更新"""
+        enroll_student(self.users[0], self.small.id)
+        Enrollment.objects.create(student=self.users[1], course=self.small)
+        heat = CourseHeat.objects.get(course=self.small)
+        self.assertEqual((heat.enrolled, heat.capacity, heat.fill_ratio), (2, 2, 1.0))
+
+        drop_student(self.users[0], self.small.id)
+        self.small.capacity = 4
+        self.small.save()
+        heat.refresh_from_db()
+        self.assertEqual((heat.enrolled, heat.capacity, heat.fill_ratio), (1, 4, 0.25))
+
+    def test_heat_endpoint_orders_by_fill_ratio(self):
+        """测试热度接口按选课比例排序"""
+        for user in self.users:
+            Enrollment.objects.create(student=user, course=self.large)
+        Enrollment.objects.create(student=self.users[0], course=self.small)
+
+        data = self.client.get(reverse('course_heat')).json()
+        self.assertEqual(data['labels'], ["大班讲授", "小班研讨"])
+        self.assertEqual(data['enrollments'], [3, 1])
+
+        data = self.client.get(reverse('course_heat'), {'order': 'fill', 'limit': 1}).json()
+        self.assertEqual(data['labels'], ["小班研讨"])
+        self.assertEqual(data['fill_ratios'], [0.5])
+
+    def test_course_list_has_no_chart_queries(self):
+        """测试课程列表页不再查询图表数据"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('course_list'))
+        self.assertFalse(any('courses_courseheat' in query['sql'] for query in queries))
+
+
+class SeatEventsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'live{i}', password='test123') for i in range(3)]
+        cls.course = Course.objects.create(name="实时系统", teacher="林老师", capacity=10)
+        cls.other = Course.objects.create(name="分布式系统", teacher="林老师", capacity=10)
+
+    async def test_hub_coalesces_changes(self):
+        """测试一个周期内的多次变化合并为一条推送，且只推送订阅的课程"""
+        hub = live.SeatHub(interval=3600)
+        snapshot = await live.fetch_seats([self.course.id])
+        subscriber = hub.subscribe([self.course.id], snapshot)
+        await hub.poll()
+        self.assertEqual(subscriber.drain(), [])
+
+        for user in self.users:
+            await Enrollment.objects.acreate(student=user, course=self.course)
+        await Enrollment.objects.acreate(student=self.users[0], course=self.other)
+        await hub.poll()
+        self.assertEqual(subscriber.drain(), [live.seat_payload(self.course.id, 3, 10)])
+
+        await hub.poll()
+        self.assertEqual(subscriber.drain(), [])
+        hub.unsubscribe(subscriber)
+        self.assertEqual(hub.subscriber_count, 0)
+
+    async def test_hub_task_does_not_inherit_request_context(self):
+        """测试推送后台任务在空白上下文中运行，不继承启动它的请求的副本路由状态"""
+        hub = live.SeatHub(interval=3600)
+        seen = []
+
+        async def run():
+            seen.append(routers._replica_state.get())
+
+        with mock.patch.object(hub, '_run', run), routers.replica_request():
+            hub.subscribe([self.course.id], {})
+            await hub._task
+        self.assertEqual(seen, [None])
+
+    async def test_hub_backs_off_and_logs_poll_failures(self):
+        """测试轮询失败时记录异常并指数退避(有上限)，成功后恢复正常周期"""
+        hub = live.SeatHub(interval=1.0)
+        hub._by_course[self.course.id].add(object())
+        outcomes = [OperationalError('database is locked')] * 7 + [None, None]
+        delays = []
+
+        async def poll():
+            outcome = outcomes.pop(0)
+            if not outcomes:
+                hub._by_course.clear()
+            if outcome is not None:
+                raise outcome
+
+        async def sleep(delay):
+            delays.append(delay)
+
+        with mock.patch.object(hub, 'poll', poll), mock.patch.object(live.asyncio, 'sleep', sleep), \
+                self.assertLogs('courses.live', 'ERROR') as logs:
+            await hub._run()
+        self.assertEqual(delays, [1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 30.0, 30.0, 1.0])
+        self.assertEqual(len(logs.records), 7)
+        self.assertIsNotNone(logs.records[0].exc_info)
+
+    def test_wsgi_fallback_returns_snapshot(self):
+        """测试非ASGI部署时返回当前快照"""
+        Enrollment.objects.create(student=self.users[0], course=self.course)
+        self.client.login(username='live0', password='test123')
+        response = self.client.get(reverse('seat_events'), {'courses': f'{self.course.id},{self.other.id}'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('"enrolled_count":1', body)
+        self.assertEqual(body.count('event: seats'), 2)
+
+        response = self.client.get(reverse('seat_events'), {'courses': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ROOT_URLCONF=build_urlconf(async_views))
+class AsyncReadViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='asyncuser', password='testpass')
+        cls.other = User.objects.create_user(username='asyncother', password='testpass')
+        cls.course = Course.objects.create(name="并发编程", teacher="黄老师", capacity=1)
+        cls.second = Course.objects.create(name="函数式编程", teacher="黄老师", capacity=5)
+        Enrollment.objects.create(student=cls.other, course=cls.course)
+        Enrollment.objects.create(student=cls.user, course=cls.second)
+        join_waitlist(cls.user, cls.course.id)
+
+    def setUp(self):
+        get_cache().clear()
+
+    async def test_async_pages_match_sync_behaviour(self):
+        """测试异步版本的首页、课程列表、我的课程与同步版本渲染结果一致"""
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(reverse('index'))
+        self.assertContains(response, '欢迎，asyncuser')
+
+        response = await self.async_client.get(reverse('course_list'))
+        self.assertTemplateUsed(response, 'courses/course_list.html')
+        self.assertEqual(len(response.context['courses']), 2)
+        self.assertContains(response, '✅ 已选')
+
+        response = await self.async_client.get(reverse('my_courses'))
+        self.assertContains(response, '函数式编程')
+        self.assertContains(response, '当前排第 1 位')
+
+    async def test_async_views_require_login(self):
+        """测试未登录访问异步页面时重定向到登录页"""
+        response = await self.async_client.get(reverse('course_list'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(reverse('login')))
+
+
+class BenchmarkHelpersTest(TestCase):
+    def test_query_counter(self):
+        """测试QueryCounter只统计上下文内执行的SQL"""
+        with QueryCounter() as counter:
+            list(Course.objects.all())
+            User.objects.count()
+        Course.objects.count()
+        self.assertEqual(counter.count, 2)
+
+    def test_oversubscribed_courses(self):
+        """测试超额与计数不一致的课程都会被检出"""
+        student = User.objects.create_user(username='benchhelper', password='test123')
+        ok = Course.objects.create(name="正常课程", teacher="甲", capacity=1)
+        Enrollment.objects.create(student=student, course=ok)
+        drifted = Course.objects.create(name="计数漂移", teacher="乙", capacity=5)
+        over = Course.objects.create(name="超额课程", teacher="丙", capacity=1)
+        Course.objects.filter(pk=drifted.pk).update(enrolled_count=2)
+        Course.objects.filter(pk=over.pk).update(capacity=0)
+        Enrollment.objects.create(student=student, course=over)
+        self.assertEqual(sorted(oversubscribed_courses()), [drifted.pk, over.pk])
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='metricsuser', password='test123')
+        Course.objects.create(name="性能分析", teacher="严教授", capacity=10)
+
+    def setUp(self):
+        get_cache().clear()
+        view_metrics.reset()
+
+    def test_view_latency_and_queries_recorded(self):
+        """测试按URL名称记录请求数与SQL条数，并以Prometheus文本输出"""
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('course_list'))
+
+        stats = view_metrics.snapshot()[('course_list', 'GET')]
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['queries_sum'], len(captured))
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.client.force_login(User.objects.create_user(username='ops', password='test123', is_staff=True))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('courses_request_duration_seconds_count{view="course_list",method="GET"} 1', body)
+        self.assertIn('courses_request_queries_bucket{view="course_list",method="GET",le="+Inf"} 1', body)
+        self.assertIn('courses_responses_total{view="course_list",method="GET",status="200"} 1', body)
+        self.assertIn('courses_enrollment_events_total{event="attempts"}', body)
+
+    @override_settings(ROOT_URLCONF=build_urlconf(async_views))
+    async def test_async_views_recorded(self):
+        """测试原生异步视图中sync_to_async执行的查询同样被统计"""
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(reverse('course_list'))
+        stats = view_metrics.snapshot()[('course_list', 'GET')]
+        self.assertGreater(stats['queries_sum'], 0)
+
+    def test_slow_request_logged_with_sql(self):
+        """测试慢请求日志包含请求路径与SQL"""
+        self.client.force_login(self.user)
+        with mock.patch('courses.middleware.SLOW_REQUEST_SECONDS', 0):
+            with self.assertLogs('courses.slow', 'WARNING') as logs:
+                self.client.get(reverse('my_courses'))
+        self.assertIn('/my-courses/', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    @override_settings(COURSES_METRICS_TOKEN='s3cret')
+    def test_metrics_token(self):
+        """测试/metrics/默认不公开：需要Bearer令牌或管理员登录，显式开启后公开"""
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.client.logout()
+        with override_settings(COURSES_METRICS_TOKEN='', COURSES_METRICS_PUBLIC=True):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+@override_settings(COURSES_PROFILING=True)
+class ProfilingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='profiler', password='test123', is_staff=True)
+        cls.student = User.objects.create_user(username='profiled', password='test123')
+        Course.objects.create(name="性能调优", teacher="蒋教授", capacity=10)
+
+    def setUp(self):
+        get_cache().clear()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, ignore_errors=True)
+        patcher = mock.patch('courses.profiling.PROFILE_DIR', tmpdir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_staff_profile_with_query_plans(self):
+        """测试管理员按需分析请求，生成可下载的pstats与含执行计划的报告"""
+        self.client.force_login(self.staff)
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('course_list')))
+
+        get_cache().clear()
+        response = self.client.get(reverse('course_list'), {'_profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        profile_id = response['X-Profile-Id']
+
+        report = self.client.get(reverse('profile_download', args=[profile_id, 'report']))
+        text = b''.join(report.streaming_content).decode()
+        self.assertIn('courses_course', text)
+        self.assertIn('SCAN', text.upper().replace('SEARCH', 'SCAN'))
+        self.assertIn('cumulative', text)
+
+        download = self.client.get(reverse('profile_download', args=[profile_id, 'pstats']))
+        with tempfile.NamedTemporaryFile(suffix='.pstats', delete=False) as handle:
+            handle.write(b''.join(download.streaming_content))
+        self.addCleanup(os.unlink, handle.name)
+        self.assertGreater(pstats.Stats(handle.name).total_calls, 0)
+
+        listing = self.client.get(reverse('profile_list')).json()['profiles']
+        self.assertEqual([item['id'] for item in listing], [profile_id])
+
+    def test_header_trigger_and_staff_only(self):
+        """测试请求头触发分析，非管理员的分析请求被忽略"""
+        self.client.force_login(self.student)
+        response = self.client.get(reverse('my_courses'), HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.client.get(reverse('profile_download', args=['x', 'report'])).status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('my_courses'), HTTP_X_PROFILE='1')
+        self.assertIn('X-Profile-Id', response)
+        missing = self.client.get(reverse('profile_download', args=['..', 'report']))
+        self.assertEqual(missing.status_code, 404)
+
+    @override_settings(COURSES_PROFILING=False)
+    def test_disabled_middleware_ignores_trigger(self):
+        """测试关闭性能分析时，管理员的分析请求同样被忽略"""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('my_courses'), HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+
+    @override_settings(ROOT_URLCONF=build_urlconf(async_views))
+    async def test_async_view_profiled(self):
+        """测试ASGI下的原生异步视图同样可以分析"""
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('my_courses'), {'_profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Profile-Id', response)
+
+
+class ReadOnlyRouterTest(TestCase):
+    def setUp(self):
+        self.router = ReadOnlyRouter()
+
+    def test_reads_routed_only_inside_read_only_views(self):
+        """测试配置只读别名后，只读视图中的读查询路由到只读连接，写入始终走default"""
+        seen = []
+        sync_view = read_only_view(lambda request: seen.append(self.router.db_for_read(Course)))
+
+        with mock.patch('courses.routers.read_only_available', return_value=True):
+            self.assertIsNone(self.router.db_for_read(Course))
+            sync_view(None)
+            self.assertEqual(seen, [READ_ONLY_ALIAS])
+            self.assertEqual(self.router.db_for_write(Course), 'default')
+        # 未配置只读别名(默认开发配置)时不改变路由
+        sync_view(None)
+        self.assertEqual(seen, [READ_ONLY_ALIAS, None])
+        self.assertFalse(self.router.allow_migrate(READ_ONLY_ALIAS, 'courses'))
+
+    async def test_async_view_context_reaches_orm_thread(self):
+        """测试异步只读视图的上下文传递到sync_to_async执行的查询"""
+        @read_only_view
+        async def view(request):
+            return await sync_to_async(self.router.db_for_read)(Course)
+
+        with mock.patch('courses.routers.read_only_available', return_value=True):
+            self.assertEqual(await view(None), READ_ONLY_ALIAS)
+
+
+class TimetableTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='timetable', password='testpass')
+        cls.morning = cls._course("操作系统", [(1, 8, 10), (3, 8, 10)])
+        cls.overlap = cls._course("数据库", [(3, 9, 11)])
+        cls.after = cls._course("人工智能", [(1, 10, 12)])
+        cls.evening = cls._course("机器学习", [(3, 10, 12)])
+
+    @classmethod
+    def _course(cls, name, slots):
+        course = Course.objects.create(name=name, teacher="许教授", capacity=5)
+        CourseSlot.objects.bulk_create([
+            CourseSlot(course=course, weekday=weekday, start_time=datetime.time(start), end_time=datetime.time(end))
+            for weekday, start, end in slots
+        ])
+        return course
+
+    def test_index_matches_pairwise_scan(self):
+        """测试区间索引的冲突判断与两两比较的结果一致(含彼此重叠的已有区间)"""
+        rng = random.Random(7)
+        for _ in range(200):
+            intervals = []
+            for course_id in range(rng.randint(0, 12)):
+                start = rng.randrange(0, 200)
+                intervals.append((start, start + rng.randint(1, 40), course_id))
+            table = Timetable(intervals)
+            start = rng.randrange(0, 220)
+            end = start + rng.randint(1, 40)
+            expected = {c for s, e, c in intervals if s < end and start < e}
+            found = table.conflict(start, end)
+            self.assertEqual(found is not None, bool(expected))
+            if found is not None:
+                self.assertIn(found, expected)
+
+    def test_enroll_rejects_time_conflict(self):
+        """测试选课时拒绝与已选课程时间重叠的课程，首尾相接的时段不算冲突"""
+        self.assertEqual(enroll_student(self.user, self.morning.pk), EnrollStatus.ENROLLED)
+        self.assertEqual(enroll_student(self.user, self.overlap.pk), EnrollStatus.CONFLICT)
+        self.assertEqual(enroll_student(self.user, self.after.pk), EnrollStatus.ENROLLED)
+        self.assertEqual(Course.objects.get(pk=self.overlap.pk).enrolled_count, 0)
+
+        self.client.login(username='timetable', password='testpass')
+        response = self.client.get(reverse('enroll_course', args=[self.overlap.pk]), follow=True)
+        self.assertContains(response, '时间冲突')
+
+    def test_enroll_claims_seat_before_reading(self):
+        """测试选课事务的第一条语句即为占座UPDATE，校验未通过时名额随事务回滚释放"""
+        enroll_student(self.user, self.morning.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(enroll_student(self.user, self.overlap.pk), EnrollStatus.CONFLICT)
+        statements = [
+            query['sql'] for query in queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN'))
+        ]
+        self.assertTrue(statements[0].startswith('UPDATE "courses_course"'), statements[0])
+        self.assertEqual(Course.objects.get(pk=self.overlap.pk).enrolled_count, 0)
+
+    def test_enroll_checks_interval_index(self):
+        """测试选课时的冲突检查查询学生的区间索引，而不是逐对比较时段"""
+        enroll_student(self.user, self.morning.pk)
+        with mock.patch.object(Timetable, 'conflict', autospec=True, side_effect=Timetable.conflict) as conflict:
+            self.assertEqual(enroll_student(self.user, self.overlap.pk), EnrollStatus.CONFLICT)
+        self.assertTrue(conflict.called)
+
+    def test_cart_checks_conflicts_between_adds_and_drops(self):
+        """测试购物车中待选课程之间的冲突被拒绝，退掉冲突课程后可以改选"""
+        self.client.login(username='timetable', password='testpass')
+        response = self.client.post(reverse('cart'), {'add': [self.morning.pk, self.overlap.pk]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([item['status'] for item in response.json()['results']], ['rolled_back', 'conflict'])
+
+        enroll_student(self.user, self.morning.pk)
+        response = self.client.post(reverse('cart'), {'add': [self.overlap.pk], 'drop': [self.morning.pk]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_audit_command_finds_existing_conflicts(self):
+        """测试审计命令一次扫描找出已有的冲突(绕过选课检查写入的记录)"""
+        Enrollment.objects.create(student=self.user, course=self.morning)
+        Enrollment.objects.create(student=self.user, course=self.overlap)
+        Enrollment.objects.create(student=self.user, course=self.evening)
+        out = StringIO()
+        call_command('audit_timetable', stdout=out)
+        output = out.getvalue()
+        self.assertIn('《操作系统》与《数据库》在周三 09:00-10:00 冲突', output)
+        self.assertIn('《数据库》与《机器学习》在周三 10:00-11:00 冲突', output)
+        self.assertIn('共 1 名学生存在 2 组课程时间冲突', output)
+
+        Enrollment.objects.filter(course=self.overlap).delete()
+        out = StringIO()
+        call_command('audit_timetable', stdout=out)
+        self.assertIn('没有发现上课时间冲突', out.getvalue())
+
+
+class PrerequisiteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='prereq', password='testpass')
+        cls.intro = Course.objects.create(name="程序设计基础", teacher="周教授", capacity=5)
+        cls.ds = Course.objects.create(name="数据结构", teacher="吴教授", capacity=5)
+        cls.algo = Course.objects.create(name="算法设计", teacher="郑教授", capacity=5)
+        cls.open = Course.objects.create(name="大学英语", teacher="王老师", capacity=5)
+        cls.ds.prerequisites.add(cls.intro)
+        cls.algo.prerequisites.add(cls.ds)
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.login(username='prereq', password='testpass')
+
+    def tearDown(self):
+        # 测试事务回滚不会触发失效信号，清掉本测试缓存的先修图
+        get_cache().clear()
+
+    def test_graph_closure_and_cycle(self):
+        """测试先修图按拓扑序计算传递闭包；有环时记录日志，环上及依赖环的课程视为暂不可选"""
+        graph = PrerequisiteGraph([(3, 2), (2, 1), (4, 1)])
+        self.assertEqual(graph.closure[3], {1, 2})
+        self.assertEqual(graph.satisfied({3}), {1, 2, 3})
+        self.assertTrue(graph.creates_cycle(1, [3]))
+        self.assertFalse(graph.creates_cycle(4, [2]))
+        self.assertEqual(graph.locked, frozenset())
+
+        with self.assertLogs('courses.prerequisites', 'ERROR'):
+            graph = PrerequisiteGraph([(1, 2), (2, 3), (3, 1), (4, 3), (5, 6)])
+        self.assertEqual(graph.locked, {1, 2, 3, 4})
+        self.assertEqual(graph.missing(4, graph.satisfied({1, 2, 3})), {3})
+        self.assertEqual(graph.missing(5, graph.satisfied({6})), frozenset())
+
+    def test_cycle_rejected_on_add_and_in_admin_form(self):
+        """测试添加成环的先修关系被拒绝(正向与反向添加、后台表单)"""
+        for add in (lambda: self.intro.prerequisites.add(self.algo),
+                    lambda: self.algo.required_by.add(self.intro),
+                    lambda: self.ds.prerequisites.add(self.ds)):
+            with self.assertRaises(PrerequisiteCycleError), transaction.atomic():
+                add()
+        self.assertEqual(Course.prerequisites.through.objects.count(), 2)
+        form = CourseForm(
+            {'name': self.intro.name, 'teacher': self.intro.teacher, 'capacity': 5,
+             'prerequisites': [self.algo.pk]},
+            instance=self.intro,
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('prerequisites', form.errors)
+
+    def test_cycle_check_uses_fresh_edges(self):
+        """测试写入时以最新的先修关系表检查成环，而不是可能过期的缓存"""
+        prerequisite_graph()
+        # 模拟另一个管理员刚提交的修改：先修关系已写入，本进程缓存的先修图尚未失效
+        Course.prerequisites.through.objects.create(from_course=self.intro, to_course=self.open)
+        with self.assertRaises(PrerequisiteCycleError), transaction.atomic():
+            self.open.prerequisites.add(self.algo)
+
+    def test_cyclic_data_degrades_gracefully(self):
+        """测试表中已有环时，相关课程不可选，目录页、接口与其他课程照常可用"""
+        Course.prerequisites.through.objects.create(from_course=self.intro, to_course=self.algo)
+        get_cache().clear()
+        with self.assertLogs('courses.prerequisites', 'ERROR'):
+            response = self.client.get(reverse('course_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "需先修课程", count=3)
+        eligible = {item['id']: item['eligible'] for item in self.client.get(reverse('course_api')).json()['results']}
+        self.assertEqual(eligible[self.open.pk], True)
+        self.assertEqual(eligible[self.intro.pk], False)
+
+        Completion.objects.create(student=self.user, course=self.ds)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(enroll_student(user, self.algo.pk), EnrollStatus.PREREQUISITES)
+        self.assertEqual(enroll_student(user, self.open.pk), EnrollStatus.ENROLLED)
+
+    def test_graph_invalidated_on_change(self):
+        """测试先修关系变化后缓存的先修图被重建"""
+        self.assertEqual(prerequisite_graph().requires(self.open.pk), frozenset())
+        self.open.prerequisites.add(self.intro)
+        self.assertEqual(prerequisite_graph().requires(self.open.pk), {self.intro.pk})
+        self.open.prerequisites.clear()
+        self.assertEqual(prerequisite_graph().requires(self.open.pk), frozenset())
+
+    def test_enroll_requires_completion(self):
+        """测试未修完先修课程不能选课；完成先修课程(或更高阶课程)后可以选课"""
+        response = self.client.post(reverse('enroll_course', args=[self.ds.pk]), follow=True)
+        self.assertContains(response, "请先修完先修课程：程序设计基础")
+        self.assertFalse(Enrollment.objects.filter(student=self.user, course=self.ds).exists())
+
+        Completion.objects.create(student=self.user, course=self.intro)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(enroll_student(user, self.ds.pk), EnrollStatus.ENROLLED)
+        self.assertEqual(enroll_student(user, self.algo.pk), EnrollStatus.PREREQUISITES)
+
+        Completion.objects.create(student=self.user, course=self.ds)
+        self.assertEqual(missing_prerequisites(User.objects.get(pk=self.user.pk), [self.algo.pk]), {})
+
+    def test_completing_advanced_course_satisfies_chain(self):
+        """测试完成高阶课程视为满足其全部先修课程"""
+        Completion.objects.create(student=self.user, course=self.ds)
+        self.assertEqual(missing_prerequisites(self.user, [self.ds.pk, self.algo.pk]), {})
+
+    def test_cart_rejects_missing_prerequisites(self):
+        """测试购物车中有未修完先修课程的课程时整个购物车不生效"""
+        response = self.client.post(reverse('cart'), {'add': [self.open.pk, self.algo.pk]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            [item['status'] for item in response.json()['results']], ['rolled_back', 'prerequisites']
+        )
+
+    def test_catalog_marks_locked_courses(self):
+        """测试课程目录标出需先修的课程，先修检查不随课程数增加查询，接口返回选课资格"""
+        response = self.client.get(reverse('course_list'))
+        self.assertContains(response, "需先修课程", count=2)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('course_list'))
+        prerequisite_queries = [q for q in queries.captured_queries
+                                if 'prerequisites' in q['sql'] or 'completion' in q['sql']]
+        self.assertEqual(len(prerequisite_queries), 1)
+
+        eligible = {item['id']: item['eligible'] for item in self.client.get(reverse('course_api')).json()['results']}
+        self.assertEqual(eligible, {self.intro.pk: True, self.ds.pk: False, self.algo.pk: False, self.open.pk: True})
+
+        Completion.objects.create(student=self.user, course=self.intro)
+        response = self.client.get(reverse('course_list'))
+        self.assertContains(response, "需先修课程", count=1)
+
+
+class RateLimitTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='rusher', password='testpass')
+        cls.other = User.objects.create_user(username='calm', password='testpass')
+        cls.course = Course.objects.create(name="网络安全", teacher="尤教授", capacity=50)
+
+    def setUp(self):
+        get_cache().clear()
+        limiter.reset()
+        rate_limit_stats.reset()
+
+    def tearDown(self):
+        limiter.reset()
+
+    @override_settings(COURSES_RATE_LIMITS={'user': {'limit': 3, 'period': 60, 'lease': 1}})
+    def test_per_user_limit_returns_429(self):
+        """测试同一学生超过限额后返回429与Retry-After，其他学生不受影响"""
+        self.client.login(username='rusher', password='testpass')
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('drop_course', args=[self.course.pk])).status_code, 302)
+        response = self.client.get(reverse('enroll_course', args=[self.course.pk]))
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 60)
+        self.assertFalse(Enrollment.objects.filter(student=self.user).exists())
+
+        self.client.login(username='calm', password='testpass')
+        self.assertEqual(self.client.get(reverse('enroll_course', args=[self.course.pk])).status_code, 302)
+        self.assertIn('courses_rate_limit_total{scope="user",result="limited"} 1', render_prometheus())
+
+    @override_settings(COURSES_RATE_LIMITS={'global': {'limit': 2, 'period': 60, 'lease': 1}})
+    def test_global_limit_shared_by_users(self):
+        """测试全局限额由所有学生共享，购物车的JSON请求得到JSON格式的429"""
+        self.client.login(username='rusher', password='testpass')
+        self.client.get(reverse('drop_course', args=[self.course.pk]))
+        self.client.login(username='calm', password='testpass')
+        self.client.get(reverse('drop_course', args=[self.course.pk]))
+        response = self.client.post(reverse('cart'), {'add': [self.course.pk]}, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('retry_after', response.json())
+
+    def test_lease_serves_requests_locally(self):
+        """测试租到的令牌在本地扣减，桶取空后本地拒绝，两种情况都不访问缓存"""
+        rule = Rule('user', limit=4, period=10, lease=2)
+        cache = get_cache()
+        with mock.patch.object(cache, 'incr', wraps=cache.incr) as incr:
+            results = [limiter.take(rule, 'u1', now=100.0) for _ in range(5)]
+            # 创建计数器(第一次incr因键不存在失败) + 两次租约 + 一次发现桶已空
+            calls = incr.call_count
+            results += [limiter.take(rule, 'u1', now=100.0) for _ in range(3)]
+            self.assertEqual(incr.call_count, calls)
+        self.assertEqual(results[:4], [None] * 4)
+        self.assertEqual(results[4:], [10.0] * 4)
+        self.assertEqual(
+            rate_limit_stats.snapshot()['user'], {'allowed': 4, 'local': 2, 'limited': 4, 'refunded': 0}
+        )
+
+        # 上一周期的用量随时间滑出窗口：周期开始时仍然取空，之后逐步放行
+        self.assertIsNotNone(limiter.take(rule, 'u1', now=110.0))
+        self.assertIsNone(limiter.take(rule, 'u1', now=115.0))
+        self.assertIsNone(limiter.take(rule, 'u1', now=117.5))
+        self.assertIsNone(limiter.take(rule, 'u1', now=117.6))
+        self.assertIsNotNone(limiter.take(rule, 'u1', now=117.7))
+
+    def test_no_double_burst_at_window_boundary(self):
+        """测试周期交界处不会连续放行两个周期的令牌，等待时间按上一周期滑出窗口的速度估算"""
+        rule = Rule('global', limit=10, period=10, lease=1)
+        allowed = [limiter.take(rule, '*', now=109.9) is None for _ in range(10)]
+        allowed += [limiter.take(rule, '*', now=110.0 + i / 100) is None for i in range(10)]
+        self.assertEqual(allowed.count(True), 10)
+        # 11个令牌需要上一周期的10次中有1次滑出窗口，即1秒
+        self.assertAlmostEqual(limiter.take(rule, '*', now=110.5), 0.5)
+
+    @override_settings(COURSES_RATE_LIMITS={
+        'user': {'limit': 2, 'period': 60, 'lease': 1},
+        'global': {'limit': 1, 'period': 60, 'lease': 1},
+    })
+    def test_global_denial_refunds_user_token(self):
+        """测试被全局限额拒绝的请求退还学生自己的令牌"""
+        from .ratelimit import check_rate_limit
+        with mock.patch('courses.ratelimit.time.time', return_value=1000.0):
+            self.assertIsNone(check_rate_limit(self.other))
+            for _ in range(3):
+                self.assertIsNotNone(check_rate_limit(self.user))
+            self.assertEqual(rate_limit_stats.snapshot()['user']['refunded'], 3)
+            # 学生自己的两个令牌都还在
+            user_rule = Rule('user', limit=2, period=60, lease=1)
+            self.assertIsNone(limiter.take(user_rule, self.user.pk))
+            self.assertIsNone(limiter.take(user_rule, self.user.pk))
+            self.assertIsNotNone(limiter.take(user_rule, self.user.pk))
+
+    def test_deploy_check_warns_about_process_local_cache(self):
+        """测试限流计数器保存在进程内缓存时部署检查给出警告，关闭限流时不警告"""
+        self.assertEqual([w.id for w in checks.check_rate_limit_cache(None)], ['courses.W001'])
+        with override_settings(COURSES_RATE_LIMITS=None):
+            self.assertEqual(checks.check_rate_limit_cache(None), [])
+
+    def test_prune_keeps_live_buckets_of_every_rule(self):
+        """测试本地状态清理只删除已过期的周期，不同周期长度的规则互不影响"""
+        user_rule = Rule('user', limit=4, period=10, lease=2)
+        global_rule = Rule('global', limit=100, period=1, lease=10)
+        self.assertIsNone(limiter.take(user_rule, 'u1', now=105.0))
+        self.assertIsNone(limiter.take(global_rule, 'old', now=100.5))
+        with mock.patch('courses.ratelimit.MAX_LOCAL_ENTRIES', 1), \
+                mock.patch.object(get_cache(), 'incr', wraps=get_cache().incr) as incr:
+            self.assertIsNone(limiter.take(global_rule, '*', now=105.5))
+            incr.reset_mock()
+            # 用户桶的租约仍在本地，不再访问缓存；已过期的全局桶被清除
+            self.assertIsNone(limiter.take(user_rule, 'u1', now=105.6))
+            self.assertEqual(incr.call_count, 0)
+        self.assertNotIn(('global', 'old'), limiter._local)
+
+    def test_processes_share_the_bucket(self):
+        """测试多个进程(各自的本地状态)共享缓存中的限额，合计放行数不超过limit"""
+        rule = Rule('global', limit=5, period=10, lease=2)
+        workers = [RateLimiter() for _ in range(3)]
+        allowed = sum(
+            worker.take(rule, '*', now=200.0) is None for _ in range(4) for worker in workers
+        )
+        self.assertEqual(allowed, 5)
+
+
+class CartTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cart', password='testpass')
+        cls.other = User.objects.create_user(username='cartwait', password='testpass')
+        cls.math = Course.objects.create(name="线性代数", teacher="卫教授", capacity=5)
+        cls.physics = Course.objects.create(name="大学物理", teacher="蒋教授", capacity=5)
+        cls.full = Course.objects.create(name="热门选修", teacher="沈教授", capacity=1)
+        cls.old = Course.objects.create(name="旧课程", teacher="韩教授", capacity=1)
+        Enrollment.objects.create(student=cls.user, course=cls.old)
+        Enrollment.objects.create(student=cls.other, course=cls.full)
+
+    def setUp(self):
+        self.client.login(username='cart', password='testpass')
+
+    def _post(self, add=(), drop=()):
+        return self.client.post(reverse('cart'), {'add': list(add), 'drop': list(drop)},
+                                content_type='application/json')
+
+    def _enrolled(self):
+        return set(Enrollment.objects.filter(student=self.user).values_list('course_id', flat=True))
+
+    def test_cart_applies_adds_and_drops(self):
+        """测试购物车一次选两门、退一门，已选人数同步且退课名额递补给候补学生"""
+        join_waitlist(self.other, self.old.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._post(add=[self.math.pk, self.physics.pk, self.math.pk], drop=[self.old.pk])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['applied'])
+        self.assertEqual([item['status'] for item in data['results']], ['enrolled', 'enrolled', 'dropped'])
+        self.assertEqual(self._enrolled(), {self.math.pk, self.physics.pk})
+        self.assertEqual(Course.objects.get(pk=self.math.pk).enrolled_count, 1)
+        self.assertTrue(Enrollment.objects.filter(student=self.other, course=self.old).exists())
+        self.assertEqual(CourseHeat.objects.get(course=self.physics).enrolled, 1)
+
+        response = self._post(add=[self.math.pk])
+        self.assertEqual(response.json()['results'][0]['status'], 'already')
+
+    def test_cart_is_all_or_nothing(self):
+        """测试有课程已满或不存在时整个购物车不生效"""
+        response = self._post(add=[self.math.pk, self.full.pk], drop=[self.old.pk])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            [item['status'] for item in response.json()['results']], ['rolled_back', 'full', 'rolled_back']
+        )
+        response = self._post(add=[self.math.pk, 999999])
+        self.assertEqual(response.json()['results'][1]['status'], 'not_found')
+        self.assertEqual(self._enrolled(), {self.old.pk})
+        self.assertEqual(Course.objects.get(pk=self.math.pk).enrolled_count, 0)
+
+    def test_seat_taken_after_validation_rolls_back(self):
+        """测试校验之后课程被抢满时，占座UPDATE不足额，整个事务回滚"""
+        from . import cart
+        add = [self.math.pk, self.full.pk]
+        fresh = cart._plan(self.user, add, [])
+        # 第一次校验时热门选修看起来还有名额
+        stale = [(action, course_id, 'enrolled') for action, course_id, _ in fresh]
+        with mock.patch.object(cart, '_plan', side_effect=[stale, fresh]):
+            result = cart.apply_cart(self.user, add=add)
+        self.assertFalse(result.applied)
+        self.assertEqual([status for _, _, status in result.items], ['rolled_back', 'full'])
+        self.assertEqual(Course.objects.get(pk=self.math.pk).enrolled_count, 0)
+
+    def test_invalid_cart(self):
+        """测试空购物车、同时选退同一门课与非法ID返回400；表单提交同样可用"""
+        self.assertEqual(self._post().status_code, 400)
+        self.assertEqual(self._post(add=[self.math.pk], drop=[self.math.pk]).status_code, 400)
+        self.assertEqual(self._post(add=['x']).status_code, 400)
+        response = self.client.post(reverse('cart'), {'add': [self.math.pk]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('cart')).status_code, 405)
+
+
+class AdminBulkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='boss', password='testpass')
+        cls.students = [User.objects.create_user(username=f'sec{i}', password='x') for i in range(4)]
+        cls.section_a = Course.objects.create(name="高等数学(1班)", teacher="钱教授", capacity=5)
+        cls.section_b = Course.objects.create(name="高等数学(2班)", teacher="钱教授", capacity=3)
+        for student in cls.students[:3]:
+            Enrollment.objects.create(student=student, course=cls.section_a)
+        Enrollment.objects.create(student=cls.students[0], course=cls.section_b)
+
+    def setUp(self):
+        self.client.login(username='boss', password='testpass')
+
+    def _action(self, model, action, ids, **extra):
+        url = reverse(f'admin:courses_{model}_changelist')
+        data = {'action': action, '_selected_action': [str(pk) for pk in ids], 'index': 0, **extra}
+        return self.client.post(url, data, follow=True)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """测试选课记录列表的查询条数与行数无关"""
+        url = reverse('admin:courses_enrollment_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for i in range(10):
+            student = User.objects.create_user(username=f'extra{i}', password='x')
+            Enrollment.objects.create(student=student, course=self.section_a)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(many), len(few))
+        response = self.client.get(reverse('admin:courses_course_changelist'))
+        self.assertContains(response, '高等数学(1班)')
+
+    def test_change_capacity_action(self):
+        """测试批量修改容量：已选人数超过新容量的课程保持不变，调大后递补候补学生"""
+        waiting = User.objects.create_user(username='waiting', password='x')
+        Course.objects.filter(pk=self.section_b.pk).update(capacity=1)
+        join_waitlist(waiting, self.section_b.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._action('course', 'change_capacity', [self.section_a.pk, self.section_b.pk], capacity=2)
+        self.assertContains(response, '已将 1 门课程的容量改为 2')
+        self.section_a.refresh_from_db()
+        self.section_b.refresh_from_db()
+        self.assertEqual((self.section_a.capacity, self.section_b.capacity), (5, 2))
+        self.assertEqual(self.section_b.enrolled_count, 2)
+        self.assertTrue(Enrollment.objects.filter(student=waiting, course=self.section_b).exists())
+
+        response = self._action('course', 'change_capacity', [self.section_a.pk])
+        self.assertContains(response, '请先填写')
+
+    def test_move_enrollments_action(self):
+        """测试批量转班：已在目标课程的学生被跳过，名额不足时不转移任何记录"""
+        selected = Enrollment.objects.filter(course=self.section_a).values_list('pk', flat=True)
+        response = self._action('enrollment', 'move_to_course', selected, target_course=self.section_b.pk)
+        self.assertContains(response, '已转移 2 名学生')
+        self.assertContains(response, '1 条记录已在目标课程中')
+        self.section_a.refresh_from_db()
+        self.section_b.refresh_from_db()
+        self.assertEqual((self.section_a.enrolled_count, self.section_b.enrolled_count), (1, 3))
+
+        newcomer = User.objects.create_user(username='newcomer', password='x')
+        remaining = [Enrollment.objects.create(student=newcomer, course=self.section_a).pk]
+        response = self._action('enrollment', 'move_to_course', remaining, target_course=self.section_b.pk)
+        self.assertContains(response, '剩余名额不足')
+        self.assertEqual(Enrollment.objects.filter(course=self.section_a).count(), 2)
+        response = self._action('enrollment', 'move_to_course', remaining, target_course=999999)
+        self.assertContains(response, '不存在')
+
+    def test_move_checks_prerequisites_and_conflicts(self):
+        """测试批量转课与选课相同地检查先修课程与时间冲突(转出的课程不计)，并分块处理"""
+        self.addCleanup(get_cache().clear)
+        monday = dict(weekday=1, start_time=datetime.time(8), end_time=datetime.time(10))
+        basics = Course.objects.create(name="初等数学", teacher="钱教授", capacity=5)
+        target = Course.objects.create(name="高等数学(3班)", teacher="钱教授", capacity=5)
+        target.prerequisites.add(basics)
+        clash = Course.objects.create(name="体育", teacher="孙老师", capacity=5)
+        for course in (target, clash, self.section_a):
+            CourseSlot.objects.create(course=course, **monday)
+        sec0, sec1, sec2 = self.students[:3]
+        Completion.objects.create(student=sec0, course=basics)
+        Completion.objects.create(student=sec1, course=basics)
+        Enrollment.objects.create(student=sec1, course=clash)
+
+        selected = Enrollment.objects.filter(course=self.section_a)
+        with mock.patch('courses.bulk.MOVE_CHUNK_SIZE', 1):
+            result = bulk.move_enrollments(selected, target.pk)
+        self.assertEqual((result.status, result.moved, result.skipped), (EnrollStatus.ENROLLED, 1, 0))
+        self.assertEqual((result.conflicts, result.prerequisites), ([sec1.pk], [sec2.pk]))
+        self.assertEqual(set(target.enrollment_set.values_list('student_id', flat=True)), {sec0.pk})
+        target.refresh_from_db()
+        self.assertEqual(target.enrolled_count, 1)
+
+        remaining = Enrollment.objects.filter(course=self.section_a).values_list('pk', flat=True)
+        response = self._action('enrollment', 'move_to_course', remaining, target_course=target.pk)
+        self.assertContains(response, '1 名学生与目标课程时间冲突，未转移：sec1')
+        self.assertContains(response, '1 名学生未修完目标课程的先修课程，未转移：sec2')
+
+    def test_estimated_count_only_for_unfiltered_large_tables(self):
+        """测试分页器只在未筛选且超过阈值时使用估计行数"""
+        latest = Enrollment.objects.order_by('-pk').first().pk
+        with mock.patch('courses.admin.ESTIMATE_THRESHOLD', 0):
+            self.assertEqual(EstimatedCountPaginator(Enrollment.objects.order_by('pk'), 10).count, latest)
+            filtered = Enrollment.objects.filter(course=self.section_b).order_by('pk')
+            self.assertEqual(EstimatedCountPaginator(filtered, 10).count, 1)
+        self.assertEqual(EstimatedCountPaginator(Enrollment.objects.order_by('pk'), 10).count, 4)
+
+
+class CourseCardFragmentTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cards', password='testpass')
+        cls.course = Course.objects.create(name="编译<原理>", teacher="吴教授", capacity=3)
+        cls.other = Course.objects.create(name="计算机网络", teacher="郑教授", capacity=2)
+
+    def setUp(self):
+        get_cache().clear()
+        cache_stats.reset()
+
+    def _cards(self, enrolled_ids=frozenset()):
+        courses = list(Course.objects.filter(pk__in=[self.course.pk, self.other.pk]).order_by('pk'))
+        return str(course_cards(courses, enrolled_ids)), courses
+
+    def test_dynamic_parts_filled_into_cached_cards(self):
+        """测试第二次渲染全部命中片段缓存，且已选人数与已选标记按请求填入"""
+        html, _ = self._cards()
+        self.assertIn('编译&lt;原理&gt;', html)
+        self.assertEqual(html.count('选课</a>'), 2)
+        self.assertNotIn(fragments.SLOT, html)
+
+        enroll_student(self.user, self.course.pk)
+        html, _ = self._cards(frozenset({self.course.pk}))
+        self.assertEqual(cache_stats.snapshot()['cards'], {'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+        self.assertIn(f'<span id="seats-{self.course.pk}">1</span>/3', html)
+        self.assertIn('✅ 已选', html)
+        self.assertEqual(html.count('选课</a>'), 1)
+
+    def test_course_update_invalidates_card(self):
+        """测试修改课程后更新时间变化，旧片段不再使用"""
+        self._cards()
+        course = Course.objects.get(pk=self.course.pk)
+        course.teacher = "冯教授"
+        course.save()
+        html, _ = self._cards()
+        self.assertIn('冯教授', html)
+        self.assertNotIn('吴教授', html)
+        self.assertEqual(cache_stats.snapshot()['cards']['misses'], 3)
+
+    def test_control_characters_in_fields(self):
+        """测试课程字段中含有NUL等字符时卡片照常渲染"""
+        Course.objects.filter(pk=self.other.pk).update(name="网络\x00安全", teacher="<!--card-slot-->")
+        html, _ = self._cards()
+        self.assertIn('网络\x00安全', html)
+        self.assertEqual(html.count('选课</a>'), 2)
+
+    def test_bad_part_count_falls_back_to_full_render(self):
+        """测试片段数不符时不缓存该卡片，直接渲染完整卡片"""
+        with mock.patch.object(fragments, '_PARTS', 7), self.assertLogs('courses.fragments', 'WARNING'):
+            html, courses = self._cards(frozenset({self.course.pk}))
+        self.assertIn('✅ 已选', html)
+        self.assertEqual(html.count('选课</a>'), 1)
+        self.assertIn(f'<span id="seats-{self.other.pk}">0</span>/2', html)
+        self.assertNotIn(fragments.SLOT, html)
+        self.assertEqual(get_cache().get_many([fragments._card_key(course) for course in courses]), {})
+
+    def test_course_list_page_uses_cards(self):
+        """测试课程列表页输出片段缓存的卡片"""
+        self.client.login(username='cards', password='testpass')
+        response = self.client.get(reverse('course_list'))
+        self.assertContains(response, 'id="seats-%d"' % self.other.pk)
+        self.assertContains(response, reverse('enroll_course', args=[self.other.pk]))
+
+
+@override_settings(COURSES_REPLICA_ALIASES=['replica1', 'replica2'])
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        # TestCase的每个测试都在事务中，路由测试需要模拟事务外的读查询
+        patcher = mock.patch.object(ReplicaRouter, '_in_transaction', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, view, cookies=None):
+        request = self.factory.get('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaStickinessMiddleware(view)(request)
+
+    def test_reads_use_one_replica_until_write(self):
+        """测试读查询在请求内固定使用一个副本，写入分流模型后改读主库并设置粘滞Cookie"""
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Course))
+            seen.append(self.router.db_for_read(Enrollment))
+            seen.append(self.router.db_for_read(User))
+            self.assertEqual(self.router.db_for_write(Enrollment), 'default')
+            seen.append(self.router.db_for_read(Course))
+            return HttpResponse()
+
+        response = self._run(view)
+        self.assertIn(seen[0], ('replica1', 'replica2'))
+        self.assertEqual(seen[1], seen[0])
+        self.assertEqual(seen[2:], [None, 'default'])
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+    def test_sticky_cookie_pins_reads_to_primary(self):
+        """测试携带未过期粘滞Cookie的请求读主库，过期或无写入时不设置Cookie"""
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Course))
+            return HttpResponse()
+
+        response = self._run(view, {STICKY_COOKIE: str(time.time() + 30)})
+        self.assertEqual(seen, ['default'])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        self._run(view, {STICKY_COOKIE: str(time.time() - 1)})
+        self._run(view, {STICKY_COOKIE: 'bad'})
+        self.assertTrue(all(alias in ('replica1', 'replica2') for alias in seen[1:]))
+
+    def test_reads_outside_requests_use_primary(self):
+        """测试请求之外的读查询(管理命令、信号、缓存回填)走主库"""
+        self.assertEqual(self.router.db_for_read(Course), 'default')
+        self.assertEqual(self.router.db_for_read(Enrollment), 'default')
+
+    def test_transactions_and_migrations_use_primary(self):
+        """测试事务中的读查询走主库，副本不执行迁移"""
+        with mock.patch.object(ReplicaRouter, '_in_transaction', return_value=True):
+            self.assertEqual(self.router.db_for_read(Course), 'default')
+        self.assertFalse(self.router.allow_migrate('replica1', 'courses'))
+        self.assertTrue(self.router.allow_migrate('default', 'courses'))
+        with override_settings(COURSES_REPLICA_ALIASES=[]):
+            self.assertIsNone(self.router.db_for_read(Course))
+
+    @override_settings(COURSES_REPLICA_ALIASES=['default'], DATABASE_ROUTERS=['courses.routers.ReplicaRouter'])
+    def test_enroll_sets_sticky_cookie(self):
+        """测试选课请求设置粘滞Cookie，只读页面不设置"""
+        User.objects.create_user(username='replica', password='testpass')
+        course = Course.objects.create(name="分布式系统", teacher="周教授", capacity=5)
+        client = Client()
+        client.login(username='replica', password='testpass')
+
+        response = client.get(reverse('course_list'))
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        response = client.get(reverse('enroll_course', args=[course.id]))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertTrue(Enrollment.objects.filter(course=course).exists())
+
+
 class EnrollmentViewTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -292,6 +1601,396 @@ class EnrollmentViewTest(TestCase):
         )
 
 
+class EnrollmentServiceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user1 = User.objects.create_user(username='svc1', password='test123')
+        cls.user2 = User.objects.create_user(username='svc2', password='test123')
+        cls.course = Course.objects.create(name="离散数学", teacher="郑教授", capacity=1)
+
+    def test_enroll_claims_seat_once(self):
+        """测试占座成功后计数只加一"""
+        self.assertEqual(enroll_student(self.user1, self.course.id), EnrollStatus.ENROLLED)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+    def test_enroll_bumps_data_version_only(self):
+        """测试选课与退课在事务中更新选课数据版本，不更新目录版本行"""
+        version, data = CatalogVersion.versions()
+        enroll_student(self.user1, self.course.id)
+        drop_student(self.user1, self.course.id)
+        after, data_after = CatalogVersion.versions()
+        self.assertEqual(after.version, version.version)
+        self.assertEqual(data_after.version, data.version + 2)
+
+    def test_enroll_full_and_duplicate(self):
+        """测试满员与重复选课的返回结果"""
+        enroll_student(self.user1, self.course.id)
+        self.assertEqual(enroll_student(self.user1, self.course.id), EnrollStatus.ALREADY_ENROLLED)
+        self.assertEqual(enroll_student(self.user2, self.course.id), EnrollStatus.FULL)
+        self.assertEqual(enroll_student(self.user2, 999), EnrollStatus.NOT_FOUND)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+    def test_drop_frees_seat(self):
+        """测试退课释放名额"""
+        enroll_student(self.user1, self.course.id)
+        self.assertTrue(drop_student(self.user1, self.course.id))
+        self.assertFalse(drop_student(self.user1, self.course.id))
+        self.assertEqual(enroll_student(self.user2, self.course.id), EnrollStatus.ENROLLED)
+
+    def test_retry_on_database_lock(self):
+        """测试遇到database is locked时退避重试"""
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError("database is locked")
+            return 'ok'
+
+        with mock.patch.object(services.time, 'sleep'), \
+                mock.patch.object(services.connection, 'in_atomic_block', False):
+            self.assertEqual(services.run_with_retry(flaky), 'ok')
+        self.assertEqual(len(calls), 3)
+
+    def test_enroll_missing_course_view_404(self):
+        """测试选不存在的课程返回404"""
+        self.client.login(username='svc1', password='test123')
+        response = self.client.get(reverse('enroll_course', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class WaitlistTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'wait{i}', password='test123') for i in range(4)
+        ]
+        cls.course = Course.objects.create(name="算法设计", teacher="冯教授", capacity=1)
+        enroll_student(cls.users[0], cls.course.id)
+
+    def test_join_waitlist_in_order(self):
+        """测试满员后按顺序加入候补"""
+        status, first = join_waitlist(self.users[1], self.course.id)
+        self.assertEqual(status, EnrollStatus.WAITLISTED)
+        _, second = join_waitlist(self.users[2], self.course.id)
+        self.assertEqual((first.rank(), second.rank()), (1, 2))
+        # 重复加入返回原记录
+        _, again = join_waitlist(self.users[1], self.course.id)
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(join_waitlist(self.users[0], self.course.id)[0], EnrollStatus.ALREADY_ENROLLED)
+
+    def test_drop_promotes_head(self):
+        """测试退课时队首学生在同一事务中递补"""
+        join_waitlist(self.users[1], self.course.id)
+        join_waitlist(self.users[2], self.course.id)
+        drop_student(self.users[0], self.course.id)
+
+        self.assertTrue(Enrollment.objects.filter(student=self.users[1], course=self.course).exists())
+        self.assertFalse(WaitlistEntry.objects.filter(student=self.users[1]).exists())
+        self.assertEqual(WaitlistEntry.objects.get(student=self.users[2]).rank(), 1)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+    def test_batch_promotion_after_capacity_increase(self):
+        """测试调大容量后批量递补"""
+        for user in self.users[1:]:
+            join_waitlist(user, self.course.id)
+        Course.objects.filter(pk=self.course.pk).update(capacity=3)
+
+        results = promote_waitlists()
+        self.assertEqual(results, {self.course.id: [self.users[1].id, self.users[2].id]})
+        self.assertEqual(WaitlistEntry.objects.get().student, self.users[3])
+
+    def test_promotion_skips_ineligible_students(self):
+        """测试递补时跳过时间冲突或未修完先修课程的候补学生，并移除其候补记录"""
+        self.addCleanup(get_cache().clear)
+        for user in self.users[1:]:
+            join_waitlist(user, self.course.id)
+        slot = dict(weekday=2, start_time=datetime.time(8), end_time=datetime.time(10))
+        CourseSlot.objects.create(course=self.course, **slot)
+        clash = Course.objects.create(name="编译原理", teacher="冯教授", capacity=5)
+        CourseSlot.objects.create(course=clash, **slot)
+        Enrollment.objects.create(student=self.users[1], course=clash)
+        basics = Course.objects.create(name="离散数学", teacher="冯教授", capacity=5)
+        self.course.prerequisites.add(basics)
+        # users[1]时间冲突，users[2]未修完先修课程，users[3]符合条件
+        Completion.objects.create(student=self.users[1], course=basics)
+        Completion.objects.create(student=self.users[3], course=basics)
+        skipped = services.enrollment_stats.snapshot()['promotion_skipped']
+
+        drop_student(self.users[0], self.course.id)
+        self.assertTrue(Enrollment.objects.filter(student=self.users[3], course=self.course).exists())
+        self.assertFalse(WaitlistEntry.objects.filter(course=self.course).exists())
+        self.assertEqual(services.enrollment_stats.snapshot()['promotion_skipped'], skipped + 2)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+    def test_rank_survives_arbitrary_removals(self):
+        """测试从队列中间批量删除后名次仍与队列顺序一致，with_rank只需一条查询"""
+        students = [User.objects.create_user(username=f'queue{i}', password='test123') for i in range(12)]
+        with CaptureQueriesContext(connection) as queries:
+            for student in students:
+                join_waitlist(student, self.course.id)
+        # 加入候补只插入自己的记录(另有一次条件UPDATE尝试递补)，不写其他共享行
+        writes = [
+            query['sql'] for query in queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and 'UPDATE "courses_course"' not in query['sql']
+        ]
+        self.assertEqual(len(writes), len(students))
+        self.assertTrue(all(sql.startswith('INSERT INTO "courses_waitlistentry"') for sql in writes))
+        WaitlistEntry.objects.filter(student__in=students[2:9:2]).delete()
+        leave_waitlist(students[0], self.course.id)
+
+        entries = list(WaitlistEntry.objects.filter(course=self.course).order_by('position'))
+        with CaptureQueriesContext(connection) as queries:
+            ranked = list(WaitlistEntry.objects.filter(course=self.course).order_by('position').with_rank())
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([entry.queue_rank for entry in ranked], list(range(1, len(entries) + 1)))
+        self.assertEqual(entries[-1].rank(), len(entries))
+
+    def test_enroll_view_joins_waitlist(self):
+        """测试选已满课程时自动加入候补并在我的课程中显示"""
+        self.client.login(username='wait1', password='test123')
+        response = self.client.get(reverse('enroll_course', args=[self.course.id]), follow=True)
+        self.assertContains(response, '已加入候补队列，当前排第 1 位')
+        self.assertContains(response, '候补中的课程')
+
+        self.client.get(reverse('leave_waitlist', args=[self.course.id]))
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+
+class EnrollmentImportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'imp{i}', password='test123') for i in range(4)
+        ]
+        cls.small = Course.objects.create(name="编译原理", teacher="许教授", capacity=2)
+        cls.large = Course.objects.create(name="计算机网络", teacher="何教授", capacity=10)
+
+    def setUp(self):
+        get_cache().clear()
+
+    def _import(self, text, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as handle:
+            handle.write(text)
+        self.addCleanup(os.unlink, handle.name)
+        out = StringIO()
+        call_command('import_enrollments', handle.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_by_course_id(self):
+        """测试按课程ID导入：重复、超容量与未知记录被跳过并计数"""
+        enroll_student(self.users[0], self.large.id)
+        rows = [
+            ('imp0', self.large.id),  # 已存在
+            ('imp1', self.large.id),
+            ('imp1', self.large.id),  # 文件内重复
+            ('imp1', self.small.id),
+            ('imp2', self.small.id),
+            ('imp3', self.small.id),  # 超出容量
+            ('nobody', self.small.id),
+            ('imp2', 99999),
+        ]
+        text = 'username,course_id\n' + ''.join(f'{u},{c}\n' for u, c in rows)
+        output = self._import(text, '--chunk-size', '3')
+
+        self.assertIn('新增 3，重复 2，超出容量 1，未知用户 1，未知课程 1，无效 0', output)
+        self.small.refresh_from_db()
+        self.large.refresh_from_db()
+        self.assertEqual((self.small.enrolled_count, self.large.enrolled_count), (2, 2))
+        self.assertEqual(self.small.heat.enrolled, 2)
+        self.assertEqual(Enrollment.objects.count(), 4)
+
+    def test_rows_missing_columns_are_invalid(self):
+        """测试缺少字段或字段为空的行计为无效，不中断导入"""
+        text = f'username,course_id\nimp1,{self.large.id}\nimp2\n,{self.large.id}\nimp3,\n'
+        output = self._import(text)
+        self.assertIn('新增 1，重复 0，超出容量 0，未知用户 0，未知课程 0，无效 3', output)
+        self.assertEqual(Enrollment.objects.count(), 1)
+
+    def test_counts_reflect_rows_actually_inserted(self):
+        """测试导入与并发选课抢先写入同一记录时，已选人数、热度与统计只计实际写入的记录"""
+        insert = importing._insert
+
+        def racing_insert(accepted, report):
+            # 读取已有记录之后、写入之前，另一个请求为imp1选了同一门课
+            Enrollment.objects.create(student=self.users[1], course=self.large)
+            return insert(accepted, report)
+
+        rows = [('imp1', str(self.large.id)), ('imp2', str(self.large.id))]
+        with mock.patch.object(importing, '_insert', racing_insert):
+            report = importing.import_enrollments(rows, importing.course_lookup())
+        self.assertEqual((report.inserted, report.duplicates), (1, 1))
+        self.large.refresh_from_db()
+        self.assertEqual(self.large.enrolled_count, 2)
+        self.assertEqual(self.large.heat.enrolled, 2)
+        self.assertEqual(Enrollment.objects.filter(course=self.large).count(), 2)
+
+    def test_unrelated_integrity_error_is_raised(self):
+        """测试写入因其他原因(如外键错误)失败时直接抛出，不会反复重试同一批记录"""
+        enroll_student(self.users[0], self.small.id)
+        rows = [('imp0', str(self.large.id)), ('imp1', str(self.small.id))]
+        error = IntegrityError('FOREIGN KEY constraint failed')
+        with mock.patch.object(Enrollment.objects, 'bulk_create', side_effect=[error, error]) as bulk_create:
+            with self.assertRaises(IntegrityError):
+                importing.import_enrollments(rows, importing.course_lookup())
+        self.assertEqual(bulk_create.call_count, 1)
+
+    def test_import_by_name_clears_waitlist(self):
+        """测试按课程名称导入，并清理被导入学生的候补记录"""
+        enroll_student(self.users[0], self.small.id)
+        enroll_student(self.users[1], self.small.id)
+        join_waitlist(self.users[2], self.small.id)
+        version = CatalogVersion.versions()[1].version
+
+        self._import('username,course\nimp2,编译原理\n', '--allow-over-capacity')
+        self.small.refresh_from_db()
+        self.assertEqual(self.small.enrolled_count, 3)
+        self.assertFalse(WaitlistEntry.objects.exists())
+        self.assertGreater(CatalogVersion.versions()[1].version, version)
+        self.client.login(username='imp3', password='test123')
+        results = self.client.get(reverse('course_api')).json()['results']
+        self.assertEqual({c['id']: c['enrolled_count'] for c in results}[self.small.id], 3)
+
+
+class EnrollmentExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='registrar', password='test123', is_staff=True)
+        cls.students = [
+            User.objects.create_user(username=f'exp{i}', password='test123') for i in range(3)
+        ]
+        cls.course = Course.objects.create(name="信息检索", teacher="邹教授", capacity=10)
+        cls.other = Course.objects.create(name="数字逻辑", teacher="钱教授", capacity=10)
+        for student in cls.students:
+            Enrollment.objects.create(student=student, course=cls.course)
+        Enrollment.objects.create(student=cls.students[0], course=cls.other)
+
+    def test_roster_csv_streams_with_single_query(self):
+        """测试课程名单以流式CSV导出，且用户与课程信息由一次JOIN查询取回"""
+        self.client.login(username='registrar', password='test123')
+        response = self.client.get(reverse('export_roster', args=[self.course.id]))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+        with self.assertNumQueries(1):
+            body = b''.join(response.streaming_content).decode()
+        lines = body.splitlines()
+        self.assertEqual(lines[0], 'enrollment_id,username,student_id,course_id,course,teacher,enrolled_at')
+        self.assertEqual(len(lines), 4)
+        self.assertIn(',exp1,', lines[2])
+        self.assertIn(',信息检索,邹教授,', lines[2])
+
+    def test_full_export_jsonl(self):
+        """测试全部选课记录以JSON Lines导出"""
+        self.client.login(username='registrar', password='test123')
+        response = self.client.get(reverse('export_enrollments'), {'format': 'jsonl'})
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records[-1]['course'], '数字逻辑')
+        self.assertEqual(records[-1]['username'], 'exp0')
+
+    def test_export_requires_staff(self):
+        """测试非管理员不能导出"""
+        self.client.login(username='exp0', password='test123')
+        response = self.client.get(reverse('export_enrollments'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_export_command(self):
+        """测试导出命令写到标准输出"""
+        out = StringIO()
+        call_command('export_enrollments', '--course', str(self.other.id), stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class SeedCommandTest(TestCase):
+    def _snapshot(self):
+        return (
+            list(Course.objects.order_by('pk').values_list('name', 'teacher', 'capacity', 'enrolled_count')),
+            sorted(Enrollment.objects.values_list('student__username', 'course__name')),
+        )
+
+    def test_seed_is_deterministic_and_consistent(self):
+        """测试相同种子生成相同数据，已选人数与选课记录一致且热门课程集中"""
+        call_command('seed', '--users', '200', '--courses', '20', '--enrollments', '500',
+                     '--seed', '7', stdout=StringIO())
+        self.assertEqual(User.objects.count(), 200)
+        self.assertEqual(Enrollment.objects.count(), sum(Course.objects.values_list('enrolled_count', flat=True)))
+        self.assertFalse(Course.objects.filter(enrolled_count__gt=F('capacity')).exists())
+        self.assertEqual(CourseHeat.objects.count(), 20)
+        # Zipf分布：热门课程被选满，冷门课程选课人数很少
+        self.assertTrue(Course.objects.filter(enrolled_count=F('capacity')).exists())
+        self.assertTrue(Course.objects.filter(enrolled_count__lt=F('capacity') / 4).exists())
+        first = self._snapshot()
+
+        Enrollment.objects.all().delete()
+        Course.objects.all().delete()
+        User.objects.all().delete()
+        call_command('seed', '--users', '200', '--courses', '20', '--enrollments', '500',
+                     '--seed', '7', stdout=StringIO())
+        self.assertEqual(self._snapshot(), first)
+
+    def test_seeded_accounts_can_log_in(self):
+        """测试生成账号共用一次计算的密码哈希且可以登录"""
+        call_command('seed', '--users', '3', '--courses', '1', '--enrollments', '0', stdout=StringIO())
+        self.assertEqual(User.objects.values('password').distinct().count(), 1)
+        password = User.objects.get(username='seed000002').password
+        self.assertTrue(self.client.login(username='seed000002', password='seed123'))
+        # 登录不应触发重新哈希，否则该账号已有的会话全部失效
+        self.assertEqual(User.objects.get(username='seed000002').password, password)
+
+    def test_unlisted_hasher_rejected(self):
+        """测试未加入PASSWORD_HASHERS的哈希算法被拒绝"""
+        with self.assertRaises(CommandError):
+            call_command('seed', '--users', '1', '--hasher', 'nonexistent', stdout=StringIO())
+
+
+class ProvisionAccountsTest(TestCase):
+    def test_provision_from_csv(self):
+        """测试批量开通：跳过已存在与重复的用户名，密码可用于登录"""
+        User.objects.create_user(username='intake0', password='old-password')
+        rows = ['username,password,email', 'intake0,new-password,', 'intake1,pass-1,a@example.com',
+                'intake2,pass-2,', 'intake2,dup,', 'bad name!,x,']
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as handle:
+            handle.write('\n'.join(rows) + '\n')
+        self.addCleanup(os.unlink, handle.name)
+
+        out = StringIO()
+        call_command('provision_accounts', handle.name, '--workers', '2', '--batch-size', '2', stdout=out)
+        self.assertIn('新开通 2，已存在 2，用户名不合法 1', out.getvalue())
+        self.assertEqual(User.objects.get(username='intake1').email, 'a@example.com')
+        self.assertTrue(self.client.login(username='intake2', password='pass-2'))
+        # 已存在的账号保持原密码
+        self.assertTrue(User.objects.get(username='intake0').check_password('old-password'))
+
+    def test_provision_api_in_process(self):
+        """测试workers=1时在当前进程中计算哈希，空密码设置为不可用密码"""
+        report = provision_accounts(
+            ({'username': f'api{i}', 'password': ''} for i in range(3)), workers=1
+        )
+        self.assertEqual(report.as_dict()['created'], 3)
+        self.assertFalse(User.objects.get(username='api0').has_usable_password())
+
+    def test_concurrently_created_accounts_not_counted(self):
+        """测试批次中已存在、以及过滤之后被并发开通的用户名都不计入新开通"""
+        User.objects.create_user(username='taken', password='x')
+        bulk_create = User.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # 另一个开通进程在本批过滤之后、写入之前创建了同名账号
+            User.objects.create_user(username='raced', password='other')
+            return bulk_create(objs, **kwargs)
+
+        accounts = [{'username': name, 'password': 'pw'} for name in ('taken', 'raced', 'fresh')]
+        with mock.patch.object(User.objects, 'bulk_create', side_effect=racing_bulk_create):
+            report = provision_accounts(accounts, workers=1)
+        self.assertEqual((report.created, report.existing), (1, 2))
+        self.assertTrue(User.objects.get(username='raced').check_password('other'))
+
+
 class MyCoursesViewTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -0,0 +1,175 @@
+"""
+课表时间冲突检测
+每个时段换算为一周内的分钟区间[开始, 结束)(周一0点为0)，两个区间重叠当且仅当
+开始1 < 结束2 且 开始2 < 结束1
+- Timetable: 单个学生的区间索引，按开始时间排序并维护结束时间的前缀最大值，
+  查询一个区间是否冲突只需两次二分查找(O(log n))，已有区间之间本身重叠时同样正确；
+  slot_map按(星期, 开始时间)顺序取出时段，建索引时的排序只需合并各课程已有序的时段
+- find_conflicts: 按(学生, 开始时间)有序的时段流做一次扫描线，找出全部冲突
+"""
+from bisect import bisect_left, bisect_right, insort
+
+from django.db.models import Exists, OuterRef, Q
+
+from .models import CourseSlot, Enrollment
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def week_interval(weekday, start_time, end_time):
+    """把(星期, 开始时间, 结束时间)换算为一周内的分钟区间"""
+    offset = (weekday - 1) * MINUTES_PER_DAY
+    return offset + _minutes(start_time), offset + _minutes(end_time)
+
+
+class Timetable:
+    """
+    单个学生的时段区间索引
+    - conflict(start, end): 返回与区间冲突的课程ID，无冲突返回None，O(log n)
+    - add(start, end, course_id): 加入一个区间(购物车中依次检查多门课程时使用)
+    """
+
+    def __init__(self, intervals=()):
+        self._items = sorted(intervals)
+        self._rebuild(0)
+
+    def _rebuild(self, index):
+        """重算index及之后位置的开始时间表与结束时间前缀最大值"""
+        self._starts = [start for start, _, _ in self._items]
+        max_ends = self._max_ends[:index] if index else []
+        running = max_ends[-1] if max_ends else float('-inf')
+        for _, end, _ in self._items[index:]:
+            running = max(running, end)
+            max_ends.append(running)
+        self._max_ends = max_ends
+
+    def __len__(self):
+        return len(self._items)
+
+    def conflict(self, start, end):
+        """
+        查找与[start, end)重叠的已有区间，返回其课程ID，无冲突返回None
+        逻辑：
+        1. 开始时间早于end的区间是前k个(二分查找)
+        2. 结束时间前缀最大值首次超过start的位置j(二分查找)：
+           j < k 时区间j的结束时间即为该前缀最大值，与[start, end)重叠
+        """
+        limit = bisect_left(self._starts, end)
+        index = bisect_right(self._max_ends, start, 0, limit)
+        if index < limit:
+            return self._items[index][2]
+        return None
+
+    def add(self, start, end, course_id):
+        item = (start, end, course_id)
+        insort(self._items, item)
+        self._rebuild(self._items.index(item))
+
+
+def slot_map(student, course_ids):
+    """
+    一条查询取出指定课程与学生已选课程的时段(按星期与开始时间排序)
+    返回：(课程ID -> 区间列表, 其中学生已选的课程ID集合)
+    """
+    own = Enrollment.objects.filter(student=student)
+    rows = (
+        CourseSlot.objects.filter(Q(course_id__in=course_ids) | Q(course_id__in=own.values('course_id')))
+        .annotate(taken=Exists(own.filter(course_id=OuterRef('course_id'))))
+        .order_by('weekday', 'start_time')
+        .values_list('course_id', 'weekday', 'start_time', 'end_time', 'taken')
+    )
+    slots, enrolled = {}, set()
+    for course_id, weekday, start_time, end_time, taken in rows:
+        slots.setdefault(course_id, []).append(week_interval(weekday, start_time, end_time))
+        if taken:
+            enrolled.add(course_id)
+    return slots, enrolled
+
+
+def build_timetable(slots, course_ids):
+    """用指定课程的时段建立区间索引"""
+    return Timetable(
+        (start, end, course_id) for course_id in course_ids for start, end in slots.get(course_id, ())
+    )
+
+
+def first_conflict(timetable, intervals):
+    """返回与任一区间冲突的课程ID，无冲突返回None"""
+    for start, end in intervals:
+        course_id = timetable.conflict(start, end)
+        if course_id is not None:
+            return course_id
+    return None
+
+
+def conflicting_course(student, course_id):
+    """
+    选课前的时间冲突检查(一条查询)
+    返回：与该课程时段重叠的已选课程ID；课程没有时段、已选该课程或无冲突时返回None
+    """
+    slots, enrolled = slot_map(student, [course_id])
+    if course_id not in slots or course_id in enrolled:
+        return None
+    return first_conflict(build_timetable(slots, enrolled), slots[course_id])
+
+
+def conflicting_students(moves, course_id):
+    """
+    批量转课的时间冲突检查(两条查询)
+    参数：
+    - moves: {学生ID: 转出的课程ID}
+    - course_id: 转入的课程ID
+    返回：转入后与其他已选课程时段重叠的学生ID集合(转出的课程不计)
+    逻辑：按学生建立区间索引，逐个查询转入课程的时段
+    """
+    target = [
+        week_interval(weekday, start_time, end_time)
+        for weekday, start_time, end_time in CourseSlot.objects.filter(course_id=course_id)
+        .values_list('weekday', 'start_time', 'end_time')
+    ]
+    if not target or not moves:
+        return set()
+    rows = (
+        Enrollment.objects.filter(student_id__in=moves.keys())
+        .exclude(course_id=course_id)
+        .order_by('course__slots__weekday', 'course__slots__start_time')
+        .values_list(
+            'student_id', 'course_id',
+            'course__slots__weekday', 'course__slots__start_time', 'course__slots__end_time',
+        )
+    )
+    intervals = {}
+    for student_id, other_id, weekday, start_time, end_time in rows:
+        if weekday is not None and other_id != moves[student_id]:
+            start, end = week_interval(weekday, start_time, end_time)
+            intervals.setdefault(student_id, []).append((start, end, other_id))
+    return {
+        student_id for student_id, items in intervals.items()
+        if first_conflict(Timetable(items), target) is not None
+    }
+
+
+def find_conflicts(rows):
+    """
+    扫描线查找全部时间冲突
+    参数：
+    - rows: (学生ID, 课程ID, 星期, 开始时间, 结束时间)，按学生、星期、开始时间排序
+    生成：(学生ID, 课程ID, 冲突课程ID, 星期, 重叠开始, 重叠结束)，时间为当天的分钟数
+    逻辑：同一学生同一天内维护尚未结束的时段，新时段与其中每个时段都重叠
+    """
+    key = None
+    active = []
+    for student_id, course_id, weekday, start_time, end_time in rows:
+        if (student_id, weekday) != key:
+            key = (student_id, weekday)
+            active = []
+        start, end = _minutes(start_time), _minutes(end_time)
+        active = [item for item in active if item[0] > start]
+        for other_end, other_course in active:
+            if other_course != course_id:
+                yield student_id, other_course, course_id, weekday, start, min(end, other_end)
+        active.append((end, course_id))
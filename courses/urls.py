@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path  # 导入Django的路由配置函数
-from . import views  # 从当前目录导入views模块
+from . import async_views, views  # 从当前目录导入视图模块
+
+# 只读页面(首页、课程列表、我的课程)的实现：ASGI部署可开启COURSES_ASYNC_VIEWS使用原生异步版本
+read_views = async_views if getattr(settings, 'COURSES_ASYNC_VIEWS', False) else views
 
 # URL模式列表，Django会按顺序匹配请求的URL
 urlpatterns = [
@@ -7,7 +11,7 @@ urlpatterns = [
     # 路径: 根路径('/')
     # 对应视图: views.index
     # 名称: 'index'（在模板中可用{% url 'index' %}引用）
-    path('', views.index, name='index'),  # 登录后首页
+    path('', read_views.index, name='index'),  # 登录后首页
 
     # 用户认证相关路由
     path('register/', views.register_view, name='register'),  # 用户注册
@@ -15,13 +19,27 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),  # 用户退出
 
     # 课程功能相关路由
-    path('courses/', views.course_list, name='course_list'),  # 课程列表页
+    path('courses/', read_views.course_list, name='course_list'),  # 课程列表页
+    path('courses/search/', views.course_search, name='course_search'),  # 课程全文检索
+    path('api/courses/', views.course_api, name='course_api'),  # 课程目录JSON接口(支持ETag)
+    path('live/seats/', views.seat_events, name='seat_events'),  # 剩余名额实时推送(SSE)
+    path('api/heat/', views.course_heat, name='course_heat'),  # 选课热度图表数据
+    path('api/cache-stats/', views.cache_stats_view, name='cache_stats'),  # 缓存命中统计(管理员)
+    path('metrics/', views.metrics_view, name='metrics'),  # Prometheus指标(令牌或管理员)
+    path('profiles/', views.profile_list, name='profile_list'),  # 请求性能分析结果列表(管理员)
+    path('profiles/<str:profile_id>/<str:kind>/', views.profile_download, name='profile_download'),  # 下载分析结果
+    path('export/enrollments/', views.export_enrollments, name='export_enrollments'),  # 导出全部选课记录(管理员)
+    path('export/roster/<int:course_id>/', views.export_enrollments, name='export_roster'),  # 导出课程名单(管理员)
 
     # 带参数的路由：<int:course_id>表示捕获整数类型的course_id参数
     path('enroll/<int:course_id>/', views.enroll_course, name='enroll_course'),  # 选课
 
-    path('my-courses/', views.my_courses, name='my_courses'),  # 我的课程页
+    path('cart/', views.cart, name='cart'),  # 选课购物车(一次选、退多门课)
+
+    path('my-courses/', read_views.my_courses, name='my_courses'),  # 我的课程页
 
     # 带参数的路由
     path('drop/<int:course_id>/', views.drop_course, name='drop_course'),  # 退课
+
+    path('waitlist/leave/<int:course_id>/', views.leave_waitlist_view, name='leave_waitlist'),  # 退出候补
 ]
\ No newline at end of file
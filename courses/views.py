@@ -1,72 +1,525 @@
-from django.db.models import Count
-from django.http import HttpResponse
-from django.shortcuts import render, redirect
-from django.contrib.auth.models import User
+import json
+import os
+from datetime import datetime, time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login, logout
-from .models import Course, Enrollment
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import get_object_or_404
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import condition, require_POST
+
+from . import cache as catalog_cache
+from . import live, profiling
+from .cart import CartError, apply_cart
+from .exporting import CONTENT_TYPES, EXPORT_FORMATS, export_lines
+from .fragments import course_cards
+from .heat import HEAT_ORDERINGS, top_courses
+from .metrics import render_prometheus
+from .models import CatalogVersion, Course, Enrollment, WaitlistEntry
+from .pagination import DEFAULT_ORDERING, ORDERINGS, keyset_paginate
+from .prerequisites import missing_prerequisites
+from .ratelimit import rate_limited
+from .routers import read_only_view
+from .search import search_courses
+from .services import EnrollStatus, drop_student, enroll_student, join_waitlist, leave_waitlist
+
+
+# 选课热度图表默认与最多展示的课程数
+CHART_TOP_N = 20
+CHART_MAX_N = 100
+
+
+def _catalog_filters(params):
+    """
+    解析课程目录的筛选与排序参数
+    返回：(规范化后的参数字典, 课程查询集)
+    - teacher: 授课教师(精确匹配)
+    - free: 为"1"时只显示有空余名额的课程
+    - created_after: 只显示该日期(含)之后创建的课程，格式YYYY-MM-DD
+    - order: 排序方式，name或id
+    """
+    filters = {}
+    courses = Course.objects.all()
+
+    teacher = params.get('teacher', '').strip()
+    if teacher:
+        filters['teacher'] = teacher
+        courses = courses.filter(teacher=teacher)
+
+    if params.get('free') == '1':
+        filters['free'] = '1'
+        courses = courses.filter(enrolled_count__lt=F('capacity'))
+
+    try:
+        created_after = parse_date(params.get('created_after', ''))
+    except ValueError:
+        created_after = None
+    if created_after:
+        filters['created_after'] = created_after.isoformat()
+        # 转换为当天零点的时间点再比较，可直接使用created_at索引
+        courses = courses.filter(
+            created_at__gte=timezone.make_aware(datetime.combine(created_after, time.min))
+        )
+
+    order = params.get('order', DEFAULT_ORDERING)
+    if order not in ORDERINGS:
+        order = DEFAULT_ORDERING
+    filters['order'] = order
+    return filters, courses
+
+
+def _catalog_page(request):
+    """
+    取出课程目录的一页
+    返回：(筛选参数, 课程列表, 下一页游标)
+    逻辑：
+    1. 目录页(课程静态字段)优先读取缓存；“只看有空余名额”的结果随选课实时变化，不缓存
+    2. 已选人数从按课程缓存的计数中批量覆盖
+    """
+    filters, courses = _catalog_filters(request.GET)
+    cursor = request.GET.get('cursor')
+
+    def load():
+        page = keyset_paginate(courses, filters['order'], cursor)
+        return page.items, page.next_cursor
+
+    if 'free' in filters:
+        items, next_cursor = load()
+    else:
+        items, next_cursor = catalog_cache.catalog_page({**filters, 'cursor': cursor}, load)
+    return filters, catalog_cache.apply_seat_counts(items), next_cursor
+
+
+def _course_list_context(filters, items, next_cursor, enrolled_courses, cards):
+    """课程列表模板的上下文(同步与异步视图共用)"""
+    next_query = urlencode({**filters, 'cursor': next_cursor}) if next_cursor else None
+    return {
+        'courses': items,
+        'enrolled_courses': enrolled_courses,
+        'cards': cards,
+        'filters': filters,
+        'first_query': urlencode(filters),
+        'next_query': next_query,
+    }
 
 
 # 课程列表视图
+@read_only_view
 @login_required  # 要求用户登录后才能访问
 def course_list(request):
     """
-    显示所有课程列表及当前用户选课状态
+    显示课程列表(游标分页)及当前用户选课状态
     功能：
-    1. 获取所有课程及每门课程的选课人数统计
-    2. 获取当前用户已选课程ID列表
-    3. 渲染课程列表模板
-    """
-    courses = Course.objects.all().annotate(enrollment_count=Count('enrollment'))
-    enrolled_courses = Enrollment.objects.filter(student=request.user).values_list('course_id', flat=True)
-    return render(request, 'courses/course_list.html', {
-        'courses': courses,
-        'enrolled_courses': enrolled_courses,
+    1. 按筛选条件和排序方式取出一页课程(目录页与已选人数均走缓存)
+    2. 从缓存读取当前用户已选课程ID集合
+    3. 整页课程一次检查先修要求(先修图来自缓存，已完成课程最多查询一次)
+    4. 课程卡片的静态部分从片段缓存读取，只填入已选人数与选课状态
+    5. 渲染课程列表模板(热度图表由页面单独请求course_heat接口加载)
+    """
+    filters, items, next_cursor = _catalog_page(request)
+    enrolled_courses = catalog_cache.enrolled_course_ids(request.user)
+    locked = missing_prerequisites(request.user, [course.id for course in items])
+    cards = course_cards(items, enrolled_courses, locked.keys())
+    return render(
+        request,
+        'courses/course_list.html',
+        _course_list_context(filters, items, next_cursor, enrolled_courses, cards),
+    )
+
+
+def _catalog_version(request, *args, **kwargs):
+    """
+    每个请求只读取一次目录版本(ETag与Last-Modified共用)
+    返回：(目录版本, 选课数据版本, 最后修改时间)
+    """
+    if not hasattr(request, '_catalog_version'):
+        version, data = CatalogVersion.versions()
+        request._catalog_version = (version.version, data.version, max(version.updated_at, data.updated_at))
+    return request._catalog_version
+
+
+def _catalog_etag(request, *args, **kwargs):
+    """
+    目录接口的ETag
+    包含目录版本、选课数据版本、当前用户(已选标记因人而异)与查询参数
+    """
+    version, data_version, _ = _catalog_version(request)
+    return f"{version}.{data_version}-{request.user.pk}-{request.GET.urlencode()}"
+
+
+def _catalog_last_modified(request, *args, **kwargs):
+    return _catalog_version(request)[2]
+
+
+# 课程目录JSON接口
+@read_only_view
+@login_required
+@condition(etag_func=_catalog_etag, last_modified_func=_catalog_last_modified)
+def course_api(request):
+    """
+    只读的课程目录JSON接口(供前端与自助终端轮询)
+    参数(GET)：与课程列表页相同的筛选、排序与游标参数
+    功能：
+    1. 目录版本与选课数据版本都未变化时由condition装饰器直接返回304，不查询课程表
+    2. 否则返回一页课程、剩余名额、当前用户是否已选、是否满足先修要求以及下一页游标
+    """
+    _, items, next_cursor = _catalog_page(request)
+    enrolled_courses = catalog_cache.enrolled_course_ids(request.user)
+    locked = missing_prerequisites(request.user, [course.id for course in items])
+    version, data_version, _ = _catalog_version(request)
+    response = JsonResponse({
+        'version': version,
+        'data_version': data_version,
+        'results': [
+            {
+                'id': course.id,
+                'name': course.name,
+                'teacher': course.teacher,
+                'capacity': course.capacity,
+                'enrolled_count': course.enrolled_count,
+                'available_seats': course.available_seats(),
+                'enrolled': course.id in enrolled_courses,
+                'eligible': course.id not in locked,
+            }
+            for course in items
+        ],
+        'next_cursor': next_cursor,
+    }, json_dumps_params={'ensure_ascii': False})
+    # 客户端可以缓存，但每次使用前必须携带ETag重新验证
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _heat_etag(request, *args, **kwargs):
+    """热度接口的ETag：目录版本、选课数据版本与查询参数(与用户无关)"""
+    version, data_version, _ = _catalog_version(request)
+    return f"heat-{version}.{data_version}-{request.GET.urlencode()}"
+
+
+# 选课热度图表接口
+@read_only_view
+@login_required
+@condition(etag_func=_heat_etag, last_modified_func=_catalog_last_modified)
+def course_heat(request):
+    """
+    选课热度图表数据(读取预计算的CourseHeat快照)
+    参数(GET)：
+    - limit: 课程数，默认CHART_TOP_N，最多CHART_MAX_N
+    - order: enrolled(按已选人数)或fill(按选课比例)
+    返回：labels、enrollments、capacities、fill_ratios四个等长数组
+    """
+    order = request.GET.get('order', 'enrolled')
+    if order not in HEAT_ORDERINGS:
+        order = 'enrolled'
+    try:
+        limit = min(max(int(request.GET.get('limit', CHART_TOP_N)), 1), CHART_MAX_N)
+    except ValueError:
+        limit = CHART_TOP_N
+    rows = top_courses(limit, order)
+    response = JsonResponse({
+        'course_ids': [row[0] for row in rows],
+        'labels': [row[1] for row in rows],
+        'enrollments': [row[2] for row in rows],
+        'capacities': [row[3] for row in rows],
+        'fill_ratios': [round(row[4], 4) for row in rows],
+    }, json_dumps_params={'ensure_ascii': False})
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# 剩余名额实时推送视图
+@login_required
+async def seat_events(request):
+    """
+    以Server-Sent Events推送课程已选人数变化
+    参数(GET)：
+    - courses: 逗号分隔的课程ID，最多live.MAX_SUBSCRIBED_COURSES个
+    逻辑：
+    1. 先推送订阅课程的当前名额，之后只推送发生变化的课程
+    2. 非ASGI部署(如WSGI)无法保持长连接，只返回当前快照，浏览器按retry间隔重连
+    """
+    try:
+        course_ids = {int(value) for value in request.GET.get('courses', '').split(',') if value}
+    except ValueError:
+        return HttpResponseBadRequest("courses参数格式错误")
+    if not course_ids or len(course_ids) > live.MAX_SUBSCRIBED_COURSES:
+        return HttpResponseBadRequest("courses参数数量不合法")
+
+    snapshot = await live.fetch_seats(course_ids)
+    if isinstance(request, ASGIRequest):
+        subscriber = live.hub.subscribe(course_ids, snapshot)
+        body = live.stream(subscriber, snapshot)
+    else:
+        body = [f"retry: {int(live.LIVE_INTERVAL * 3000)}\n\n"] + [
+            live.format_event(payload) for payload in snapshot.values()
+        ]
+    response = StreamingHttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # 关闭反向代理(nginx)的响应缓冲，事件立即到达浏览器
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# 缓存统计视图
+@staff_member_required
+def cache_stats_view(request):
+    """
+    查看本工作进程的缓存命中统计(仅管理员)
+    返回：各命名空间(目录页、已选人数、已选集合)的命中数、未命中数与命中率
+    """
+    return JsonResponse(catalog_cache.cache_stats.snapshot())
+
+
+# Prometheus指标视图
+def _metrics_allowed(request):
+    """携带正确的Bearer令牌、已登录的管理员，或显式开启了COURSES_METRICS_PUBLIC"""
+    if getattr(settings, 'COURSES_METRICS_PUBLIC', False):
+        return True
+    token = getattr(settings, 'COURSES_METRICS_TOKEN', '')
+    if token and request.headers.get('Authorization', '') == f'Bearer {token}':
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def metrics_view(request):
+    """
+    以Prometheus文本格式输出本进程的请求与选课指标
+    默认不公开：抓取端携带 Authorization: Bearer <COURSES_METRICS_TOKEN>，或由管理员登录访问；
+    其他请求返回401
+    """
+    if not _metrics_allowed(request):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# 请求性能分析结果视图
+@staff_member_required
+def profile_list(request):
+    """列出最近的请求性能分析结果(仅管理员)，附带pstats与文本报告的下载地址"""
+    return JsonResponse({
+        'profiles': [
+            {
+                'id': profile_id,
+                'pstats': reverse('profile_download', args=[profile_id, 'pstats']),
+                'report': reverse('profile_download', args=[profile_id, 'report']),
+            }
+            for profile_id in profiling.recent_profiles()
+        ],
     })
 
 
+@staff_member_required
+def profile_download(request, profile_id, kind):
+    """
+    下载一次请求性能分析的结果(仅管理员)
+    参数：
+    - profile_id: 分析ID(响应头X-Profile-Id)
+    - kind: pstats(cProfile数据)或report(文本报告，含SQL执行计划)
+    """
+    path = profiling.profile_path(profile_id, kind)
+    if path is None or not os.path.exists(path):
+        raise Http404("分析结果不存在")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path))
+
+
+# 选课记录导出视图
+@staff_member_required
+def export_enrollments(request, course_id=None):
+    """
+    流式导出选课记录(仅管理员)
+    参数：
+    - course_id: 课程ID，提供时只导出该课程的名单
+    - format(GET): csv(默认)或jsonl
+    返回：StreamingHttpResponse，边从数据库分批读取边发送，内存占用与行数无关
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('不支持的导出格式')
+    if course_id is not None and not Course.objects.filter(pk=course_id).exists():
+        raise Http404("课程不存在")
+
+    response = StreamingHttpResponse(export_lines(fmt, course_id), content_type=CONTENT_TYPES[fmt])
+    filename = f'roster-{course_id}' if course_id is not None else 'enrollments'
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# 课程检索结果条数上限
+SEARCH_MAX_RESULTS = 50
+
+
+# 课程检索视图
+@read_only_view
+@login_required
+def course_search(request):
+    """
+    按课程名称、授课教师、课程描述全文检索课程
+    参数(GET)：
+    - q: 检索词，支持中文子串与英文前缀
+    - limit: 返回条数，默认20，最多SEARCH_MAX_RESULTS
+    返回：按相关度排序的JSON结果
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), SEARCH_MAX_RESULTS)
+    except ValueError:
+        limit = 20
+    results = search_courses(query, limit) if query else []
+    return JsonResponse({
+        'query': query,
+        'results': [
+            {
+                'id': course.id,
+                'name': course.name,
+                'teacher': course.teacher,
+                'capacity': course.capacity,
+                'enrolled_count': course.enrolled_count,
+            }
+            for course in results
+        ],
+    }, json_dumps_params={'ensure_ascii': False})
+
+
 # 选课视图
 @login_required
+@rate_limited
 def enroll_course(request, course_id):
     """
     处理选课请求
     参数：
     - course_id: 要选的课程ID
     逻辑：
-    1. 检查课程是否存在(404处理)
-    2. 创建选课记录(如不存在)
-    3. 重定向到"我的课程"页面
+    1. 通过选课服务以条件写入占座(容量受控、并发安全)
+    2. 课程不存在返回404
+    3. 课程已满时自动加入候补队列，有名额释放后按顺序递补
+    4. 与已选课程上课时间冲突、未修完先修课程时不选课并提示
+    5. 重定向到"我的课程"页面
     """
-    course = get_object_or_404(Course, id=course_id)
-    Enrollment.objects.get_or_create(student=request.user, course=course)
+    status = enroll_student(request.user, course_id)
+    if status is EnrollStatus.PREREQUISITES:
+        missing = missing_prerequisites(request.user, [course_id]).get(course_id, ())
+        names = Course.objects.filter(pk__in=missing).order_by('name').values_list('name', flat=True)
+        messages.error(request, f"请先修完先修课程：{'、'.join(names)}")
+    if status is EnrollStatus.CONFLICT:
+        messages.error(request, "该课程与已选课程上课时间冲突")
+    if status is EnrollStatus.FULL:
+        status, entry = join_waitlist(request.user, course_id)
+        if status is EnrollStatus.WAITLISTED:
+            messages.info(request, f"课程已满，已加入候补队列，当前排第 {entry.rank()} 位")
+    if status is EnrollStatus.NOT_FOUND:
+        raise Http404("课程不存在")
+    if status is EnrollStatus.ENROLLED:
+        messages.success(request, "选课成功")
     return redirect('my_courses')
 
 
+def _cart_ids(request, field):
+    """
+    读取购物车中的课程ID列表
+    支持JSON请求体({"add": [...], "drop": [...]})与表单字段(add=1&add=2)
+    """
+    if request.content_type == 'application/json':
+        if not hasattr(request, '_cart_json'):
+            try:
+                request._cart_json = json.loads(request.body or b'{}')
+            except ValueError:
+                raise CartError("请求体不是合法的JSON")
+            if not isinstance(request._cart_json, dict):
+                raise CartError("请求体应为JSON对象")
+        values = request._cart_json.get(field) or []
+        if not isinstance(values, list):
+            raise CartError(f"{field}应为课程ID数组")
+    else:
+        values = request.POST.getlist(field)
+    try:
+        return [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise CartError(f"{field}中包含无效的课程ID")
+
+
+# 选课购物车接口
+@login_required
+@require_POST
+@rate_limited
+def cart(request):
+    """
+    一次请求选多门课、退多门课(全部生效或全部不生效)
+    参数(POST)：add、drop为课程ID列表
+    返回：JSON {applied, results: [{action, course_id, status}]}
+    - 200: 全部生效
+    - 409: 有课程不存在或已满，未做任何修改
+    - 400: 参数不合法
+    - 429: 请求过于频繁(见ratelimit.py)
+    """
+    try:
+        result = apply_cart(request.user, _cart_ids(request, 'add'), _cart_ids(request, 'drop'))
+    except CartError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(result.as_dict(), status=200 if result.applied else 409)
+
+
+def _my_courses_querysets(user):
+    """我的课程页的两个查询：选课记录与候补记录(均连接课程表，候补记录附带名次)"""
+    enrollments = Enrollment.objects.filter(student=user).select_related('course')
+    waitlist = WaitlistEntry.objects.filter(student=user).select_related('course').with_rank()
+    return enrollments, waitlist
+
+
 # 我的课程视图
+@read_only_view
 @login_required
 def my_courses(request):
     """
     显示当前用户已选课程列表
     返回：
-    - 渲染包含用户选课记录的模板
+    - 渲染包含用户选课记录与候补记录的模板
     """
-    enrollments = Enrollment.objects.filter(student=request.user)
-    return render(request, 'courses/my_courses.html', {'enrollments': enrollments})
+    enrollments, waitlist = _my_courses_querysets(request.user)
+    return render(request, 'courses/my_courses.html', {
+        'enrollments': enrollments,
+        'waitlist': waitlist,
+    })
 
 
 # 退课视图
 @login_required
+@rate_limited
 def drop_course(request, course_id):
     """
     处理退课请求
     参数：
     - course_id: 要退的课程ID
     逻辑：
-    1. 删除当前用户对该课程的选课记录
+    1. 通过选课服务删除当前用户对该课程的选课记录
     2. 重定向到"我的课程"页面
     """
-    Enrollment.objects.filter(student=request.user, course_id=course_id).delete()
+    drop_student(request.user, course_id)
+    return redirect('my_courses')
+
+
+# 退出候补视图
+@login_required
+def leave_waitlist_view(request, course_id):
+    """
+    退出课程候补队列
+    参数：
+    - course_id: 课程ID
+    """
+    leave_waitlist(request.user, course_id)
     return redirect('my_courses')
 
 
@@ -128,6 +581,7 @@ def logout_view(request):
 
 
 # 首页视图
+@read_only_view
 @login_required
 def index(request):
     """